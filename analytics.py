@@ -0,0 +1,183 @@
+# analytics.py
+import threading
+
+import numpy as np
+
+from sheets_writer import RESULT_COLUMNS
+
+ANNOTATOR_COL = RESULT_COLUMNS.index('annotator')
+DATASET_COL = RESULT_COLUMNS.index('dataset')
+FILENAME_COL = RESULT_COLUMNS.index('filename')
+TEXT_COL = RESULT_COLUMNS.index('text')
+INDICES_COL = RESULT_COLUMNS.index('emphasized_indices')
+
+
+def decode_indices(value, length):
+    """emphasized_indices（"0, 3, 4" 形式）を長さlengthのbool配列に変換"""
+    labels = np.zeros(length, dtype=bool)
+    value = str(value).strip() if value is not None else ''
+    if value:
+        indices = np.array([int(part) for part in value.split(',') if part.strip().lstrip('-').isdigit()], dtype=np.int64)
+        indices = indices[(indices >= 0) & (indices < length)]
+        labels[indices] = True
+    return labels
+
+
+def _kappa(observed, expected):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(expected < 1, (observed - expected) / (1 - expected), np.nan)
+
+
+def _rows_hash(rows):
+    # 取り込んだ行が変わっていないかの確認用（文字列のハッシュはキャッシュされるので速い）
+    return hash(tuple(tuple(row) for row in rows))
+
+
+class EmphasisStats:
+    """'全結果'の行から強調の一致度・傾向を計算する（新しく増えた行だけを取り込む）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (データセット, ファイル名) → (テキスト, {アノテーター: 文字ごとのbool配列})
+        self._items = {}
+        self._rows_seen = 0
+        self._seen_hash = _rows_hash(())
+        self._revision = 0
+        self._cache = None
+
+    def ingest(self, rows, revision=0):
+        """前回から増えた行を取り込む（同じアノテーター・同じ音声は新しい行で上書き）
+
+        前回取り込んだ行が先頭にそのまま並んでいないとき（行の書き換え・並び替え）や
+        revision が前回と違うときは、全ての行を取り込み直す。
+        """
+        with self._lock:
+            if (
+                revision != self._revision
+                or len(rows) < self._rows_seen
+                or _rows_hash(rows[:self._rows_seen]) != self._seen_hash
+            ):
+                self._items = {}
+                self._rows_seen = 0
+                self._revision = revision
+                self._cache = None
+            new_rows = rows[self._rows_seen:]
+            for row in new_rows:
+                if len(row) <= INDICES_COL:
+                    continue
+                filename, text = row[FILENAME_COL], str(row[TEXT_COL] or '')
+                if not filename or not text:
+                    continue
+                item_text, labels = self._items.setdefault((str(row[DATASET_COL]), str(filename)), (text, {}))
+                labels[str(row[ANNOTATOR_COL]).strip()] = decode_indices(row[INDICES_COL], len(item_text))
+            self._rows_seen = len(rows)
+            self._seen_hash = _rows_hash(rows)
+            if new_rows:
+                self._cache = None
+            return len(new_rows)
+
+    def summary(self):
+        """全体の統計を計算する（行が増えるまで結果を使い回す）"""
+        with self._lock:
+            if self._cache is None:
+                self._cache = self._compute()
+            return self._cache
+
+    def item_detail(self, key):
+        """1つの音声（(データセット, ファイル名)）について、アノテーター×文字の行列と文字ごとの強調確率を返す"""
+        with self._lock:
+            text, labels = self._items[key]
+            annotators = sorted(labels)
+            matrix = np.array([labels[name] for name in annotators], dtype=bool).reshape(len(annotators), len(text))
+        probability = matrix.mean(axis=0) if len(annotators) else np.zeros(len(text))
+        return {
+            'text': text,
+            'annotators': annotators,
+            'matrix': matrix,
+            'probability': probability,
+            'fleiss_kappa': self._fleiss(matrix.sum(axis=0), np.full(len(text), len(annotators))),
+        }
+
+    def item_keys(self):
+        """結果のある音声の (データセット, ファイル名) の一覧"""
+        with self._lock:
+            return sorted(self._items)
+
+    @staticmethod
+    def _fleiss(positive, raters):
+        """2カテゴリ（強調あり・なし）のFleiss' kappa（評価者数が文字ごとに違ってもよい）"""
+        mask = raters >= 2
+        if not mask.any():
+            return float('nan')
+        positive, raters = positive[mask].astype(np.float64), raters[mask].astype(np.float64)
+        negative = raters - positive
+        agreement = (positive ** 2 + negative ** 2 - raters) / (raters * (raters - 1))
+        p_positive = positive.sum() / raters.sum()
+        expected = p_positive ** 2 + (1 - p_positive) ** 2
+        return float(_kappa(agreement.mean(), expected))
+
+    def _compute(self):
+        # ロックを取った状態で呼ぶこと
+        annotators = sorted({name for _, labels in self._items.values() for name in labels})
+        column = {name: i for i, name in enumerate(annotators)}
+        total_chars = sum(len(text) for text, _ in self._items.values())
+
+        # アノテーター×全文字の行列（-1 は未評価、0 は強調なし、1 は強調あり）
+        labels_matrix = np.full((len(annotators), total_chars), -1, dtype=np.int8)
+        item_counts = []
+        offset = 0
+        for text, labels in self._items.values():
+            for name, values in labels.items():
+                labels_matrix[column[name], offset:offset + len(text)] = values
+            item_counts.append(len(labels))
+            offset += len(text)
+
+        rated = (labels_matrix >= 0).astype(np.float64)
+        positive = (labels_matrix == 1).astype(np.float64)
+        negative = (labels_matrix == 0).astype(np.float64)
+
+        # 文字ごとの評価者数・強調ありの人数からFleiss' kappa
+        raters = rated.sum(axis=0)
+        positives = positive.sum(axis=0)
+        fleiss = self._fleiss(positives, raters)
+
+        # 全ペアのCohen's kappaを行列演算でまとめて計算
+        shared = rated @ rated.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            observed = (positive @ positive.T + negative @ negative.T) / shared
+            rate_a = (positive @ rated.T) / shared
+            rate_b = (rated @ positive.T) / shared
+        expected = rate_a * rate_b + (1 - rate_a) * (1 - rate_b)
+        cohen = _kappa(observed, expected)
+        cohen[shared == 0] = np.nan
+        np.fill_diagonal(cohen, np.nan)
+
+        # アノテーターごとの強調率と、同じ文字についての他のアノテーターの強調率との差
+        own_count = rated.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            own_rate = positive.sum(axis=1) / own_count
+            others_rated = raters[None, :] - rated
+            others_rate = np.where(others_rated > 0, (positives[None, :] - positive) / others_rated, np.nan)
+            others_mean = np.nansum(np.where(rated > 0, others_rate, np.nan), axis=1) / np.sum(
+                (rated > 0) & ~np.isnan(others_rate), axis=1
+            )
+
+        return {
+            'rows': self._rows_seen,
+            'items': len(self._items),
+            'annotators': annotators,
+            'labels_per_item': float(np.mean(item_counts)) if item_counts else 0.0,
+            'emphasis_rate': float(positives.sum() / raters.sum()) if raters.sum() else float('nan'),
+            'fleiss_kappa': fleiss,
+            'cohen_kappa': cohen,
+            'annotator_rows': [
+                {
+                    'annotator': name,
+                    'characters': int(own_count[i]),
+                    'emphasis_rate': float(own_rate[i]),
+                    'others_rate': float(others_mean[i]),
+                    'bias': float(own_rate[i] - others_mean[i]),
+                }
+                for i, name in enumerate(annotators)
+            ],
+        }
@@ -1,13 +1,44 @@
 # app.py
+import time
+
+# 起動時間の確認用（プロセスで最初の実行ではここからのimportが実際に読み込まれる）
+IMPORT_STARTED = time.perf_counter()
+
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-import requests
-from io import BytesIO
-import re
+import importlib
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from audio_cache import AudioCache
+from drive_client import DRIVE_DOWNLOAD_URL, DriveClient, DriveDownloadError, extract_drive_file_id
+from sheets_writer import AnnotationJournal, SheetsWriter, annotation_to_row, open_results_worksheet
+from completion_index import CompletionIndex, IndexSlot
+from char_selector import char_selector
+from audio_settings import audio_mime, make_settings
+from audio_server import AudioServer
+from asset_pack import AssetPack, AssetPackError
+from datasets import SHEET_URLS, SHEETS_EXPORT_URL
+from manifest_store import Manifest, ManifestStore
+from export import EXPORT_FORMATS, ExportCache, available_formats
+from sheets_writer import RESULT_COLUMNS
+import html
+from instrumentation import Metrics
+from tokenizer import GRANULARITIES, GRANULARITY_LABELS, tokenize
+from results_store import ResultsFile, ResultsTable, emphasis_fields, parse_indices
+from scheduler import CoverageScheduler
+
+# numpyを使うモジュール（audio_processing・prosody・feature_store・analytics）は
+# 最初に使うときに lazy_import で読み込む
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 st.set_page_config(page_title="JVS強調アノテーション", layout="wide")
 
+# この実行の開始時刻（計測用）
+RUN_STARTED = time.perf_counter()
+
 # CSSで全体を圧縮
 st.markdown("""
 <style>
@@ -22,132 +53,718 @@ st.markdown("""
 # 結果保存用SheetsのURL
 RESULT_SHEET_URL = "https://docs.google.com/spreadsheets/d/1BdWSIIoLxYF4N7bUSsDfTJ5zYChLYVV4RSmf0RyL-no/edit?gid=0#gid=0"
 
-# Google Drive URLを直接ダウンロードURLに変換
-def convert_drive_url(url):
-    """Google DriveのURLを直接ダウンロード可能なURLに変換"""
-    patterns = [
-        r'drive\.google\.com/file/d/([a-zA-Z0-9_-]+)',
-        r'drive\.google\.com/open\?id=([a-zA-Z0-9_-]+)',
-        r'id=([a-zA-Z0-9_-]+)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            file_id = match.group(1)
-            return f"https://drive.google.com/uc?export=download&id={file_id}"
-    
-    return url
+# 設定値の取得
+def get_setting(key, default):
+    """設定値をStreamlit Secrets → 環境変数（JVS_<KEY>）→ 既定値の順に取得"""
+    try:
+        if key in st.secrets:
+            return st.secrets[key]
+    except Exception:
+        pass
+    return os.environ.get(f"JVS_{key.upper()}", default)
+
+# 先読みする音声の件数とスレッド数
+PREFETCH_COUNT = int(get_setting("prefetch_count", 3))
+PREFETCH_WORKERS = int(get_setting("prefetch_workers", 4))
+
+# 音声キャッシュのメモリ上限（バイト）と保存先ディレクトリ
+AUDIO_CACHE_MAX_BYTES = int(get_setting("audio_cache_max_bytes", 64 * 1024 * 1024))
+AUDIO_CACHE_DIR = get_setting("audio_cache_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".audio_cache"))
+
+# ブラウザに送る音声の加工設定（形式 raw / wav / flac / ogg、サンプリング周波数 0 は元のまま）
+AUDIO_SETTINGS = make_settings(
+    fmt=get_setting("audio_format", "raw"),
+    sample_rate=get_setting("audio_sample_rate", 0),
+    trim_silence=str(get_setting("audio_trim_silence", "false")).lower() in ("1", "true", "yes"),
+    trim_db=get_setting("audio_trim_db", -40.0),
+)
+
+# 音声を配信するHTTPサーバーのポート（0ならst.audioにバイト列を渡す）と、ブラウザから見たサーバーのURL
+AUDIO_SERVER_PORT = int(get_setting("audio_server_port", 0))
+AUDIO_SERVER_URL = get_setting("audio_server_url", f"http://localhost:{AUDIO_SERVER_PORT}")
+# 配信サーバーが待ち受けるアドレス（別のマシンのブラウザから使うなら 0.0.0.0）と、
+# スクリプトからの読み込みを許すオリジン（空なら許可ヘッダーを付けない）、メモリに持っておく音声のバイト数
+AUDIO_SERVER_HOST = get_setting("audio_server_host", "127.0.0.1")
+AUDIO_SERVER_ALLOW_ORIGIN = get_setting("audio_server_allow_origin", "")
+AUDIO_SERVER_MAX_BYTES = int(get_setting("audio_server_max_bytes", 32 * 1024 * 1024))
+
+# 音声プレーヤーの下に波形・エネルギー・F0の図を出すか
+PROSODY_PLOT = str(get_setting("prosody_plot", "true")).lower() in ("1", "true", "yes")
+
+# 全データセットのマニフェストと音声をまとめたパックファイル（build_asset_pack.pyで作成）
+ASSET_PACK_PATH = get_setting("asset_pack_path", os.path.join(os.path.dirname(os.path.abspath(__file__)), "asset_pack.jvspack"))
+
+# 管理者ページ（URLに ?page=admin をつけて開く）のパスワード（空なら管理者ページは開けない）
+ADMIN_PASSWORD = str(get_setting("admin_password", ""))
+
+# エクスポートファイルの保存先
+EXPORT_CACHE_DIR = get_setting("export_cache_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".export_cache"))
+
+# 処理時間の計測（無効にすると計測処理はほぼ何もしない）、構造化ログ、Prometheus用ポート（0なら起動しない）
+METRICS_ENABLED = str(get_setting("metrics_enabled", "true")).lower() in ("1", "true", "yes")
+METRICS_LOG = str(get_setting("metrics_log", "false")).lower() in ("1", "true", "yes")
+METRICS_PORT = int(get_setting("metrics_port", 0))
+# /metrics を待ち受けるアドレス（認証がないので、別のマシンから集めるときだけ 0.0.0.0 などにする）
+METRICS_HOST = get_setting("metrics_host", "127.0.0.1")
+
+# extract_features.py で作る特徴量ストアと、そこから強調の候補を出すか（初期値、サイドバーで切り替えられる）
+FEATURE_STORE_DIR = get_setting("feature_store_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "features"))
+EMPHASIS_SUGGESTIONS = str(get_setting("emphasis_suggestions", "false")).lower() in ("1", "true", "yes")
+
+# 文字選択の初期の単位（char・script・mora。説明ページは1文字ずつの選択で書いているので、既定は char）
+TOKEN_GRANULARITY = get_setting("token_granularity", "char")
+if TOKEN_GRANULARITY not in GRANULARITIES:
+    TOKEN_GRANULARITY = "char"
+
+# おまかせ割り当て：1音声あたりの目標ラベル数・1回に受け取る件数・受け取った音声を確保しておく時間（分）
+SCHEDULE_TARGET = int(get_setting("schedule_target", 3))
+SCHEDULE_BATCH_SIZE = int(get_setting("schedule_batch_size", 20))
+SCHEDULE_LEASE_MINUTES = float(get_setting("schedule_lease_minutes", 60))
+
+# おまかせ割り当てで作業しているときのデータセット欄の表示
+SCHEDULED_SHEET = "おまかせ"
+
+# マニフェストを再確認する間隔（秒）
+MANIFEST_TTL = int(get_setting("manifest_ttl", 600))
+
+# Google Driveダウンロードの接続数・タイムアウト（秒）・再試行回数
+DRIVE_POOL_SIZE = int(get_setting("drive_pool_size", 10))
+DRIVE_TIMEOUT = float(get_setting("drive_timeout", 30))
+DRIVE_RETRIES = int(get_setting("drive_retries", 3))
+
+# ダウンロード・CSVエクスポートのURL（{file_id}・{sheet_id}・{gid} を置き換える）
+DRIVE_URL_TEMPLATE = get_setting("drive_download_url", DRIVE_DOWNLOAD_URL)
+SHEETS_EXPORT_URL_TEMPLATE = get_setting("sheets_export_url", SHEETS_EXPORT_URL)
+
+# Google Sheetsへ送信する前にアノテーションを書き込むローカルジャーナル
+JOURNAL_PATH = get_setting("journal_path", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".journal", "annotations.sqlite3"))
+
+# 保存した行を列ごとの形式で追記するローカルの結果ファイル
+RESULTS_PATH = get_setting("results_path", os.path.join(os.path.dirname(JOURNAL_PATH), "results.jvsres"))
+
+# Google Sheetsへのまとめ送信の件数・間隔（秒）と1分あたりの書き込み回数の上限
+SHEETS_BATCH_SIZE = int(get_setting("sheets_batch_size", 50))
+SHEETS_FLUSH_INTERVAL = float(get_setting("sheets_flush_interval", 2.0))
+SHEETS_WRITES_PER_MINUTE = int(get_setting("sheets_writes_per_minute", 50))
+# 起動時に'全結果'シートを読めなかったとき、索引を作り直すまでの秒数
+COMPLETION_INDEX_RETRY_SECONDS = float(get_setting("completion_index_retry_seconds", 30))
 
-# Google Sheetsから直接読み込み
-@st.cache_data(ttl=600)
-def load_data_from_sheets(sheet_url):
-    """Google SheetsのURLからデータを読み込む"""
+# 処理時間の計測（全セッションで共有）
+@st.cache_resource
+def get_metrics():
+    """処理段階ごとの所要時間を集計するオブジェクトを取得"""
+    metrics = Metrics(enabled=METRICS_ENABLED, log=METRICS_LOG)
+    if METRICS_ENABLED and METRICS_PORT:
+        try:
+            metrics.serve(METRICS_PORT, host=METRICS_HOST)
+        except OSError as e:
+            st.warning(f"メトリクス用のポートを開けませんでした: {e}")
+    return metrics
+
+# 起動時間（プロセスで1回だけ記録）
+@st.cache_resource
+def get_startup_info():
+    """最初の実行のimport時間・最初の実行の所要時間・後から読み込んだモジュールの時間"""
+    return {'imports': IMPORT_SECONDS, 'first_run': None, 'lazy_imports': {}}
+
+def lazy_import(name):
+    """重いモジュールを最初に使うときに読み込む（2回目以降は読み込み済みのものを返す）"""
+    module = sys.modules.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        seconds = time.perf_counter() - started
+        get_startup_info()['lazy_imports'][name] = seconds
+        get_metrics().record(f"import:{name}", seconds)
+    return module
+
+def span_tags():
+    """計測に付けるセッション・データセット・アイテム番号"""
+    return {
+        'session': st.session_state.get('session_tag'),
+        'dataset': st.session_state.get('current_sheet'),
+        'idx': st.session_state.get('current_idx'),
+    }
+
+# パックファイル（全セッションで共有）
+@st.cache_resource
+def get_asset_pack():
+    """パックファイルをメモリマップで開く（なければNone）"""
+    if not os.path.exists(ASSET_PACK_PATH):
+        return None
     try:
-        if 'docs.google.com/spreadsheets' in sheet_url:
-            sheet_id = sheet_url.split('/d/')[1].split('/')[0]
-            gid = '0'
-            if 'gid=' in sheet_url:
-                gid = sheet_url.split('gid=')[1].split('&')[0]
-            
-            csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
-            df = pd.read_csv(csv_url)
-            return df.to_dict('records')
-        else:
-            st.error("正しいGoogle SheetsのURLを入力してください")
-            return []
+        return AssetPack(ASSET_PACK_PATH)
+    except (OSError, AssetPackError, ValueError) as e:
+        st.warning(f"パックファイルを読み込めませんでした: {e}")
+        return None
+
+# 全データセットのマニフェスト（全セッションで共有し、各セッションは参照だけを持つ）
+@st.cache_resource
+def get_manifest_store():
+    """全データセットのマニフェストを並列に読み込み始める"""
+    return ManifestStore(
+        SHEET_URLS,
+        pack=get_asset_pack(),
+        ttl=MANIFEST_TTL,
+        export_url=SHEETS_EXPORT_URL_TEMPLATE,
+        granularities=GRANULARITIES,
+    ).preload()
+
+def load_dataset(name):
+    """データセットのマニフェストを取得"""
+    try:
+        with get_metrics().span('load_dataset', dataset=name):
+            return get_manifest_store().get(name)
     except Exception as e:
         st.error(f"データ読み込みエラー: {e}")
         st.info("Sheetsが「リンクを知っている全員」に公開されているか確認してください")
-        return []
+        return None
+
+# 音声キャッシュ（全セッションで共有）
+@st.cache_resource
+def get_audio_cache():
+    """メモリ上限つきの音声キャッシュを取得"""
+    return AudioCache(AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_DIR)
 
 # 音声データをGoogle Driveから取得
-@st.cache_data
 def load_audio_from_drive(drive_url):
-    """Google Driveから音声ファイルを取得"""
+    """Google Driveから音声ファイルを取得（パックファイルやキャッシュにあればそちらを使う）"""
+    cache_key = extract_drive_file_id(drive_url)
+    pack = get_asset_pack()
+    if pack is not None and cache_key:
+        view = pack.audio(cache_key)
+        if view is not None:
+            # st.audioはbytesしか受け付けないので、ここで1回だけコピーする
+            return bytes(view)
+    
+    cache = get_audio_cache()
+    if cache_key:
+        audio_bytes = cache.get(cache_key)
+        if audio_bytes is not None:
+            return audio_bytes
+    
+    audio_bytes = download_audio(drive_url)
+    if audio_bytes and cache_key:
+        cache.put(cache_key, audio_bytes)
+    return audio_bytes
+
+# 加工済み音声のキャッシュ（ファイルIDと加工設定ごと）
+@st.cache_resource
+def get_processed_audio_cache():
+    """加工済み音声のキャッシュを取得"""
+    return AudioCache(AUDIO_CACHE_MAX_BYTES // 2, os.path.join(AUDIO_CACHE_DIR, "processed"))
+
+def load_playback_audio(drive_url):
+    """ブラウザに送る音声を取得（加工が有効なら加工済みのものを返す）"""
+    if not AUDIO_SETTINGS.enabled:
+        return load_audio_from_drive(drive_url)
+    
+    cache = get_processed_audio_cache()
+    file_id = extract_drive_file_id(drive_url)
+    cache_key = f"{file_id}-{AUDIO_SETTINGS.cache_key()}" if file_id else None
+    if cache_key:
+        audio_bytes = cache.get(cache_key)
+        if audio_bytes is not None:
+            return audio_bytes
+    
+    raw_bytes = load_audio_from_drive(drive_url)
+    if not raw_bytes:
+        return raw_bytes
     try:
-        download_url = convert_drive_url(drive_url)
-        session = requests.Session()
-        response = session.get(download_url, stream=True)
-        
-        if 'download_warning' in response.text or 'virus scan warning' in response.text:
-            for key, value in response.cookies.items():
-                if key.startswith('download_warning'):
-                    params = {'confirm': value}
-                    response = session.get(download_url, params=params, stream=True)
-                    break
-        
-        if response.status_code == 200:
-            return response.content
-        else:
-            return None
-            
-    except Exception as e:
+        audio_bytes = lazy_import('audio_processing').process_audio(raw_bytes, AUDIO_SETTINGS)
+    except Exception:
+        # 加工できない音声は元のWAVのまま送る（形式が変わるのでキャッシュしない）
+        return raw_bytes
+    if cache_key:
+        cache.put(cache_key, audio_bytes)
+    return audio_bytes
+
+# 音声の波形・エネルギー・F0の図（ファイルIDごとに全セッションで共有）
+@st.cache_data(max_entries=5000, show_spinner=False)
+def get_prosody_html(file_key, _drive_url):
+    """再生する音声と時間軸をそろえた図のHTMLを作る（取得・計算に失敗したらキャッシュせず例外を出す）"""
+    raw_bytes = load_audio_from_drive(_drive_url)
+    if not raw_bytes:
+        raise RuntimeError("音声を取得できませんでした")
+    prosody = lazy_import('prosody')
+    with get_metrics().span('prosody'):
+        features = prosody.analyze(
+            raw_bytes,
+            trim=AUDIO_SETTINGS.enabled and AUDIO_SETTINGS.trim_silence,
+            trim_db=AUDIO_SETTINGS.trim_db,
+        )
+        return prosody.prosody_svg(features)
+
+def render_prosody(drive_url):
+    """音声プレーヤーの下に図と凡例を表示"""
+    try:
+        prosody_html = get_prosody_html(extract_drive_file_id(drive_url) or drive_url, drive_url)
+    except Exception:
+        return
+    st.markdown(prosody_html, unsafe_allow_html=True)
+    st.caption("灰: 波形 ／ 橙: 音の大きさ ／ 青: 声の高さ（F0）")
+
+# 特徴量ストア（全セッションで共有、なければNone）
+@st.cache_resource
+def get_feature_store():
+    """extract_features.py で作った特徴量ストアを開く"""
+    if not os.path.isdir(FEATURE_STORE_DIR):
+        return None
+    return lazy_import('feature_store').FeatureStore(FEATURE_STORE_DIR)
+
+def emphasis_suggestions(audio_url, text):
+    """特徴量ストアから強調の候補の文字の番号を求める（特徴量がなければ空）"""
+    store = get_feature_store()
+    # ファイル名はデータセットをまたいで重複するので、音声のDriveのファイルIDで引く
+    file_id = extract_drive_file_id(audio_url) if audio_url else None
+    found = store.get(file_id) if store is not None and file_id else None
+    if found is None:
+        return set()
+    _, frames = found
+    return lazy_import('prosody').suggest_emphasis(text, frames)
+
+# Google Driveクライアント（全セッションで共有して接続を使い回す）
+@st.cache_resource
+def get_drive_client():
+    """接続プールつきのGoogle Driveクライアントを取得"""
+    return DriveClient(
+        pool_size=max(DRIVE_POOL_SIZE, PREFETCH_WORKERS),
+        read_timeout=DRIVE_TIMEOUT,
+        retries=DRIVE_RETRIES,
+        download_url=DRIVE_URL_TEMPLATE,
+    )
+
+def download_audio(drive_url):
+    """Google Driveから音声ファイルをダウンロード"""
+    try:
+        with get_metrics().span('drive_download'):
+            return get_drive_client().fetch(drive_url)
+    except DriveDownloadError as e:
         st.error(f"音声読み込みエラー: {e}")
         return None
 
-def tokenize_text(text):
-    """テキストを単語に分割（簡易版：1文字ずつ）"""
-    return list(text)
+# 音声の先読み（全セッションで共有するスレッドプール）
+@st.cache_resource
+def get_prefetch_executor():
+    """音声先読み用のスレッドプールを取得"""
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="audio-prefetch")
+
+def cancel_prefetch():
+    """このセッションの未完了の先読みを取り消す"""
+    for future in st.session_state.prefetch_futures.values():
+        future.cancel()
+    st.session_state.prefetch_futures = {}
+
+def schedule_prefetch(data, current_idx):
+    """現在のアイテムの次からPREFETCH_COUNT件の音声をバックグラウンドで取得"""
+    # データセットが切り替わったら古い先読みは不要
+    if st.session_state.prefetch_sheet != st.session_state.current_sheet:
+        cancel_prefetch()
+        st.session_state.prefetch_sheet = st.session_state.current_sheet
+
+    wanted = []
+    for item in data[current_idx + 1:current_idx + 1 + PREFETCH_COUNT]:
+        audio_url = item.get('audioUrl') or item.get('audio_url')
+        if audio_url:
+            wanted.append(audio_url)
+
+    # 範囲外になった先読みは取り消す（現在のアイテムの分は残す）
+    futures = st.session_state.prefetch_futures
+    current_item = data[current_idx] if current_idx < len(data) else {}
+    current_url = current_item.get('audioUrl') or current_item.get('audio_url')
+    for url in list(futures):
+        if url not in wanted and url != current_url:
+            futures.pop(url).cancel()
+
+    executor = get_prefetch_executor()
+    for url in wanted:
+        if url not in futures:
+            # 結果は音声キャッシュに入るので本体側と共有される
+            futures[url] = executor.submit(load_playback_audio, url)
+
+# 音声の配信サーバー（全セッションで共有、ポートを設定したときだけ起動）
+@st.cache_resource
+def get_audio_server():
+    """音声を中身のハッシュのURLで配信するサーバーを起動（使わない・起動できなければNone）"""
+    if not AUDIO_SERVER_PORT:
+        return None
+    server = AudioServer(
+        load_playback_audio, AUDIO_SERVER_URL, mime=AUDIO_SETTINGS.mime, max_bytes=AUDIO_SERVER_MAX_BYTES, detect_mime=audio_mime
+    )
+    try:
+        server.serve(AUDIO_SERVER_PORT, host=AUDIO_SERVER_HOST, allow_origin=AUDIO_SERVER_ALLOW_ORIGIN or None)
+    except OSError as e:
+        st.warning(f"音声配信用のポートを開けませんでした: {e}")
+        return None
+    return server
+
+def get_audio_source(audio_url):
+    """st.audioに渡すもの（配信サーバーがあればURL、なければバイト列）"""
+    server = get_audio_server()
+    if server is None:
+        return get_audio_bytes(audio_url)
+    link = server.link(audio_url)
+    if link is not None:
+        # 配信済みの音声は再実行でバイト列に触れない（ブラウザは同じURLをキャッシュから再生する）
+        st.session_state.prefetch_futures.pop(audio_url, None)
+        return link
+    audio_bytes = get_audio_bytes(audio_url)
+    return server.add(audio_url, audio_bytes) if audio_bytes else None
+
+def get_audio_bytes(audio_url):
+    """先読み済みならその結果を、なければ通常どおり音声を取得"""
+    with get_metrics().span('load_audio', **span_tags()):
+        future = st.session_state.prefetch_futures.pop(audio_url, None)
+        if future is not None and not future.cancelled():
+            try:
+                audio_bytes = future.result()
+                if audio_bytes:
+                    return audio_bytes
+            except Exception:
+                pass
+        return load_playback_audio(audio_url)
+
+# Google Sheetsへの書き込み（全セッションで共有するバックグラウンドワーカー）
+@st.cache_resource
+def get_sheets_writer():
+    """ジャーナル経由でGoogle Sheetsに送信するワーカーを取得"""
+    journal = AnnotationJournal(JOURNAL_PATH)
+    # 認証情報はここで1回だけ読み込み、ワーカーが開いたワークシートを使い回す
+    open_worksheet = partial(
+        open_results_worksheet,
+        dict(st.secrets["gcp_service_account"]),
+        RESULT_SHEET_URL,
+        '全結果'
+    )
+    return SheetsWriter(
+        journal,
+        open_worksheet,
+        batch_size=SHEETS_BATCH_SIZE,
+        flush_interval=SHEETS_FLUSH_INTERVAL,
+        writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+    ).start()
+
+# '全結果'シートの全行（全アノテーター分）
+@st.cache_data(ttl=60, show_spinner=False)
+def load_result_rows():
+    """'全結果'シートを一括で読み込み、まだ送信していない修正と行も反映して (修正の版, 行) を返す"""
+    writer = get_sheets_writer()
+    # 版は行より先に読む（読んでいる間に修正されたら、次に読んだときに版が変わっている）
+    revision = writer.journal.revision()
+    updates = writer.journal.unflushed_updates()
+    rows = []
+    for row_number, row in enumerate(writer.read_all_values(), start=1):
+        if not row or row[0] == RESULT_COLUMNS[0]:
+            continue
+        row = updates.get(row_number, row)
+        rows.append((list(row) + [''] * len(RESULT_COLUMNS))[:len(RESULT_COLUMNS)])
+    rows.extend(writer.journal.unflushed_rows())
+    return revision, rows
+
+# エクスポート
+@st.cache_resource
+def get_export_cache():
+    """作成済みのエクスポートファイルのキャッシュを取得"""
+    return ExportCache(EXPORT_CACHE_DIR)
+
+EXPORT_SCOPES = ["このセッション", "このデータセット（全員）", "全結果（全員）"]
+
+def build_export(scope, fmt, annotator_name):
+    """選択された範囲の結果をファイルに書き出し、(パス, ファイル名) を返す"""
+    if 'export_id' not in st.session_state:
+        st.session_state.export_id = os.urandom(8).hex()
+    if scope == EXPORT_SCOPES[0]:
+        rows = list(st.session_state.annotations.rows())
+        revision = st.session_state.corrections
+        source_key = f"session-{st.session_state.export_id}"
+        label = annotator_name
+    elif scope == EXPORT_SCOPES[1]:
+        dataset_col = RESULT_COLUMNS.index('dataset')
+        # おまかせでは受け取ったアイテムの元のデータセット全部
+        datasets = {item_dataset(item) for item in st.session_state.get('data') or ()} if is_scheduled() else {st.session_state.current_sheet}
+        revision, rows = load_result_rows()
+        rows = [row for row in rows if row[dataset_col] in datasets]
+        # おまかせの受け取ったアイテムはセッションごとに違うので、セッションと受け取った回ごとのファイルにする
+        source_key = (
+            f"session-{st.session_state.export_id}-batch-{st.session_state.data_version}"
+            if is_scheduled() else f"dataset-{st.session_state.current_sheet}"
+        )
+        label = st.session_state.current_sheet
+    else:
+        revision, rows = load_result_rows()
+        source_key = "all"
+        label = "all"
+    # 保存し直した行があれば版が変わり、追記ではなく作り直しになる
+    path = get_export_cache().export(source_key, fmt, rows, revision)
+    filename = f"annotations_{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[fmt][0]}"
+    return path, filename
+
+# 保存済みアイテムの索引（全セッションで共有、シートを読めるまで作り直す）
+@st.cache_resource
+def get_completion_index_slot():
+    """'全結果'シートとジャーナルから作った索引の置き場所"""
+    return IndexSlot(lambda: CompletionIndex.from_writer(get_sheets_writer()), retry_seconds=COMPLETION_INDEX_RETRY_SECONDS)
+
+def get_completion_index():
+    """保存済みアイテムの索引を取得（シートを読めなければ例外。呼び出し側はセッション内の情報で代用する）"""
+    return get_completion_index_slot().get()
+
+def resume_position():
+    """現在のアノテーターがまだ保存していない最初のアイテムに移動"""
+    name = st.session_state.get('annotator_name', '')
+    data = st.session_state.get('data')
+    if not name or not data or not st.session_state.current_sheet or is_scheduled():
+        return
+    try:
+        index = get_completion_index()
+    except Exception:
+        return
+    st.session_state.current_idx = index.first_unannotated(
+        name,
+        st.session_state.current_sheet,
+        (item.get('filename', 'N/A') for item in data)
+    )
+    if st.session_state.current_idx > 0:
+        st.toast(f"保存済みの{st.session_state.current_idx}件をスキップして再開します")
+
+# おまかせ割り当て（全セッションで共有、おまかせが使われるまで作らない）
+@st.cache_resource
+def get_scheduler_slot():
+    """スケジューラーの置き場所（保存のたびにスケジューラーを作らないよう、作ったかどうかを見られるようにする）"""
+    return {'lock': threading.Lock(), 'scheduler': None}
+
+def existing_scheduler():
+    """作成済みのスケジューラー（まだなら None）"""
+    return get_scheduler_slot()['scheduler']
+
+def get_scheduler():
+    """保存済みのラベルを登録したスケジューラーを取得（データセットの音声は register_datasets で登録する）"""
+    slot = get_scheduler_slot()
+    with slot['lock']:
+        if slot['scheduler'] is None:
+            scheduler = CoverageScheduler(target=SCHEDULE_TARGET, lease_seconds=SCHEDULE_LEASE_MINUTES * 60)
+            for annotator, dataset, filename in get_completion_index().keys():
+                scheduler.record_label(annotator, dataset, filename)
+            slot['scheduler'] = scheduler
+        return slot['scheduler']
+
+def register_datasets(scheduler):
+    """まだ登録していないデータセットの音声をスケジューラーに登録する（読み込めなかったものは次の割り当てでやり直す）"""
+    store = get_manifest_store()
+    for name in SHEET_URLS:
+        if scheduler.has_dataset(name):
+            continue
+        try:
+            manifest = store.get(name)
+        except Exception:
+            continue
+        scheduler.add_items(name, (filename for filename in manifest.column('filename') if filename))
+
+def record_scheduled_label(annotator, dataset, filename):
+    """保存したラベルをスケジューラーに反映する（まだ作られていなければ、作るときに索引から読み込まれる）"""
+    slot = get_scheduler_slot()
+    # 作成中のスケジューラーが索引を読み終えるまで待つ（索引への追加はこれより前に済んでいる）
+    with slot['lock']:
+        scheduler = slot['scheduler']
+    if scheduler is not None:
+        scheduler.record_label(annotator, dataset, filename)
+
+def is_scheduled():
+    return st.session_state.current_sheet == SCHEDULED_SHEET
+
+def item_dataset(item):
+    """アイテムの元のデータセット名（おまかせで受け取ったアイテムは 'dataset' 列に入っている）"""
+    if is_scheduled():
+        return item.get('dataset', SCHEDULED_SHEET)
+    return st.session_state.current_sheet
+
+def set_working_data(name, data):
+    """作業するデータを切り替えて、位置と選択状態をリセット"""
+    cancel_prefetch()
+    st.session_state.data = data
+    st.session_state.data_loaded = True
+    st.session_state.current_sheet = name
+    st.session_state.current_idx = 0
+    st.session_state.annotations = ResultsTable()
+    st.session_state.saved_rows = {}
+    st.session_state.selected_words = set()
+    st.session_state.selection_unknown = False
+    st.session_state.loaded_selection = frozenset()
+    # 同じ名前・同じ番号でも別のアイテムなので、選択UIを作り直すための番号
+    st.session_state.data_version += 1
+
+def release_batch():
+    """おまかせで受け取ったまま保存していない音声を他の人に回せるように返す"""
+    if not is_scheduled() or not st.session_state.get('data'):
+        return
+    remaining = [
+        (item.get('dataset'), item.get('filename'))
+        for item in st.session_state.data[st.session_state.current_idx:]
+    ]
+    scheduler = existing_scheduler()
+    if scheduler is not None:
+        scheduler.release(st.session_state.get('annotator_name', ''), remaining)
+
+def assign_batch():
+    """ラベルの少ない音声を SCHEDULE_BATCH_SIZE 件受け取って作業中のデータにする（受け取った件数を返す）"""
+    release_batch()
+    with get_metrics().span('schedule', **span_tags()):
+        scheduler = get_scheduler()
+        register_datasets(scheduler)
+        batch = scheduler.next_batch(st.session_state.get('annotator_name', ''), SCHEDULE_BATCH_SIZE)
+    store = get_manifest_store()
+    rows_by_dataset = {}
+    rows = []
+    for dataset, filename in batch:
+        if dataset not in rows_by_dataset:
+            rows_by_dataset[dataset] = {str(row.get('filename')): row for row in store.get(dataset)}
+        row = rows_by_dataset[dataset].get(filename)
+        if row is not None:
+            rows.append({**row.to_dict(), 'dataset': dataset})
+    set_working_data(SCHEDULED_SHEET, Manifest.from_rows(rows))
+    return len(rows)
+
+# ローカルの結果ファイル（全セッションで共有、保存のたびに追記）
+@st.cache_resource
+def get_results_file():
+    """保存した全行を列ごとの形式で持つ結果ファイルを開く"""
+    return ResultsFile(RESULTS_PATH)
+
+def is_saved(item):
+    """現在のアノテーターがこのアイテムを保存済みか"""
+    try:
+        return get_completion_index().is_done(
+            st.session_state.get('annotator_name', ''), item_dataset(item), item.get('filename', 'N/A')
+        )
+    except Exception:
+        return (item_dataset(item), item.get('filename', 'N/A')) in st.session_state.saved_rows
+
+def saved_selection(item):
+    """保存済みのアイテムなら保存した強調の文字の位置（このセッション → 索引 → 結果ファイルの順に探す）
+
+    保存済みなのに選択が分からなければ None（空の選択で保存済みの行を上書きしないよう、修正できなくする）
+    """
+    key = (item_dataset(item), item.get('filename', 'N/A'))
+    row = st.session_state.saved_rows.get(key)
+    if row is not None:
+        return set(st.session_state.annotations.indices(row))
+    if not is_saved(item):
+        return set()
+    name = st.session_state.get('annotator_name', '')
+    try:
+        indices = get_completion_index().saved_indices(name, *key)
+    except Exception:
+        indices = None
+    if indices is None:
+        indices = get_results_file().last_indices(annotator=name, dataset=key[0], filename=key[1])
+    return None if indices is None else set(indices)
+
+def go_to(idx):
+    """idx 番目のアイテムに移動（保存済みのアイテムなら保存した選択を読み込む）"""
+    data = st.session_state.data
+    st.session_state.current_idx = idx
+    selection = saved_selection(data[idx]) if idx < len(data) else set()
+    # 保存した選択が分からないアイテムは修正させない（save_barで止める）
+    st.session_state.selection_unknown = selection is None
+    st.session_state.selected_words = selection or set()
+    # 読み込んだときの選択（選択の単位とそろっているかは、編集中に変わらないようこれで決める）
+    st.session_state.loaded_selection = frozenset(st.session_state.selected_words)
 
 # Google Sheetsに保存
 def save_to_sheets(annotation):
-    """アノテーション結果をGoogle Sheetsに保存"""
+    """アノテーション結果をジャーナルに書き込み、Google Sheetsへの送信を予約"""
     try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-        
-        # Streamlit Secretsから認証情報を取得
-        credentials = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=['https://www.googleapis.com/auth/spreadsheets']
-        )
-        gc = gspread.authorize(credentials)
-        
-        # スプレッドシートを開く
-        spreadsheet = gc.open_by_url(RESULT_SHEET_URL)
-        worksheet = spreadsheet.worksheet('全結果')
-        
-        # データを追加
-        row_data = [
-            annotation['annotator'],
-            annotation['gender'],
-            annotation['age'],
-            annotation['dataset'],
-            annotation['filename'],
-            annotation['speaker'],
-            annotation['text'],
-            annotation['emphasized_words'],
-            annotation['emphasized_indices'],
-            annotation['annotated_text'],
-            str(annotation['has_emphasis']),
-            annotation['timestamp']
-        ]
-        
-        worksheet.append_row(row_data)
-        return True
-        
+        row = annotation_to_row(annotation)
+        key = (annotation['annotator'], annotation['dataset'], annotation['filename'])
+        index = get_completion_index()
+        with get_metrics().span('save', **span_tags()):
+            if index.is_done(*key):
+                # 保存し直し：行を足さずに、索引の行番号（送信前ならジャーナルの行）を書き換える
+                row_number, entry_id = index.location(*key)
+                entry_id = get_sheets_writer().correct(row, row_number=row_number, entry_id=entry_id)
+            else:
+                entry_id = get_sheets_writer().enqueue(row)
+            # 結果ファイルは追記のみ（同じアイテムは後の行が新しい）
+            get_results_file().append_row(row)
+        if entry_id not in st.session_state.journal_ids:
+            st.session_state.journal_ids.append(entry_id)
+        index.add(*key, entry_id=entry_id, indices=parse_indices(annotation['emphasized_indices']))
     except Exception as e:
         st.error(f"Google Sheets保存エラー: {e}")
         return False
+    try:
+        record_scheduled_label(annotation['annotator'], annotation['dataset'], annotation['filename'])
+    except Exception:
+        # 保存はできているので、割り当てが次の再起動まで少しずれるだけ
+        pass
+    return True
+
+@st.cache_resource
+def register_metric_sources():
+    """キャッシュやワーカーの状態をメトリクスから参照できるようにする（プロセスで1回）"""
+    metrics = get_metrics()
+    metrics.register_source('audio_cache', lambda: get_audio_cache().stats())
+    metrics.register_source('processed_audio_cache', lambda: get_processed_audio_cache().stats())
+    metrics.register_source('manifest', lambda: get_manifest_store().stats())
+    metrics.register_source('sheets_writer', lambda: get_sheets_writer().stats())
+    pack = get_asset_pack()
+    if pack is not None:
+        metrics.register_source('asset_pack', pack.stats)
+    metrics.register_source('results_file', lambda: get_results_file().stats())
+    store = get_feature_store()
+    if store is not None:
+        metrics.register_source('feature_store', store.stats)
+    # おまかせがまだ使われていなければ（None で失敗して）出さない
+    metrics.register_source('scheduler', lambda: existing_scheduler().stats())
+    audio_server = get_audio_server()
+    if audio_server is not None:
+        metrics.register_source('audio_server', audio_server.stats)
+    return True
 
 # セッション状態の初期化
 if 'current_idx' not in st.session_state:
     st.session_state.current_idx = 0
 if 'annotations' not in st.session_state:
-    st.session_state.annotations = []
+    st.session_state.annotations = ResultsTable()
 if 'selected_words' not in st.session_state:
     st.session_state.selected_words = set()
+if 'selection_unknown' not in st.session_state:
+    st.session_state.selection_unknown = False
+if 'loaded_selection' not in st.session_state:
+    st.session_state.loaded_selection = frozenset()
 if 'data_loaded' not in st.session_state:
     st.session_state.data_loaded = False
-if 'selecting' not in st.session_state:
-    st.session_state.selecting = False
-if 'select_start' not in st.session_state:
-    st.session_state.select_start = None
 if 'page' not in st.session_state:
     st.session_state.page = 'instruction'
 if 'current_sheet' not in st.session_state:
     st.session_state.current_sheet = None
+if 'prefetch_futures' not in st.session_state:
+    st.session_state.prefetch_futures = {}
+if 'prefetch_sheet' not in st.session_state:
+    st.session_state.prefetch_sheet = None
+if 'journal_ids' not in st.session_state:
+    st.session_state.journal_ids = []
+if 'granularity' not in st.session_state:
+    st.session_state.granularity = TOKEN_GRANULARITY
+if 'show_suggestions' not in st.session_state:
+    st.session_state.show_suggestions = EMPHASIS_SUGGESTIONS
+if 'session_tag' not in st.session_state:
+    st.session_state.session_tag = os.urandom(4).hex()
+if 'data_version' not in st.session_state:
+    st.session_state.data_version = 0
+if 'saved_rows' not in st.session_state:
+    # (データセット, ファイル名) → このセッションの annotations の行番号
+    st.session_state.saved_rows = {}
+if 'corrections' not in st.session_state:
+    st.session_state.corrections = 0
+
+# サーバー起動後の最初の実行で全データセットの読み込みを始める
+get_manifest_store()
+register_metric_sources()
+
+# 管理者ページ
+if st.query_params.get("page") == "admin":
+    st.session_state.page = 'admin'
 
 # サイドバー
 st.sidebar.title("⚙️ 設定")
@@ -200,38 +817,368 @@ else:
 # Google Sheetsデータセット選択
 st.sidebar.subheader("📊 データソース")
 
-# 事前定義されたURL
-sheet_urls = {
-    "JVS①": "https://docs.google.com/spreadsheets/d/19QldMsTxmGg_A1iDoukKk2Nqul-MfN1VPHt5lpNFW9M/edit?usp=sharing",
-    "JVS②": "https://docs.google.com/spreadsheets/d/1eR4I4oa3vhz_6FToVIbFT2vGsYBMx-kpfiNQHDx4C5c/edit?usp=sharing",
-    "JVS③": "https://docs.google.com/spreadsheets/d/1TVBEF8txyznZapG4mt5IeLSM7laORdr3eJkCjVLaH2U/edit?usp=sharing",
-    "JVS④": "https://docs.google.com/spreadsheets/d/1Jr7lnAkAdCrQ8qcHvyOznm-usx8aIFawjWjvDh_fOko/edit?usp=sharing",
-    "JVS⑤": "https://docs.google.com/spreadsheets/d/19-WiHrWYTBzzOO6Vime4RFtc9kiYF7IrzOSnOE-A19E/edit?usp=sharing"
-}
-
 st.sidebar.markdown("**データセットを選択:**")
 
 # ボタンを縦に並べる
-for name, url in sheet_urls.items():
+for name in SHEET_URLS:
     if st.sidebar.button(name, use_container_width=True):
         with st.spinner(f"{name}のデータを読み込み中..."):
-            data = load_data_from_sheets(url)
+            data = load_dataset(name)
             if data:
-                st.session_state.data = data
-                st.session_state.data_loaded = True
-                st.session_state.current_sheet = name
-                st.session_state.current_idx = 0
-                st.session_state.annotations = []
-                # 選択状態をリセット
-                st.session_state.selected_words = set()
-                st.session_state.selecting = False
-                st.session_state.select_start = None
+                # おまかせで受け取っていた残りは他の人に回す
+                release_batch()
+                set_working_data(name, data)
+                # 作業中のアノテーターなら続きから再開
+                resume_position()
                 st.sidebar.success(f"✅ {name}: {len(data)}件読み込み完了")
                 st.rerun()
 
+# ラベルの少ない音声から、まだ自分が付けていないものをまとめて受け取る
+if st.sidebar.button(
+    f"🎲 {SCHEDULED_SHEET}（ラベルの少ない音声から{SCHEDULE_BATCH_SIZE}件）",
+    use_container_width=True,
+    disabled=not st.session_state.get('annotator_name'),
+    help="説明ページで「アノテーション作業を開始」を押すと使えます"
+):
+    try:
+        with st.spinner("音声を割り当て中..."):
+            assigned = assign_batch()
+    except Exception as e:
+        st.sidebar.error(f"割り当てエラー: {e}")
+        assigned = None
+    if assigned:
+        st.rerun()
+    elif assigned is not None:
+        st.sidebar.info(f"割り当てられる音声はありません（全て{SCHEDULE_TARGET}人分のラベルがそろっているか、付け終わっています）")
+
 # 現在読み込まれているデータセットを表示
 if st.session_state.data_loaded and st.session_state.current_sheet:
     st.sidebar.info(f"📂 現在: {st.session_state.current_sheet}")
+    # 選択の単位（保存される位置はどの単位でも文字単位）
+    st.sidebar.radio(
+        "選択の単位",
+        GRANULARITIES,
+        format_func=GRANULARITY_LABELS.get,
+        key='granularity'
+    )
+    if get_feature_store() is not None:
+        st.sidebar.checkbox("強調の候補を表示（参考）", key='show_suggestions')
+
+# ========== アノテーションページの部品（フラグメント） ==========
+
+@st.fragment
+def annotation_selector(tokenization, suggested_chars=()):
+    """文字の選択UI（選択が変わってもこのフラグメントだけが再実行される）"""
+    granularity = st.session_state.granularity
+    if not tokenization.is_aligned(st.session_state.loaded_selection):
+        # 別の単位で保存した選択（「天気」の「天」だけなど）は、まとまりで表示すると広がって見えるので1文字ずつにする
+        granularity = 'char'
+        tokenization = tokenize(''.join(tokenization.tokens), granularity)
+        st.caption("保存済みの選択が選択の単位とそろっていないため、このアイテムは1文字ずつ表示しています")
+    item_key = f"{st.session_state.current_sheet}:{st.session_state.data_version}:{st.session_state.current_idx}:{granularity}"
+    selected = char_selector(
+        tokenization.tokens,
+        tokenization.from_chars(st.session_state.selected_words),
+        item_key=item_key,
+        suggested=tokenization.from_chars(set(suggested_chars)),
+        key=f"char_selector_{item_key}"
+    )
+    if selected is not None:
+        # 選択はトークン単位、保存するのは文字単位の位置（触っていないトークンの文字はそのまま）
+        st.session_state.selected_words = tokenization.merge_chars(st.session_state.selected_words, selected)
+
+@st.fragment
+def save_bar(item, text, total, annotator_name, gender, age):
+    """前後への移動と保存ボタン（保存・移動したらページ全体を再実行する）"""
+    # 最後の音声かどうかをチェック
+    is_last_item = st.session_state.current_idx >= total - 1
+    # 保存済みのアイテムは保存し直すとシートの同じ行を書き換える
+    saved = is_saved(item)
+    
+    if saved:
+        button_label = "💾 修正を保存して完了" if is_last_item else "💾 修正を保存して次へ"
+    else:
+        button_label = "💾 保存して完了" if is_last_item else "💾 保存して次へ"
+    
+    col_prev, col_save, col_next = st.columns([1, 4, 1])
+    with col_prev:
+        if st.button("◀ 前へ", use_container_width=True, disabled=st.session_state.current_idx == 0):
+            go_to(st.session_state.current_idx - 1)
+            st.rerun()
+    with col_next:
+        # まだ保存していないアイテムは飛ばせない
+        if st.button("次へ ▶", use_container_width=True, disabled=not saved or is_last_item):
+            go_to(st.session_state.current_idx + 1)
+            st.rerun()
+    
+    # 保存した選択を読み込めなかったアイテムは、空の選択で上書きしないよう修正を止める
+    locked = saved and st.session_state.selection_unknown
+    if locked:
+        st.warning("⚠️ 保存済みの強調の位置を読み込めなかったため、このアイテムは修正できません（「次へ」で先に進めます）")
+
+    if col_save.button(button_label, type="primary", use_container_width=True, disabled=locked):
+        if text:
+            annotation = {
+                'annotator': annotator_name,
+                'gender': gender,
+                'age': age,
+                'dataset': item_dataset(item),
+                'filename': item.get('filename', 'N/A'),
+                'speaker': item.get('speaker', 'N/A'),
+                'text': text,
+                **emphasis_fields(text, st.session_state.selected_words),
+                'timestamp': datetime.now().isoformat()
+            }
+            
+            # ローカルに保存（このセッションで保存済みなら同じ行を置き換える）
+            key = (annotation['dataset'], annotation['filename'])
+            row = st.session_state.saved_rows.get(key)
+            if row is None:
+                st.session_state.saved_rows[key] = st.session_state.annotations.append_annotation(annotation)
+            else:
+                st.session_state.annotations.replace_row(row, annotation_to_row(annotation))
+            if saved:
+                st.session_state.corrections += 1
+            
+            # Google Sheetsに保存
+            if save_to_sheets(annotation):
+                st.success("✅ 保存しました（Google Sheetsへ順次送信されます）")
+            else:
+                st.warning("⚠️ ローカルには保存されましたが、Google Sheets保存に失敗しました")
+            
+            go_to(st.session_state.current_idx + 1)
+            st.rerun()
+
+@st.fragment
+def sidebar_stats(total, annotator_name):
+    """サイドバーの進捗・送信状況・エクスポート（st.sidebarの中で呼ぶ）"""
+    # 進捗表示
+    current = min(st.session_state.current_idx + 1, total)
+    try:
+        if is_scheduled():
+            # 複数のデータセットにまたがるので、このまとまりで保存した件数
+            completed = len(st.session_state.annotations)
+        else:
+            completed = get_completion_index().count(annotator_name, st.session_state.current_sheet)
+    except Exception:
+        completed = len(st.session_state.annotations)
+    
+    st.markdown("---")
+    st.subheader("📈 進捗")
+    st.metric("現在", f"{current} / {total}")
+    st.metric("完了", completed)
+    st.progress(current / total if total else 0.0)
+    
+    # Google Sheetsへの送信状況
+    if st.session_state.journal_ids:
+        send_counts = get_sheets_writer().journal.counts(st.session_state.journal_ids)
+        st.caption(
+            f"☁️ 送信待ち {send_counts['pending']} ／ 送信済み {send_counts['flushed']} ／ 再送待ち {send_counts['failed']}"
+        )
+    
+    # エクスポート
+    st.markdown("---")
+    st.subheader("📥 データ出力")
+    
+    if len(st.session_state.annotations) > 0:
+        with_emphasis = st.session_state.annotations.emphasis_count()
+        without_emphasis = len(st.session_state.annotations) - with_emphasis
+        
+        st.metric("強調あり", with_emphasis)
+        st.metric("強調なし", without_emphasis)
+    
+    scope = st.radio("範囲", EXPORT_SCOPES, key="export_scope")
+    fmt = st.selectbox("形式", available_formats(), key="export_format")
+    
+    if st.button("📊 ファイルを作成", use_container_width=True):
+        if scope == EXPORT_SCOPES[0] and not st.session_state.annotations:
+            st.info("まだ保存したデータがありません")
+        else:
+            try:
+                with st.spinner("ファイルを作成中..."):
+                    path, filename = build_export(scope, fmt, annotator_name)
+                with open(path, 'rb') as f:
+                    st.download_button(
+                        label="⬇️ ダウンロード",
+                        data=f,
+                        file_name=filename,
+                        mime=EXPORT_FORMATS[fmt][1],
+                        use_container_width=True
+                    )
+            except Exception as e:
+                st.error(f"エクスポートエラー: {e}")
+
+# ========== 管理者ページ ==========
+
+@st.cache_resource
+def get_emphasis_stats():
+    """強調の統計（全セッションで共有し、新しい行だけを取り込んで更新）"""
+    return lazy_import('analytics').EmphasisStats()
+
+def format_kappa(value):
+    return "—" if value != value else f"{value:.3f}"
+
+def render_admin_page():
+    """管理者用ページ（分析と処理時間）"""
+    st.title("📊 分析・運用状況（管理者用）")
+    
+    if not ADMIN_PASSWORD:
+        # アノテーターごとの統計や運用の数値が見えるので、パスワードなしでは開かない
+        st.warning("管理者ページを使うには、設定（secrets または環境変数 JVS_ADMIN_PASSWORD）で admin_password を設定してください")
+        return
+    if not st.session_state.get('admin_authenticated'):
+        password = st.text_input("パスワード", type="password")
+        if password == ADMIN_PASSWORD:
+            st.session_state.admin_authenticated = True
+            st.rerun()
+        elif password:
+            st.error("パスワードが違います")
+        return
+    
+    tab_analysis, tab_metrics = st.tabs(["📊 分析", "⏱ 処理時間"])
+    with tab_analysis:
+        render_analysis()
+    with tab_metrics:
+        render_operator_metrics()
+
+def render_operator_metrics():
+    """起動時間・処理段階ごとの所要時間とキャッシュ・送信ワーカーの状態を表示"""
+    startup_info = get_startup_info()
+    st.subheader("起動時間（このプロセス）")
+    col1, col2 = st.columns(2)
+    col1.metric("import", f"{startup_info['imports'] * 1000:.0f} ms")
+    col2.metric(
+        "最初の表示まで",
+        f"{startup_info['first_run'] * 1000:.0f} ms" if startup_info['first_run'] is not None else "—"
+    )
+    if startup_info['lazy_imports']:
+        st.caption("後から読み込んだモジュール: " + " ／ ".join(
+            f"{name} {seconds * 1000:.0f} ms" for name, seconds in startup_info['lazy_imports'].items()
+        ))
+    
+    metrics = get_metrics()
+    if not metrics.enabled:
+        st.info("計測は無効です（metrics_enabled を true にすると有効になります）")
+        return
+    
+    if st.button("🔄 更新", key="refresh_metrics"):
+        st.rerun()
+    
+    st.subheader("処理段階ごとの所要時間（直近）")
+    st.dataframe(
+        [
+            {
+                '段階': stage,
+                '回数': stats['count'],
+                'エラー': stats['errors'],
+                '平均 (ms)': round(stats['mean'] * 1000, 1),
+                'p50 (ms)': round(stats['p50'] * 1000, 1),
+                'p90 (ms)': round(stats['p90'] * 1000, 1),
+                'p99 (ms)': round(stats['p99'] * 1000, 1),
+            }
+            for stage, stats in metrics.summary().items()
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    st.subheader("キャッシュ・送信ワーカーの状態")
+    for name, stats in metrics.sources().items():
+        st.caption(name)
+        st.json(stats, expanded=False)
+    
+    st.subheader("直近の記録")
+    st.dataframe(
+        [
+            {
+                '時刻': datetime.fromtimestamp(at).strftime('%H:%M:%S'),
+                '段階': stage,
+                'ms': round(seconds * 1000, 1),
+                **tags,
+            }
+            for at, stage, seconds, tags in reversed(metrics.recent()[-50:])
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+
+def render_analysis():
+    """アノテーター間の一致度と強調の傾向を表示"""
+    if st.button("🔄 最新の結果を読み込む"):
+        load_result_rows.clear()
+    
+    try:
+        revision, rows = load_result_rows()
+    except Exception as e:
+        st.error(f"結果の読み込みエラー: {e}")
+        return
+    
+    stats = get_emphasis_stats()
+    stats.ingest(rows, revision)
+    summary = stats.summary()
+    
+    cols = st.columns(4)
+    cols[0].metric("結果の行数", summary['rows'])
+    cols[1].metric("音声数", summary['items'])
+    cols[2].metric("アノテーター数", len(summary['annotators']))
+    cols[3].metric("Fleiss' κ（全体）", format_kappa(summary['fleiss_kappa']))
+    st.caption(f"1音声あたりの平均ラベル数: {summary['labels_per_item']:.2f} ／ 全体の強調率: {summary['emphasis_rate']:.3f}")
+    
+    st.subheader("アノテーター別の傾向")
+    st.caption("bias = 本人の強調率 − 同じ文字についての他のアノテーターの強調率")
+    st.dataframe(
+        [
+            {
+                'アノテーター': row['annotator'],
+                '評価した文字数': row['characters'],
+                '強調率': round(row['emphasis_rate'], 3),
+                '他の人の強調率': round(row['others_rate'], 3),
+                'bias': round(row['bias'], 3),
+            }
+            for row in summary['annotator_rows']
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    st.subheader("Cohen's κ（アノテーターのペアごと）")
+    annotators = summary['annotators']
+    st.dataframe(
+        [
+            {'': name, **{other: format_kappa(summary['cohen_kappa'][i, j]) for j, other in enumerate(annotators)}}
+            for i, name in enumerate(annotators)
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    st.subheader("音声ごとの強調確率")
+    item_keys = stats.item_keys()
+    if not item_keys:
+        st.info("まだ結果がありません")
+        return
+    item_key = st.selectbox("音声", item_keys, format_func=lambda key: f"{key[0]} / {key[1]}")
+    detail = stats.item_detail(item_key)
+    st.caption(f"アノテーター {len(detail['annotators'])}人 ／ Fleiss' κ: {format_kappa(detail['fleiss_kappa'])}")
+    
+    # 強調された割合が高い文字ほど濃い赤で表示
+    preview_html = "<div style='font-size: 24px; line-height: 1.8;'>"
+    for char, probability in zip(detail['text'], detail['probability']):
+        preview_html += (
+            f"<span title='{probability:.2f}' "
+            f"style='background: rgba(255, 0, 0, {probability:.2f}); padding: 0 1px;'>{html.escape(char)}</span>"
+        )
+    preview_html += "</div>"
+    st.markdown(preview_html, unsafe_allow_html=True)
+    
+    st.dataframe(
+        [
+            {'アノテーター': name, **{f"{i}:{char}": "●" if detail['matrix'][row, i] else "" for i, char in enumerate(detail['text'])}}
+            for row, name in enumerate(detail['annotators'])
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
 
 # ページ切り替え
 if st.session_state.page == 'instruction':
@@ -280,7 +1227,7 @@ if st.session_state.page == 'instruction':
     - **作業方法**: 
         - 各データセット内の100音声は連続してラベル付けを行ってください
         - データセット間で休憩を取ったり、日を改めて作業しても構いません
-        - 作業を再開する際は、アノテーター情報を再度入力してください
+        - 作業を再開する際は、同じ名前でアノテーター情報を入力してください（保存済みの音声は自動でスキップされます）
                 
     ---
     
@@ -328,6 +1275,7 @@ if st.session_state.page == 'instruction':
     
     - 強調がない場合は何も選択せずに「保存して次へ」
     - 迷った場合は「全解除」で最初からやり直せます
+    - 「◀ 前へ」で前の音声に戻り、保存した内容を確認・修正できます（保存し直すと前の結果が書き換えられます）
     - 「保存して次へ」を押すたびに結果がクラウド上に保存されます
     
     ---
@@ -355,10 +1303,15 @@ if st.session_state.page == 'instruction':
             st.session_state.gender = gender
             st.session_state.age = age
             st.session_state.page = 'annotation'
+            resume_position()
             st.rerun()
 
+elif st.session_state.page == 'admin':
+    render_admin_page()
+
 else:
     # ========== アノテーションページ ==========
+    render_started = time.perf_counter()
     
     # ページ切り替えボタン
     if st.button("📋 説明ページに戻る"):
@@ -368,23 +1321,33 @@ else:
     # メインコンテンツ
     if st.session_state.data_loaded and 'data' in st.session_state:
         data = st.session_state.data
-        
-        # 進捗表示
         total = len(data)
-        current = st.session_state.current_idx + 1
-        completed = len(st.session_state.annotations)
         
-        st.sidebar.markdown("---")
-        st.sidebar.subheader("📈 進捗")
-        st.sidebar.metric("現在", f"{current} / {total}")
-        st.sidebar.metric("完了", completed)
-        st.sidebar.progress(current / total)
+        # サイドバー：進捗・送信状況・エクスポート
+        with st.sidebar:
+            sidebar_stats(total, annotator_name)
         
         # 完了画面の判定
         if st.session_state.current_idx >= total:
-            # 完了画面を表示（ボタンなし）
-            st.success("🎉 このデータセットのアノテーションは完了です。お疲れ様でした。")
-            st.info("別のデータセットを開始する場合は、左サイドバーから選択してください。")
+            if total and st.button("◀ 最後の音声に戻る（保存した内容を確認・修正）"):
+                go_to(total - 1)
+                st.rerun()
+            if is_scheduled():
+                # おまかせのまとまりが終わったら、続けて次のまとまりを受け取れる
+                st.success("🎉 このまとまりのアノテーションは完了です。お疲れ様でした。")
+                if st.button("🎲 次のまとまりを受け取る", type="primary", use_container_width=True):
+                    try:
+                        assigned = assign_batch()
+                    except Exception as e:
+                        st.error(f"割り当てエラー: {e}")
+                    else:
+                        if assigned:
+                            st.rerun()
+                        st.info("割り当てられる音声はありません。")
+            else:
+                # 完了画面を表示
+                st.success("🎉 このデータセットのアノテーションは完了です。お疲れ様でした。")
+                st.info("別のデータセットを開始する場合は、左サイドバーから選択してください。")
         else:
             # 現在のアイテム
             item = data[st.session_state.current_idx]
@@ -393,16 +1356,23 @@ else:
             st.markdown("### 🎯 強調アノテーション")
             
             # 音声再生エリア（コンパクト）
+            # フラグメントの外に置くので、文字の選択では再生中のプレイヤーは作り直されない
             col1, col2 = st.columns([4, 1])
             
             with col1:
                 audio_url = item.get('audioUrl') or item.get('audio_url')
                 if audio_url:
-                    audio_bytes = load_audio_from_drive(audio_url)
-                    if audio_bytes:
-                        st.audio(audio_bytes, format='audio/wav')
+                    audio_source = get_audio_source(audio_url)
+                    if audio_source:
+                        # 加工に失敗した音声は元のWAVなので、バイト列から形式を決める（URLならサーバーが付ける）
+                        audio_format = audio_mime(audio_source, AUDIO_SETTINGS.mime) if isinstance(audio_source, bytes) else AUDIO_SETTINGS.mime
+                        st.audio(audio_source, format=audio_format)
+                        if PROSODY_PLOT:
+                            render_prosody(audio_url)
                     else:
                         st.error("音声読み込み失敗")
+                # 再生中に次の音声を先読み
+                schedule_prefetch(data, st.session_state.current_idx)
             
             with col2:
                 st.caption(f"**{item.get('speaker', 'N/A')}**")
@@ -411,170 +1381,23 @@ else:
             # テキスト表示と単語選択
             text = item.get('text', '')
             if text:
-                words = tokenize_text(text)
-                
-                # 選択モード切り替え（コンパクト）
-                cols = st.columns([1, 1, 3])
-                
-                with cols[0]:
-                    if st.button("🎯 範囲選択", use_container_width=True, type="primary" if st.session_state.selecting else "secondary"):
-                        st.session_state.selecting = not st.session_state.selecting
-                        if not st.session_state.selecting:
-                            st.session_state.select_start = None
-                        st.rerun()
-                
-                with cols[1]:
-                    if st.button("🔄 全解除", use_container_width=True):
-                        st.session_state.selected_words = set()
-                        st.session_state.selecting = False
-                        st.session_state.select_start = None
-                        st.rerun()
-                
-                # モード表示（1行で）
-                if st.session_state.selecting:
-                    if st.session_state.select_start is None:
-                        st.caption("📍 開始位置をクリック")
-                    else:
-                        st.caption(f"📍 「{words[st.session_state.select_start]}」から選択中 → 終了位置をクリック")
-                else:
-                    st.caption("💡 クリックで選択・解除")
-                
-                # 単語選択UI
-                words_per_row = 20
-                for row_start in range(0, len(words), words_per_row):
-                    row_words = words[row_start:row_start + words_per_row]
-                    cols = st.columns(len(row_words))
-                    
-                    for col_idx, word in enumerate(row_words):
-                        idx = row_start + col_idx
-                        with cols[col_idx]:
-                            is_selected = idx in st.session_state.selected_words
-                            
-                            # 範囲選択モード
-                            if st.session_state.selecting:
-                                if st.button(word, key=f"word_{idx}", type="primary" if is_selected else "secondary", use_container_width=True):
-                                    if st.session_state.select_start is None:
-                                        st.session_state.select_start = idx
-                                        st.rerun()
-                                    else:
-                                        start = min(st.session_state.select_start, idx)
-                                        end = max(st.session_state.select_start, idx)
-                                        for i in range(start, end + 1):
-                                            st.session_state.selected_words.add(i)
-                                        st.session_state.selecting = False
-                                        st.session_state.select_start = None
-                                        st.rerun()
-                            # 通常モード
-                            else:
-                                if st.button(word, key=f"word_{idx}", type="primary" if is_selected else "secondary", use_container_width=True):
-                                    if idx in st.session_state.selected_words:
-                                        st.session_state.selected_words.remove(idx)
-                                    else:
-                                        st.session_state.selected_words.add(idx)
-                                    st.rerun()
-                
-                # 選択結果のプレビュー（コンパクト）
-                st.markdown("**選択結果:**")
-                
-                preview_html = "<div style='font-size: 20px; line-height: 1.5; margin-bottom: 0.5rem;'>"
-                for idx, word in enumerate(words):
-                    if idx in st.session_state.selected_words:
-                        preview_html += f"<span style='color: red; font-weight: bold;'>[{word}]</span>"
-                    else:
-                        preview_html += word
-                preview_html += "</div>"
-                
-                st.markdown(preview_html, unsafe_allow_html=True)
-                
-                if st.session_state.selected_words:
-                    selected_list = [words[i] for i in sorted(st.session_state.selected_words)]
-                    st.caption(f"✓ {', '.join(selected_list)}")
+                suggested = emphasis_suggestions(audio_url, text) if st.session_state.show_suggestions else ()
+                annotation_selector(data.tokens(st.session_state.granularity)[st.session_state.current_idx], suggested)
             
             # ボタンエリア
-            # 最後の音声かどうかをチェック
-            is_last_item = st.session_state.current_idx >= total - 1
-            
-            button_label = "💾 保存して完了" if is_last_item else "💾 保存して次へ"
-            
-            if st.button(button_label, type="primary", use_container_width=True):
-                if text:
-                    selected_indices = sorted(list(st.session_state.selected_words))
-                    emphasized_words = [words[i] for i in selected_indices]
-                    
-                    bracketed_text = ""
-                    for idx, word in enumerate(words):
-                        if idx in st.session_state.selected_words:
-                            bracketed_text += f"[{word}]"
-                        else:
-                            bracketed_text += word
-                    
-                    annotation = {
-                        'annotator': annotator_name,
-                        'gender': gender,
-                        'age': age,
-                        'dataset': st.session_state.current_sheet,
-                        'filename': item.get('filename', 'N/A'),
-                        'speaker': item.get('speaker', 'N/A'),
-                        'text': text,
-                        'emphasized_words': ', '.join(emphasized_words) if emphasized_words else '',
-                        'emphasized_indices': ', '.join(map(str, selected_indices)) if selected_indices else '',
-                        'annotated_text': bracketed_text,
-                        'has_emphasis': len(emphasized_words) > 0,
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    
-                    # ローカルに保存
-                    st.session_state.annotations.append(annotation)
-                    
-                    # Google Sheetsに保存
-                    if save_to_sheets(annotation):
-                        st.success("✅ 保存しました（Google Sheetsに記録）")
-                    else:
-                        st.warning("⚠️ ローカルには保存されましたが、Google Sheets保存に失敗しました")
-                    
-                    st.session_state.current_idx += 1
-                    st.session_state.selected_words = set()
-                    st.session_state.selecting = False
-                    st.session_state.select_start = None
-                    st.rerun()
-        
-        # サイドバー：エクスポート
-        st.sidebar.markdown("---")
-        st.sidebar.subheader("📥 データ出力")
-        
-        if len(st.session_state.annotations) > 0:
-            with_emphasis = sum(1 for a in st.session_state.annotations if a['has_emphasis'])
-            without_emphasis = len(st.session_state.annotations) - with_emphasis
-            
-            st.sidebar.metric("強調あり", with_emphasis)
-            st.sidebar.metric("強調なし", without_emphasis)
-            
-            if st.sidebar.button("📊 エクセルをダウンロード", use_container_width=True):
-                df = pd.DataFrame(st.session_state.annotations)
-                
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df.to_excel(writer, index=False, sheet_name='Annotations')
-                    
-                    worksheet = writer.sheets['Annotations']
-                    for idx, col in enumerate(df.columns):
-                        max_length = max(df[col].astype(str).apply(len).max(), len(col))
-                        worksheet.column_dimensions[chr(65 + idx)].width = min(max_length + 2, 50)
-                
-                output.seek(0)
-                
-                filename = f"annotations_{annotator_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                
-                st.sidebar.download_button(
-                    label="⬇️ ダウンロード",
-                    data=output,
-                    file_name=filename,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+            save_bar(item, text, total, annotator_name, gender, age)
     
     else:
         st.info("👈 左のサイドバーからデータセットを選択してください")
+    
+    get_metrics().record('render_annotation', time.perf_counter() - render_started, span_tags())
 
 st.markdown("---")
-st.caption("JVS強調アノテーションツール v1.5")
\ No newline at end of file
+st.caption("JVS強調アノテーションツール v1.5")
+
+# st.rerun() で途中終了した実行は記録されない
+get_metrics().record('rerun', time.perf_counter() - RUN_STARTED, span_tags())
+startup_info = get_startup_info()
+if startup_info['first_run'] is None:
+    # プロセスで最初に最後まで実行できたときのimportから表示までの時間
+    startup_info['first_run'] = time.perf_counter() - IMPORT_STARTED
\ No newline at end of file
@@ -0,0 +1,134 @@
+# asset_pack.py
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+# パックファイルの構成:
+#   MAGIC | 音声データ... | ヘッダー(JSON) | ヘッダーの位置(u64) | ヘッダーの長さ(u64) | MAGIC
+# 音声を書き終えてからヘッダーを書くので、作成中も全音声をメモリに載せずに済む
+MAGIC = b"JVSPACK1"
+FOOTER = struct.Struct("<QQ")
+
+
+class AssetPackError(Exception):
+    """パックファイルが壊れている・形式が違う"""
+
+
+class AssetPack:
+    """全データセットのマニフェストと音声をまとめたパックファイル（メモリマップで読む）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise AssetPackError("空のファイルです")
+        self._view = memoryview(self._mmap)
+
+        tail = len(MAGIC) + FOOTER.size
+        if len(self._mmap) < len(MAGIC) + tail or self._mmap[:len(MAGIC)] != MAGIC or self._mmap[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise AssetPackError(f"パックファイルではありません: {path}")
+        header_offset, header_length = FOOTER.unpack_from(self._mmap, len(self._mmap) - tail)
+        header = json.loads(bytes(self._view[header_offset:header_offset + header_length]).decode('utf-8'))
+
+        self.created_at = header.get('created_at')
+        self._datasets = header['datasets']
+        self._audio = header['audio']
+        self._by_sheet_url = {info['sheet_url']: name for name, info in self._datasets.items()}
+
+    def close(self):
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def dataset_names(self):
+        return list(self._datasets)
+
+    def manifest(self, sheet_url):
+        """SheetsのURLに対応するマニフェストの行（パックになければNone）"""
+        name = self._by_sheet_url.get(sheet_url)
+        if name is None:
+            return None
+        return self._datasets[name]['rows']
+
+    def has_audio(self, file_id):
+        return file_id in self._audio
+
+    def audio(self, file_id):
+        """音声データをコピーせずにmemoryviewで返す（パックになければNone）"""
+        entry = self._audio.get(file_id)
+        if entry is None:
+            return None
+        offset, length = entry['offset'], entry['length']
+        return self._view[offset:offset + length]
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'bytes': len(self._mmap),
+            'datasets': len(self._datasets),
+            'audio_files': len(self._audio),
+            'created_at': self.created_at,
+        }
+
+
+class AssetPackWriter:
+    """パックファイルを書き出す（一時ファイルに書いて完成後に置き換える）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(MAGIC)
+        self._datasets = {}
+        self._audio = {}
+
+    def add_dataset(self, name, sheet_url, rows):
+        self._datasets[name] = {'sheet_url': sheet_url, 'rows': rows}
+
+    def has_audio(self, file_id):
+        return file_id in self._audio
+
+    def add_audio(self, file_id, data):
+        if file_id in self._audio:
+            return
+        offset = self._file.tell()
+        self._file.write(data)
+        self._audio[file_id] = {
+            'offset': offset,
+            'length': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        }
+
+    def close(self):
+        header = json.dumps({
+            'version': 1,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'datasets': self._datasets,
+            'audio': self._audio,
+        }, ensure_ascii=False).encode('utf-8')
+        header_offset = self._file.tell()
+        self._file.write(header)
+        self._file.write(FOOTER.pack(header_offset, len(header)))
+        self._file.write(MAGIC)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
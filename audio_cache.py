@@ -0,0 +1,106 @@
+# audio_cache.py
+import os
+import threading
+from collections import OrderedDict
+
+
+class AudioCache:
+    """バイト数上限つきLRUの音声キャッシュ（ディスクにも保存して再起動後も再利用）"""
+
+    def __init__(self, max_bytes, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        # キーはDriveのファイルIDなのでそのままファイル名に使える
+        return os.path.join(self.cache_dir, f"{key}.bin")
+
+    def get(self, key):
+        """キャッシュから取得（メモリ → ディスクの順に探す）。なければNone"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, data)
+        return data
+
+    def put(self, key, data):
+        """キャッシュに登録（ディスクにも書き出す）"""
+        if not data:
+            return
+        self._write_disk(key, data)
+        with self._lock:
+            self._store(key, data)
+
+    def _store(self, key, data):
+        # ロックを取った状態で呼ぶこと
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        if len(data) > self.max_bytes:
+            # 上限より大きいものはディスクにだけ置く
+            return
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        # 書きかけのファイルを読まないよう一時ファイル経由で置き換える
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """ヒット・ミス・追い出しの回数と使用量を返す"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
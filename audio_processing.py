@@ -0,0 +1,110 @@
+# audio_processing.py
+import io
+import wave
+
+import numpy as np
+
+# 設定まわりは numpy を使わないので audio_settings に分けている（ここからもimportできる）
+from audio_settings import MIME_TYPES, AudioSettings, make_settings, soundfile_available  # noqa: F401
+
+
+def read_wav(data):
+    """WAVのbytesを float32 モノラルの配列とサンプリング周波数に変換"""
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"未対応のサンプル幅です: {width}")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+
+def frame_rms_db(samples, frame_length, hop_length):
+    """フレームごとのRMSをdBで返す"""
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame_length)[::hop_length]
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def trim_silence(samples, sample_rate, threshold_db=-40.0, pad_ms=100):
+    """最大音量から threshold_db 以上小さい区間を先頭・末尾から取り除く"""
+    frame_length = max(1, int(sample_rate * 0.025))
+    hop_length = max(1, int(sample_rate * 0.010))
+    levels = frame_rms_db(samples, frame_length, hop_length)
+    voiced = np.flatnonzero(levels >= levels.max() + threshold_db)
+    if len(voiced) == 0:
+        return samples
+    pad = int(sample_rate * pad_ms / 1000)
+    start = max(0, voiced[0] * hop_length - pad)
+    end = min(len(samples), voiced[-1] * hop_length + frame_length + pad)
+    return samples[start:end]
+
+
+def resample(samples, sample_rate, target_rate, taps=64):
+    """窓関数つきsincの低域通過フィルタをかけてから線形補間でリサンプリング"""
+    if target_rate <= 0 or target_rate == sample_rate or len(samples) == 0:
+        return samples
+    if target_rate < sample_rate:
+        # 折り返し雑音を防ぐため新しいナイキスト周波数で帯域制限する
+        cutoff = target_rate / sample_rate / 2.0
+        n = np.arange(taps) - (taps - 1) / 2.0
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+        kernel /= kernel.sum()
+        samples = np.convolve(samples, kernel, mode='same')
+    duration = len(samples) / sample_rate
+    target_length = max(1, int(round(duration * target_rate)))
+    positions = np.linspace(0, len(samples) - 1, target_length)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def encode(samples, sample_rate, fmt):
+    """float32の配列を指定の形式でエンコード"""
+    pcm = np.clip(samples, -1.0, 1.0)
+    if fmt == 'wav':
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes((pcm * 32767.0).astype('<i2').tobytes())
+        return output.getvalue()
+
+    import soundfile
+
+    output = io.BytesIO()
+    if fmt == 'flac':
+        soundfile.write(output, pcm, sample_rate, format='FLAC', subtype='PCM_16')
+    else:
+        soundfile.write(output, pcm, sample_rate, format='OGG', subtype='VORBIS')
+    return output.getvalue()
+
+
+def process_audio(data, settings):
+    """ダウンロードしたWAVを設定に従って加工し、ブラウザに送るbytesを返す"""
+    if not settings.enabled:
+        return data
+    samples, sample_rate = read_wav(data)
+    if settings.trim_silence:
+        samples = trim_silence(samples, sample_rate, settings.trim_db)
+    if settings.sample_rate:
+        samples = resample(samples, sample_rate, settings.sample_rate)
+        sample_rate = settings.sample_rate
+    return encode(samples, sample_rate, settings.format)
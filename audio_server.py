@@ -0,0 +1,211 @@
+# audio_server.py
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 音声のURLは中身のハッシュなので、同じURLの中身は変わらない（ブラウザは1回取得すればキャッシュを使い続ける）
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """Rangeヘッダーから [start, end) を返す（ヘッダーがない・複数範囲なら None、満たせない範囲なら ValueError）"""
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if match is None:
+        # 複数範囲などは全体を返す
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        raise ValueError(header)
+    if not first:
+        # 末尾から last バイト
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise ValueError(header)
+    return start, end
+
+
+class AudioServer:
+    """音声を中身のハッシュのURLで配信するHTTPサーバー（ETag・Cache-Control・Range に対応）
+
+    ブラウザに渡すのは URL だけなので、再実行のたびに音声のバイト列を送り直さない。
+    配信中の音声は max_bytes までハッシュ → バイト列で持っておき、シークのたびに読み込み・ハッシュ計算をしない。
+    あふれたものは load(元のURL) で音声キャッシュから取り出し直す（そのときだけハッシュを確かめる）。
+    """
+
+    def __init__(self, load, base_url, mime='audio/wav', max_bytes=32 * 1024 * 1024, detect_mime=None):
+        self._load = load
+        self.base_url = base_url.rstrip('/')
+        self.mime = mime
+        # detect_mime(バイト列) で音声ごとのMIMEタイプを決める（なければ全て mime）
+        self._detect_mime = detect_mime
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 元の音声のURL → ハッシュ / ハッシュ → 元の音声のURL
+        self._digests = {}
+        self._sources = {}
+        # ハッシュ → MIMEタイプ
+        self._mimes = {}
+        # ハッシュ → 中身（バイト数上限つきLRU）
+        self._data = OrderedDict()
+        self._size = 0
+        self._stats = {'requests': 0, 'not_modified': 0, 'partial': 0, 'not_found': 0, 'bytes_sent': 0, 'reloads': 0}
+        self._server = None
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def link(self, source):
+        """配信済みの音声ならそのURL（まだなら None）"""
+        with self._lock:
+            digest = self._digests.get(source)
+        return None if digest is None else f"{self.base_url}/audio/{digest}"
+
+    def add(self, source, data):
+        """音声のハッシュを登録して配信用のURLを返す"""
+        digest = self.digest(data)
+        with self._lock:
+            self._digests[source] = digest
+            self._sources[digest] = source
+            self._mimes[digest] = self._mime_of(data)
+            self._store(digest, data)
+        return f"{self.base_url}/audio/{digest}"
+
+    def _mime_of(self, data):
+        return self._detect_mime(data, self.mime) if self._detect_mime else self.mime
+
+    def content_type(self, digest):
+        """配信する音声のMIMEタイプ"""
+        with self._lock:
+            return self._mimes.get(digest, self.mime)
+
+    def _store(self, digest, data):
+        # ロックを取った状態で呼ぶこと
+        old = self._data.pop(digest, None)
+        if old is not None:
+            self._size -= len(old)
+        if len(data) > self.max_bytes:
+            return
+        self._data[digest] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'links': len(self._sources), 'cached': len(self._data), 'cached_bytes': self._size}
+
+    def _get(self, digest):
+        with self._lock:
+            data = self._data.get(digest)
+            if data is not None:
+                self._data.move_to_end(digest)
+                return data
+            source = self._sources.get(digest)
+            if source is None:
+                return None
+            self._stats['reloads'] += 1
+        data = self._load(source)
+        # 元の音声が差し替わっていたら、このURLの中身としては返せない
+        if not data or self.digest(data) != digest:
+            return None
+        with self._lock:
+            self._store(digest, data)
+        return data
+
+    def serve(self, port, host='127.0.0.1', allow_origin=None):
+        """/audio/<ハッシュ> で音声を返すHTTPサーバーを別スレッドで起動
+
+        既定ではこのマシンからしか繋がらない。別のマシンのブラウザから使うときは host を '0.0.0.0' などにする。
+        allow_origin はスクリプトから音声を読むページがあるときだけ指定する（<audio> の再生には要らない）。
+        """
+        if self._server is not None:
+            return self._server
+        audio_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Content-Lengthを必ず付けるので接続を使い回せる（シークのたびに接続し直さない）
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self):
+                self._respond(send_body=False)
+
+            def do_GET(self):
+                self._respond(send_body=True)
+
+            def _respond(self, send_body):
+                audio_server._count('requests')
+                parts = self.path.split('?')[0].strip('/').split('/')
+                data = audio_server._get(parts[1]) if len(parts) == 2 and parts[0] == 'audio' else None
+                if data is None:
+                    audio_server._count('not_found')
+                    self.send_error(404)
+                    return
+                etag = f'"{parts[1]}"'
+
+                if etag in self.headers.get('If-None-Match', ''):
+                    audio_server._count('not_modified')
+                    self.send_response(304)
+                    self._common_headers(etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                # If-Range が別のETagなら範囲を無視して全体を返す
+                if_range = self.headers.get('If-Range')
+                try:
+                    byte_range = parse_range(self.headers.get('Range'), len(data)) if not if_range or if_range == etag else None
+                except ValueError:
+                    self.send_response(416)
+                    self._common_headers(etag)
+                    self.send_header('Content-Range', f"bytes */{len(data)}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                if byte_range is None:
+                    start, end = 0, len(data)
+                    self.send_response(200)
+                else:
+                    start, end = byte_range
+                    audio_server._count('partial')
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{end - 1}/{len(data)}")
+                self._common_headers(etag)
+                self.send_header('Content-Type', audio_server.content_type(parts[1]))
+                self.send_header('Content-Length', str(end - start))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(memoryview(data)[start:end])
+                    audio_server._count('bytes_sent', end - start)
+
+            def _common_headers(self, etag):
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', CACHE_CONTROL)
+                self.send_header('Accept-Ranges', 'bytes')
+                if allow_origin:
+                    self.send_header('Access-Control-Allow-Origin', allow_origin)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="audio-server", daemon=True).start()
+        return self._server
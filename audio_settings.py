@@ -0,0 +1,62 @@
+# audio_settings.py
+from collections import namedtuple
+
+# 出力形式ごとのMIMEタイプ（raw はダウンロードしたWAVをそのまま使う）
+MIME_TYPES = {
+    'raw': 'audio/wav',
+    'wav': 'audio/wav',
+    'flac': 'audio/flac',
+    'ogg': 'audio/ogg',
+}
+
+# ファイルの先頭のバイト列 → MIMEタイプ
+MAGIC_MIME_TYPES = (
+    (b'RIFF', 'audio/wav'),
+    (b'fLaC', 'audio/flac'),
+    (b'OggS', 'audio/ogg'),
+)
+
+
+def audio_mime(data, default='audio/wav'):
+    """音声のバイト列の実際の形式のMIMEタイプ（加工に失敗して元のWAVのまま送るときも正しく付ける）"""
+    head = bytes(data[:4]) if data else b''
+    for magic, mime in MAGIC_MIME_TYPES:
+        if head == magic:
+            return mime
+    return default
+
+
+class AudioSettings(namedtuple('AudioSettings', ['format', 'sample_rate', 'trim_silence', 'trim_db'])):
+    """ブラウザに送る音声の加工設定（sample_rate が 0 なら元のまま）"""
+
+    @property
+    def enabled(self):
+        return self.format != 'raw'
+
+    @property
+    def mime(self):
+        return MIME_TYPES[self.format]
+
+    def cache_key(self):
+        """加工結果をキャッシュするときのキーの一部"""
+        trim = f"trim{int(self.trim_db)}" if self.trim_silence else "notrim"
+        return f"{self.format}-{self.sample_rate or 'orig'}-{trim}"
+
+
+def soundfile_available():
+    """FLAC・Ogg Vorbisのエンコードに使うsoundfileがインストールされているか"""
+    try:
+        import soundfile  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_settings(fmt='raw', sample_rate=0, trim_silence=False, trim_db=-40.0):
+    """設定値から AudioSettings を作る（soundfileがなければWAV出力に切り替える）"""
+    fmt = str(fmt).lower()
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"未対応の音声形式です: {fmt}")
+    if fmt in ('flac', 'ogg') and not soundfile_available():
+        fmt = 'wav'
+    return AudioSettings(fmt, int(sample_rate), bool(trim_silence), float(trim_db))
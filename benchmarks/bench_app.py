@@ -0,0 +1,202 @@
+# benchmarks/bench_app.py
+"""app.py をStreamlitのAppTestでヘッドレスに動かし、操作ごとの再実行時間を計測する
+
+Google Drive・Google Sheetsの代わりにローカルのスタブサーバー（stub_servers.py）を使う。
+
+使い方:
+    python benchmarks/bench_app.py [--annotators 4] [--items 10] [--latency-ms 50] [--error-rate 0.02]
+                                   [--output bench.json]
+
+結果はJSONで出力する（--output を省略すると標準出力）。
+AppTestはカスタムコンポーネントの操作とフラグメント単位の再実行に対応していないため、
+文字の選択・範囲選択は session_state を書き換えてページ全体を再実行した時間になる（実際より重い側に出る）。
+また AppTest は同じプロセスで同時にスクリプトを実行できないため、複数人の計測ではスクリプトの実行を
+順番に行い（待ち時間は計測に含めない）、先読み・Sheetsへの送信などのバックグラウンド処理だけが並行して動く。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import sheets_writer  # noqa: E402
+from datasets import SHEET_URLS  # noqa: E402
+from stub_servers import StubServer, StubWorksheet  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, 'app.py')
+
+# AppTestのスクリプト実行は同時に1つまで
+RUN_LOCK = threading.Lock()
+DATASET = next(iter(SHEET_URLS))
+
+
+def configure(stub_url, work_dir, args):
+    """アプリの設定をスタブサーバー・一時ディレクトリに向ける"""
+    os.environ.update({
+        'JVS_DRIVE_DOWNLOAD_URL': f"{stub_url}/drive?id={{file_id}}",
+        'JVS_SHEETS_EXPORT_URL': f"{stub_url}/sheets/{{sheet_id}}/export?gid={{gid}}",
+        'JVS_JOURNAL_PATH': os.path.join(work_dir, 'journal.sqlite3'),
+        'JVS_AUDIO_CACHE_DIR': os.path.join(work_dir, 'audio_cache'),
+        'JVS_EXPORT_CACHE_DIR': os.path.join(work_dir, 'export_cache'),
+        'JVS_ASSET_PACK_PATH': os.path.join(work_dir, 'no_asset_pack.jvspack'),
+        'JVS_SHEETS_FLUSH_INTERVAL': str(args.flush_interval),
+        'JVS_DRIVE_RETRIES': str(args.retries),
+    })
+    # gspreadの代わりにスタブサーバーへ書き込むワークシートを使う
+    sheets_writer.open_results_worksheet = lambda *_args, **_kwargs: StubWorksheet(stub_url)
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def timed(self, name, action):
+        with RUN_LOCK:
+            started = time.perf_counter()
+            at = action()
+            elapsed = time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].value}")
+        with self._lock:
+            self.samples.setdefault(name, []).append(elapsed)
+        return at
+
+    def summary(self):
+        result = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            result[name] = {
+                'n': len(values),
+                'mean_ms': round(statistics.mean(values) * 1000, 2),
+                'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                'max_ms': round(ordered[-1] * 1000, 2),
+            }
+        return result
+
+
+def new_session(name):
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.secrets['gcp_service_account'] = {}
+    at.session_state.page = 'annotation'
+    at.session_state.annotator_name = name
+    at.session_state.gender = '選択しない'
+    at.session_state.age = 30
+    return at
+
+
+def find_button(buttons, predicate):
+    return next(button for button in buttons if predicate(button.label))
+
+
+def run_session(name, items, recorder):
+    """1人分のアノテーション作業（データセット読み込み → 選択 → 保存 を items 回 → エクスポート）"""
+    at = new_session(name)
+    with RUN_LOCK:
+        at.run()
+    recorder.timed('dataset_load', lambda: find_button(at.sidebar.button, lambda label: label == DATASET).click().run())
+    saves = 0
+    for _ in range(items):
+        if at.session_state.current_idx >= len(at.session_state.data):
+            break
+
+        def toggle():
+            at.session_state.selected_words = {0}
+            return at.run()
+
+        def select_range():
+            at.session_state.selected_words = {0, 1, 2, 3}
+            return at.run()
+
+        recorder.timed('character_toggle', toggle)
+        recorder.timed('range_select', select_range)
+        recorder.timed('save_and_next', lambda: find_button(at.button, lambda label: label.startswith('💾')).click().run())
+        saves += 1
+    at.selectbox(key='export_format').set_value('csv')
+    recorder.timed('export', lambda: find_button(at.sidebar.button, lambda label: label.startswith('📊')).click().run())
+    return saves
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--annotators', type=int, default=4, help="同時に作業するアノテーターの数")
+    parser.add_argument('--items', type=int, default=10, help="1人あたりに保存する件数")
+    parser.add_argument('--dataset-items', type=int, default=100, help="スタブのデータセットの件数")
+    parser.add_argument('--clip-seconds', type=float, default=4.0)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="スタブサーバーの応答遅延")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="スタブサーバーが503を返す割合")
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--output', help="結果のJSONを書き出すファイル")
+    args = parser.parse_args()
+
+    stub = StubServer(args.dataset_items, args.clip_seconds, args.latency_ms, args.error_rate).start()
+    work_dir = tempfile.mkdtemp(prefix='jvs_bench_')
+    configure(stub.url, work_dir, args)
+
+    # 1人だけで動かしてセッションあたりのメモリのピークを測る（キャッシュの温まりも兼ねる）
+    single = Recorder()
+    tracemalloc.start()
+    run_session('bench-single', args.items, single)
+    _, peak_single = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 複数人で同時に作業したときのスループット
+    concurrent = Recorder()
+    saves = [0] * args.annotators
+    errors = []
+
+    def worker(i):
+        try:
+            saves[i] = run_session(f"bench-{i}", args.items, concurrent)
+        except Exception as e:
+            errors.append(f"bench-{i}: {e}")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.annotators)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    report = {
+        'config': vars(args),
+        'single_session': {
+            'interactions': single.summary(),
+            'peak_memory_bytes': peak_single,
+        },
+        'concurrent': {
+            'interactions': concurrent.summary(),
+            'annotators': args.annotators,
+            'saves': sum(saves),
+            'wall_seconds': round(wall, 3),
+            'saves_per_second': round(sum(saves) / wall, 3) if wall else None,
+            'errors': errors,
+        },
+        'stub': stub.stats(),
+    }
+    stub.stop()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
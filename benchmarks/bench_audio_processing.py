@@ -0,0 +1,97 @@
+# benchmarks/bench_audio_processing.py
+"""ブラウザに送る音声の加工（無音除去・リサンプリング・圧縮）を元のWAVと比較するベンチマーク
+
+使い方:
+    python benchmarks/bench_audio_processing.py [WAVファイル ...] [--bandwidth-kbps 1000]
+
+WAVを指定しなければ JVS と同じ 24kHz/16bit の合成音声で計測する。
+再生開始までの時間は「加工時間（初回のみ）＋ 指定帯域での転送時間」として見積もる。
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_processing import make_settings, process_audio  # noqa: E402
+
+SETTING_GRID = [
+    dict(fmt='wav', sample_rate=0, trim_silence=True),
+    dict(fmt='wav', sample_rate=16000, trim_silence=True),
+    dict(fmt='flac', sample_rate=16000, trim_silence=True),
+    dict(fmt='ogg', sample_rate=16000, trim_silence=True),
+]
+
+
+def synthetic_wav(seconds=4.0, sample_rate=24000):
+    """前後に無音のある、音声に似た合成WAV（24kHz/16bit）"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 150 + 40 * np.sin(2 * np.pi * 0.7 * t)
+    voice = 0.3 * np.sin(2 * np.pi * np.cumsum(pitch) / sample_rate)
+    voice *= (np.sin(2 * np.pi * 4 * t) > -0.3)
+    voice[(t < 0.6) | (t > seconds - 0.8)] = 0.0
+    voice += np.random.default_rng(0).normal(0, 0.002, len(t))
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.clip(voice, -1, 1) * 32767).astype('<i2').tobytes())
+    return output.getvalue()
+
+
+def bench(raw, settings, bandwidth_bps, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        processed = process_audio(raw, settings)
+        times.append(time.perf_counter() - started)
+    processing = sorted(times)[len(times) // 2]
+    return {
+        'settings': settings._asdict(),
+        'bytes': len(processed),
+        'ratio': round(len(processed) / len(raw), 4),
+        'processing_ms': round(processing * 1000, 2),
+        'first_play_cold_ms': round((processing + len(processed) * 8 / bandwidth_bps) * 1000, 1),
+        'first_play_cached_ms': round(len(processed) * 8 / bandwidth_bps * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('wav_files', nargs='*')
+    parser.add_argument('--bandwidth-kbps', type=float, default=1000.0, help="想定する回線速度（kbps）")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    bandwidth_bps = args.bandwidth_kbps * 1000
+    sources = [(path, open(path, 'rb').read()) for path in args.wav_files] or [('synthetic', synthetic_wav())]
+
+    results = []
+    for name, raw in sources:
+        entry = {
+            'source': name,
+            'raw_bytes': len(raw),
+            'raw_first_play_ms': round(len(raw) * 8 / bandwidth_bps * 1000, 1),
+            'variants': [],
+        }
+        for grid in SETTING_GRID:
+            settings = make_settings(**grid)
+            if settings.format != grid['fmt']:
+                # soundfileがない環境ではWAVにフォールバックするので計測しない
+                continue
+            entry['variants'].append(bench(raw, settings, bandwidth_bps, args.repeat))
+        results.append(entry)
+
+    json.dump({'bandwidth_kbps': args.bandwidth_kbps, 'results': results}, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
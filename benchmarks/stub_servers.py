@@ -0,0 +1,193 @@
+# benchmarks/stub_servers.py
+"""ベンチマーク用のGoogle Drive・Google Sheetsのスタブサーバー
+
+1つのHTTPサーバーで次のエンドポイントを提供する（遅延とエラー率は設定可能）:
+    GET  /drive?id=<file_id>              合成した24kHz/16bitのWAV
+    GET  /sheets/<sheet_id>/export        データセットのCSV（filename, speaker, text, audioUrl）
+    GET  /results/values                  '全結果'シートの全ての値（JSON）
+    POST /results/append                  '全結果'シートへの行の追加（JSON、追加した範囲を返す）
+    POST /results/update                  '全結果'シートの行の書き換え（batch_update と同じ形のJSON）
+"""
+import io
+import json
+import random
+import re
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+SAMPLE_TEXTS = [
+    "また東寺のように五大明王と呼ばれる主要な明王の中央に配されることも多い",
+    "ニューイングランド風は牛乳をベースとした白いクリームスープでありボストンクラムチャウダーとも呼ばれる",
+    "今日はいい天気ですね",
+    "子供たちは公園で元気に遊んでいた",
+]
+
+
+def synthetic_wav(seconds, sample_rate=24000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 120 + 60 * rng.random() + 30 * np.sin(2 * np.pi * 0.5 * t)
+    voice = 0.3 * np.sin(2 * np.pi * np.cumsum(pitch) / sample_rate) + rng.normal(0, 0.01, len(t))
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.clip(voice, -1, 1) * 32767).astype('<i2').tobytes())
+    return output.getvalue()
+
+
+class StubState:
+    def __init__(self, items, clip_seconds, latency_ms, error_rate, seed):
+        self.items = items
+        self.clip_seconds = clip_seconds
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.result_rows = []
+        self.requests = {}
+        self.errors = 0
+        self._audio = {}
+
+    def audio(self, file_id):
+        with self.lock:
+            if file_id not in self._audio:
+                self._audio[file_id] = synthetic_wav(self.clip_seconds, seed=len(self._audio))
+            return self._audio[file_id]
+
+    def manifest_csv(self, sheet_id):
+        lines = ["filename,speaker,text,audioUrl"]
+        for i in range(self.items):
+            text = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+            lines.append(
+                f"{sheet_id[:6]}_{i:03d},jvs{i % 100 + 1:03d},{text},"
+                f"https://drive.google.com/file/d/{sheet_id}_{i:03d}/view"
+            )
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _begin(self, route):
+        state = self.state
+        with state.lock:
+            state.requests[route] = state.requests.get(route, 0) + 1
+            fail = state.random.random() < state.error_rate
+            if fail:
+                state.errors += 1
+        if state.latency_ms:
+            time.sleep(state.latency_ms / 1000.0)
+        if fail:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        return not fail
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/drive':
+            if self._begin('drive'):
+                self._send(self.state.audio(parse_qs(url.query)['id'][0]), 'audio/wav')
+        elif url.path.startswith('/sheets/') and url.path.endswith('/export'):
+            if self._begin('sheets_export'):
+                self._send(self.state.manifest_csv(url.path.split('/')[2]), 'text/csv')
+        elif url.path == '/results/values':
+            if self._begin('results_values'):
+                with self.state.lock:
+                    body = json.dumps(self.state.result_rows, ensure_ascii=False).encode('utf-8')
+                self._send(body, 'application/json')
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path not in ('/results/append', '/results/update'):
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/results/update':
+            if self._begin('results_update'):
+                with self.state.lock:
+                    for update in json.loads(body):
+                        row_number = int(re.match(r'[A-Z]+(\d+)', update['range']).group(1))
+                        self.state.result_rows[row_number - 1] = update['values'][0]
+                self._send(b'{}', 'application/json')
+        elif self._begin('results_append'):
+            rows = json.loads(body)
+            with self.state.lock:
+                start = len(self.state.result_rows) + 1
+                self.state.result_rows.extend(rows)
+                end = len(self.state.result_rows)
+            response = {'updates': {'updatedRange': f"'全結果'!A{start}:L{end}", 'updatedRows': len(rows)}}
+            self._send(json.dumps(response, ensure_ascii=False).encode('utf-8'), 'application/json')
+
+
+class StubServer:
+    """スタブサーバーを別スレッドで起動する"""
+
+    def __init__(self, items=100, clip_seconds=4.0, latency_ms=0, error_rate=0.0, seed=0):
+        self.state = StubState(items, clip_seconds, latency_ms, error_rate, seed)
+        handler = type('Handler', (StubHandler,), {'state': self.state})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self.state.lock:
+            return {'requests': dict(self.state.requests), 'errors': self.state.errors,
+                    'result_rows': len(self.state.result_rows)}
+
+
+class StubWorksheet:
+    """gspreadのワークシートの代わりにスタブサーバーへ書き込む"""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url
+        self._session = requests.Session()
+
+    def append_rows(self, rows):
+        response = self._session.post(f"{self.base_url}/results/append", data=json.dumps(rows), timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def batch_update(self, data, **_kwargs):
+        response = self._session.post(f"{self.base_url}/results/update", data=json.dumps(data), timeout=30)
+        response.raise_for_status()
+
+    def append_row(self, row):
+        self.append_rows([row])
+
+    def get_all_values(self):
+        response = self._session.get(f"{self.base_url}/results/values", timeout=30)
+        response.raise_for_status()
+        return response.json()
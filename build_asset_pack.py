@@ -0,0 +1,77 @@
+# build_asset_pack.py
+"""全データセットのマニフェストと音声を1つのパックファイルにまとめる
+
+使い方:
+    python build_asset_pack.py [--output asset_pack.jvspack] [--datasets JVS① JVS②] [--workers 8]
+
+アプリは起動時にパックファイルがあればメモリマップで読み込み、
+パックにないデータセット・音声だけをネットワークから取得する。
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from asset_pack import AssetPackWriter
+from datasets import SHEET_URLS, audio_url_of, sheet_csv_url
+from drive_client import DriveClient, DriveDownloadError, extract_drive_file_id
+from manifest_store import Manifest
+
+
+def fetch_manifest_rows(sheet_url):
+    """SheetsのCSVエクスポートからマニフェストの行を取得"""
+    response = requests.get(sheet_csv_url(sheet_url), timeout=30)
+    response.raise_for_status()
+    return [row.to_dict() for row in Manifest.from_csv(response.content)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='asset_pack.jvspack', help="出力するパックファイル")
+    parser.add_argument('--datasets', nargs='*', default=list(SHEET_URLS), help="含めるデータセット名")
+    parser.add_argument('--workers', type=int, default=8, help="音声を並列にダウンロードする数")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.datasets if name not in SHEET_URLS]
+    if unknown:
+        parser.error(f"未知のデータセットです: {', '.join(unknown)}")
+
+    writer = AssetPackWriter(args.output)
+    client = DriveClient(pool_size=args.workers)
+    failed = []
+    try:
+        audio_urls = {}
+        for name in args.datasets:
+            rows = fetch_manifest_rows(SHEET_URLS[name])
+            writer.add_dataset(name, SHEET_URLS[name], rows)
+            print(f"{name}: {len(rows)}件", file=sys.stderr)
+            for row in rows:
+                audio_url = audio_url_of(row)
+                file_id = extract_drive_file_id(audio_url) if audio_url else None
+                if file_id:
+                    audio_urls[file_id] = audio_url
+
+        # ダウンロードは並列、書き込みはこのスレッドだけで順番に行う
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(client.fetch, url): file_id for file_id, url in audio_urls.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                file_id = futures[future]
+                try:
+                    writer.add_audio(file_id, future.result())
+                except DriveDownloadError as e:
+                    failed.append(file_id)
+                    print(f"  失敗: {file_id}: {e}", file=sys.stderr)
+                if done % 50 == 0 or done == len(futures):
+                    print(f"  音声 {done}/{len(futures)}", file=sys.stderr)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+    print(f"{args.output} を作成しました（音声 {len(audio_urls) - len(failed)}件、失敗 {len(failed)}件）", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
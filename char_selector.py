@@ -0,0 +1,26 @@
+# char_selector.py
+import os
+
+import streamlit.components.v1 as components
+
+_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "char_selector")
+_char_selector = components.declare_component("char_selector", path=_COMPONENT_DIR)
+
+
+def char_selector(tokens, selected, item_key, suggested=(), key=None):
+    """文字の選択UI（クリック・範囲選択はブラウザ内で処理し、選択が変わったときだけ値を返す）
+
+    suggested のトークンは強調の候補として点線で囲む（選択はしない）。
+    まだ一度も選択が変わっていなければNoneを返す。
+    """
+    value = _char_selector(
+        tokens=list(tokens),
+        selected=sorted(selected),
+        suggested=sorted(suggested),
+        item_key=item_key,
+        key=key,
+        default=None,
+    )
+    if value is None:
+        return None
+    return set(value)
@@ -0,0 +1,161 @@
+# completion_index.py
+import threading
+import time
+from collections import Counter
+
+from results_store import parse_indices
+from sheets_writer import RESULT_COLUMNS
+
+ANNOTATOR_COL = RESULT_COLUMNS.index('annotator')
+DATASET_COL = RESULT_COLUMNS.index('dataset')
+FILENAME_COL = RESULT_COLUMNS.index('filename')
+INDICES_COL = RESULT_COLUMNS.index('emphasized_indices')
+
+
+def completion_key(annotator, dataset, filename):
+    """索引のキー（名前の前後の空白は無視する）"""
+    return (str(annotator).strip(), str(dataset), str(filename))
+
+
+def row_indices(row):
+    """行に保存された強調の文字の位置（列がない・読めなければNone）"""
+    if len(row) <= INDICES_COL:
+        return None
+    indices = parse_indices(row[INDICES_COL])
+    return None if indices is None else tuple(indices)
+
+
+class CompletionIndex:
+    """保存済みの (アノテーター, データセット, ファイル名) を引ける索引（プロセスに1つ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # キー → '全結果'シートの行番号（まだ送信されていない行はNone）
+        self._rows = {}
+        # キー → ジャーナルID（このサーバーのジャーナルに記録した行だけ）
+        self._entries = {}
+        # キー → 保存した強調の文字の位置（分からなければNone）
+        self._indices = {}
+        self._counts = Counter()
+
+    @classmethod
+    def from_writer(cls, writer):
+        """'全結果'シートとジャーナルから索引を作る（シートを読めなければ例外）"""
+        index = cls()
+        # シートは1回だけ一括で読み込み、以降は保存のたびに索引へ追加する
+        index.load_sheet_rows(writer.read_all_values())
+        # まだシートに送信されていない行も保存済みとして扱う（修正のときはジャーナルIDから送信待ちの行を探す）
+        index.load_journal_rows(writer.journal.all_rows())
+        # 送信待ちの書き換えがあれば、修正で読み込む選択はそちらの方が新しい
+        index.load_journal_updates(writer.journal.unflushed_update_rows())
+        return index
+
+    def load_sheet_rows(self, values):
+        """シートを一括で読み込んだ結果（ヘッダー行つき）から索引を作る"""
+        with self._lock:
+            for row_number, row in enumerate(values, start=1):
+                if len(row) <= FILENAME_COL or row[ANNOTATOR_COL] == RESULT_COLUMNS[ANNOTATOR_COL]:
+                    continue
+                key = completion_key(row[ANNOTATOR_COL], row[DATASET_COL], row[FILENAME_COL])
+                self._add(key, row_number)
+                # 同じキーの行が複数あれば後の行
+                self._indices[key] = row_indices(row)
+
+    def load_journal_rows(self, entries):
+        """ジャーナルの (ジャーナルID, 行) を索引に加える（シート上の位置はシートを読んだ結果を使う）"""
+        with self._lock:
+            for entry_id, row in entries:
+                key = completion_key(row[ANNOTATOR_COL], row[DATASET_COL], row[FILENAME_COL])
+                self._add(key, None)
+                self._entries[key] = entry_id
+                # 送信済みの行はシートの方が新しい（後から書き換えられていることがある）
+                if key not in self._indices:
+                    self._indices[key] = row_indices(row)
+
+    def load_journal_updates(self, rows):
+        """まだシートに送信されていない書き換えの行（古い順）で、保存した強調の位置を新しくする"""
+        with self._lock:
+            for row in rows:
+                key = completion_key(row[ANNOTATOR_COL], row[DATASET_COL], row[FILENAME_COL])
+                if key in self._rows:
+                    self._indices[key] = row_indices(row)
+
+    def add(self, annotator, dataset, filename, row_number=None, entry_id=None, indices=None):
+        """保存した行を索引に加える（indices は保存した強調の文字の位置）"""
+        with self._lock:
+            key = completion_key(annotator, dataset, filename)
+            self._add(key, row_number)
+            if entry_id is not None:
+                self._entries[key] = entry_id
+            self._indices[key] = None if indices is None else tuple(sorted(indices))
+
+    def location(self, annotator, dataset, filename):
+        """保存済みの行の (シートの行番号, ジャーナルID)（分からないものはNone）"""
+        key = completion_key(annotator, dataset, filename)
+        with self._lock:
+            return self._rows.get(key), self._entries.get(key)
+
+    def saved_indices(self, annotator, dataset, filename):
+        """保存済みの行の強調の文字の位置（保存していない・分からなければNone）"""
+        with self._lock:
+            return self._indices.get(completion_key(annotator, dataset, filename))
+
+    def _add(self, key, row_number):
+        # ロックを取った状態で呼ぶこと
+        if key not in self._rows:
+            self._counts[key[:2]] += 1
+        if row_number is not None or key not in self._rows:
+            self._rows[key] = row_number
+
+    def keys(self):
+        """保存済みの (アノテーター, データセット, ファイル名) の一覧"""
+        with self._lock:
+            return list(self._rows)
+
+    def is_done(self, annotator, dataset, filename):
+        return completion_key(annotator, dataset, filename) in self._rows
+
+    def count(self, annotator, dataset):
+        """このアノテーターがデータセット内で保存済みの件数"""
+        return self._counts[(str(annotator).strip(), str(dataset))]
+
+    def first_unannotated(self, annotator, dataset, filenames):
+        """まだ保存していない最初のアイテムの位置（全て保存済みなら件数）"""
+        total = 0
+        for position, filename in enumerate(filenames):
+            if completion_key(annotator, dataset, filename) not in self._rows:
+                return position
+            total = position + 1
+        return total
+
+
+class IndexSlot:
+    """作った索引を持っておく場所（作るのに失敗したら持たずに、retry_seconds 後の呼び出しで作り直す）
+
+    シートを読めなかった索引を持ち続けると、保存済みのアイテムを未保存として扱い、同じ行を追記してしまう。
+    """
+
+    def __init__(self, build, retry_seconds=30):
+        self._build = build
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._index = None
+        self._error = None
+        self._retry_at = 0.0
+
+    def get(self, now=None):
+        """索引を返す（作れなければ例外。待っている間は前回の例外をすぐに返す）"""
+        with self._lock:
+            if self._index is not None:
+                return self._index
+            now = time.time() if now is None else now
+            if self._error is not None and now < self._retry_at:
+                raise self._error
+            try:
+                self._index = self._build()
+            except Exception as e:
+                self._error = e
+                self._retry_at = now + self.retry_seconds
+                raise
+            self._error = None
+            return self._index
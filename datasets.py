@@ -0,0 +1,30 @@
+# datasets.py
+
+# 事前定義されたデータセット（Google SheetsのURL）
+SHEET_URLS = {
+    "JVS①": "https://docs.google.com/spreadsheets/d/19QldMsTxmGg_A1iDoukKk2Nqul-MfN1VPHt5lpNFW9M/edit?usp=sharing",
+    "JVS②": "https://docs.google.com/spreadsheets/d/1eR4I4oa3vhz_6FToVIbFT2vGsYBMx-kpfiNQHDx4C5c/edit?usp=sharing",
+    "JVS③": "https://docs.google.com/spreadsheets/d/1TVBEF8txyznZapG4mt5IeLSM7laORdr3eJkCjVLaH2U/edit?usp=sharing",
+    "JVS④": "https://docs.google.com/spreadsheets/d/1Jr7lnAkAdCrQ8qcHvyOznm-usx8aIFawjWjvDh_fOko/edit?usp=sharing",
+    "JVS⑤": "https://docs.google.com/spreadsheets/d/19-WiHrWYTBzzOO6Vime4RFtc9kiYF7IrzOSnOE-A19E/edit?usp=sharing"
+}
+
+
+# CSVエクスポート用のURL（ベンチマークではローカルのスタブサーバーに差し替える）
+SHEETS_EXPORT_URL = "https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+
+
+def sheet_csv_url(sheet_url, export_url=SHEETS_EXPORT_URL):
+    """Google SheetsのURLをCSVエクスポートのURLに変換（Sheets以外のURLならNone）"""
+    if 'docs.google.com/spreadsheets' not in sheet_url:
+        return None
+    sheet_id = sheet_url.split('/d/')[1].split('/')[0]
+    gid = '0'
+    if 'gid=' in sheet_url:
+        gid = sheet_url.split('gid=')[1].split('&')[0]
+    return export_url.format(sheet_id=sheet_id, gid=gid)
+
+
+def audio_url_of(item):
+    """マニフェストの1行から音声のURLを取得"""
+    return item.get('audioUrl') or item.get('audio_url')
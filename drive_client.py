@@ -0,0 +1,130 @@
+# drive_client.py
+import hashlib
+import re
+
+# 直接ダウンロード用のURL（ベンチマークではローカルのスタブサーバーに差し替える）
+DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc?export=download&id={file_id}"
+
+# 一時的なエラーとして再試行するHTTPステータス
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class DriveDownloadError(Exception):
+    """Google Driveからのダウンロードに失敗した"""
+
+
+# Google DriveのURLからファイルIDを取り出す
+def extract_drive_file_id(url):
+    """Google DriveのURLからファイルIDを取得（見つからなければNone）"""
+    patterns = [
+        r'drive\.google\.com/file/d/([a-zA-Z0-9_-]+)',
+        r'drive\.google\.com/open\?id=([a-zA-Z0-9_-]+)',
+        r'id=([a-zA-Z0-9_-]+)'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+
+    return None
+
+# Google Drive URLを直接ダウンロードURLに変換
+def convert_drive_url(url, download_url=DRIVE_DOWNLOAD_URL):
+    """Google DriveのURLを直接ダウンロード可能なURLに変換"""
+    file_id = extract_drive_file_id(url)
+    if file_id:
+        return download_url.format(file_id=file_id)
+
+    return url
+
+
+class DriveClient:
+    """接続プール・タイムアウト・再試行つきのGoogle Driveダウンロードクライアント"""
+
+    def __init__(self, pool_size=10, connect_timeout=5.0, read_timeout=30.0,
+                 retries=3, backoff=0.5, chunk_size=64 * 1024, download_url=DRIVE_DOWNLOAD_URL):
+        # requestsは起動を遅くしないよう、最初のダウンロードでクライアントを作るときにimportする
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.download_url = download_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.chunk_size = chunk_size
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch(self, drive_url, expected_size=None, expected_sha256=None):
+        """音声ファイルをダウンロードしてbytesで返す（失敗時はDriveDownloadError）"""
+        import requests
+
+        download_url = convert_drive_url(drive_url, self.download_url)
+        try:
+            response = self.session.get(download_url, stream=True, timeout=self.timeout)
+            # ウイルススキャン警告ページは本文を読まずにヘッダーとCookieで判定する
+            if self._is_confirm_page(response):
+                token = self._confirm_token(response)
+                response.close()
+                response = self.session.get(
+                    download_url, params={'confirm': token}, stream=True, timeout=self.timeout
+                )
+                if self._is_confirm_page(response):
+                    response.close()
+                    raise DriveDownloadError("ダウンロード確認ページを通過できませんでした")
+        except requests.RequestException as e:
+            raise DriveDownloadError(str(e)) from e
+
+        try:
+            if response.status_code != 200:
+                raise DriveDownloadError(f"HTTP {response.status_code}")
+            return self._read_body(response, expected_size, expected_sha256)
+        except requests.RequestException as e:
+            raise DriveDownloadError(str(e)) from e
+        finally:
+            response.close()
+
+    @staticmethod
+    def _is_confirm_page(response):
+        content_type = response.headers.get('Content-Type', '')
+        if content_type.startswith('text/html'):
+            return True
+        return any(key.startswith('download_warning') for key in response.cookies.keys())
+
+    @staticmethod
+    def _confirm_token(response):
+        for key, value in response.cookies.items():
+            if key.startswith('download_warning'):
+                return value
+        # 新しい確認ページはCookieを返さないが confirm=t で通過できる
+        return 't'
+
+    def _read_body(self, response, expected_size, expected_sha256):
+        # 圧縮転送の場合Content-Lengthは展開後のサイズと一致しないので使わない
+        content_length = response.headers.get('Content-Length')
+        encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+        if expected_size is None and not encoded and content_length and content_length.isdigit():
+            expected_size = int(content_length)
+
+        digest = hashlib.sha256() if expected_sha256 else None
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            body.extend(chunk)
+            if digest is not None:
+                digest.update(chunk)
+
+        if expected_size is not None and len(body) != expected_size:
+            raise DriveDownloadError(f"サイズが一致しません（期待値 {expected_size}、実際 {len(body)}）")
+        if digest is not None and digest.hexdigest() != expected_sha256.lower():
+            raise DriveDownloadError("チェックサムが一致しません")
+        return bytes(body)
@@ -0,0 +1,195 @@
+# export.py
+import csv
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+from itertools import islice
+
+from sheets_writer import RESULT_COLUMNS
+
+# 出力形式ごとの拡張子とMIMEタイプ
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# 列幅を決めるときに見る行数（全行を走査しない）
+WIDTH_SAMPLE_ROWS = 200
+
+
+def parquet_available():
+    """Parquetの書き出しに使うpyarrowがインストールされているか（重いのでここではimportしない）"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or parquet_available()]
+
+
+def write_xlsx(rows, path, columns=RESULT_COLUMNS):
+    """write-onlyモードのopenpyxlで1行ずつ書き出す"""
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    rows = iter(rows)
+    head = list(islice(rows, WIDTH_SAMPLE_ROWS))
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Annotations')
+    # write-onlyモードでは列幅を行より先に設定する必要がある
+    for idx, column in enumerate(columns):
+        max_length = max([len(column)] + [len(str(row[idx])) for row in head if idx < len(row)])
+        worksheet.column_dimensions[get_column_letter(idx + 1)].width = min(max_length + 2, 50)
+
+    worksheet.append(list(columns))
+    for row in head:
+        worksheet.append(list(row))
+    for row in rows:
+        worksheet.append(list(row))
+    workbook.save(path)
+
+
+def write_csv(rows, path, columns=RESULT_COLUMNS, append=False):
+    """CSVに書き出す（append=Trueなら既存のファイルの末尾に行を足す）"""
+    if append:
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
+        return
+    # Excelで文字化けしないようBOMつきUTF-8にする
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def _parquet_value(column, value):
+    if value is None or value == '':
+        return None
+    if column == 'age':
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if column == 'has_emphasis':
+        return value if isinstance(value, bool) else str(value) == 'True'
+    return str(value)
+
+
+def write_parquet(rows, path, columns=RESULT_COLUMNS, batch_size=5000):
+    """行グループごとにParquetへ書き出す（一度に持つのはbatch_size行まで）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (column, pa.int64() if column == 'age' else pa.bool_() if column == 'has_emphasis' else pa.string())
+        for column in columns
+    ])
+    rows = iter(rows)
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            arrays = [
+                pa.array([_parquet_value(column, row[idx]) for row in batch], type=schema.field(idx).type)
+                for idx, column in enumerate(columns)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def _update_digest(digest, rows):
+    for row in rows:
+        digest.update(json.dumps(list(row), ensure_ascii=False, default=str).encode('utf-8'))
+        digest.update(b'\n')
+    return digest
+
+
+class ExportCache:
+    """作成したエクスポートファイルをディスクに残し、増えた行の分だけ作り直す
+
+    source_key が session_prefix で始まるファイルはセッションごとに作られるので、
+    session_max_age 秒より古いものは次にエクスポートするときに消す。
+    """
+
+    def __init__(self, cache_dir, session_prefix='session-', session_max_age=24 * 3600):
+        self.cache_dir = cache_dir
+        self.session_prefix = session_prefix
+        self.session_max_age = session_max_age
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.prune()
+
+    def prune(self, now=None):
+        """古いセッションごとのファイルを消して、消したファイル数を返す"""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                if not name.startswith(self.session_prefix):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > self.session_max_age:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _paths(self, source_key, fmt):
+        safe_key = ''.join(c if c.isalnum() or c in '-_' else '_' for c in source_key)
+        base = os.path.join(self.cache_dir, f"{safe_key}.{EXPORT_FORMATS[fmt][0]}")
+        return base, f"{base}.meta.json"
+
+    def export(self, source_key, fmt, rows, revision=0):
+        """rowsをfmt形式で書き出したファイルのパスを返す
+
+        前回と同じrevisionで、前回書き出した行が今回の先頭にそのまま並んでいる（ハッシュが一致する）ときだけ
+        CSVは増えた行だけを追記し、行数も同じならファイルをそのまま使う。
+        行の順番が変わった・途中の行が変わったときは作り直す。
+        """
+        self.prune()
+        path, meta_path = self._paths(source_key, fmt)
+        with self._lock:
+            meta = self._read_meta(meta_path)
+            previous_rows = meta.get('rows', 0)
+            digest = hashlib.sha256()
+            cached = (
+                os.path.exists(path)
+                and meta.get('revision') == revision
+                and previous_rows <= len(rows)
+                and _update_digest(digest, islice(rows, previous_rows)).hexdigest() == meta.get('digest')
+            )
+            if cached and previous_rows == len(rows):
+                return path
+            if not cached:
+                # 先頭から数え直す
+                digest = hashlib.sha256()
+                previous_rows = 0
+            _update_digest(digest, islice(rows, previous_rows, None))
+            if cached and fmt == 'csv':
+                write_csv(islice(rows, previous_rows, None), path, append=True)
+            else:
+                tmp_path = f"{path}.tmp"
+                if fmt == 'xlsx':
+                    write_xlsx(rows, tmp_path)
+                elif fmt == 'csv':
+                    write_csv(rows, tmp_path)
+                else:
+                    write_parquet(rows, tmp_path)
+                os.replace(tmp_path, path)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'revision': revision, 'rows': len(rows), 'digest': digest.hexdigest()}, f)
+            return path
+
+    @staticmethod
+    def _read_meta(meta_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
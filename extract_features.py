@@ -0,0 +1,117 @@
+# extract_features.py
+"""全データセットの音声から韻律特徴量（エネルギー・F0）を抽出して特徴量ストアに保存する
+
+使い方:
+    python extract_features.py [--store features] [--datasets JVS① JVS②] [--workers 8]
+                               [--pack asset_pack.jvspack] [--force]
+
+音声のダウンロードと特徴量の計算は別プロセスで並列に行い、書き込みはこのプロセスだけで順番に行う。
+同じ音声（Driveのファイルが同じ）をすでに処理していればとばすので、
+中断しても続きから再開でき、データセットを増やしたときも新しい音声だけを処理する。
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from asset_pack import AssetPack, AssetPackError
+from build_asset_pack import fetch_manifest_rows
+from datasets import SHEET_URLS, audio_url_of
+from drive_client import DriveClient, extract_drive_file_id
+from feature_store import FeatureStoreWriter
+from prosody import frame_features, speaking_stats
+
+# ワーカープロセスごとに1つずつ持つ
+_client = None
+_pack = None
+
+
+def _init_worker(pack_path):
+    global _client, _pack
+    _client = DriveClient(pool_size=1)
+    if pack_path:
+        try:
+            _pack = AssetPack(pack_path)
+        except (OSError, AssetPackError):
+            _pack = None
+
+
+def _extract(file_id, filename, audio_url):
+    """ワーカープロセスで音声を取得して特徴量を計算する"""
+    data = None
+    if _pack is not None and file_id:
+        view = _pack.audio(file_id)
+        if view is not None:
+            data = bytes(view)
+    if data is None:
+        data = _client.fetch(audio_url)
+    frames, hop, duration = frame_features(data)
+    return file_id, filename, frames, hop, duration, speaking_stats(frames, hop)
+
+
+def collect_jobs(names, pack=None):
+    """データセットのマニフェストから ファイルID → (ファイル名, 音声のURL) を集める
+
+    ファイル名はデータセットをまたいで重複するので、Driveのファイルごとに1件にする（ファイルIDの分からない音声は除く）
+    """
+    jobs = {}
+    for name in names:
+        rows = pack.manifest(SHEET_URLS[name]) if pack is not None else None
+        if rows is None:
+            rows = fetch_manifest_rows(SHEET_URLS[name])
+        print(f"{name}: {len(rows)}件", file=sys.stderr)
+        for row in rows:
+            filename, audio_url = row.get('filename'), audio_url_of(row)
+            file_id = extract_drive_file_id(audio_url) if audio_url else None
+            if file_id:
+                jobs[file_id] = (filename, audio_url)
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store', default='features', help="特徴量ストアのディレクトリ")
+    parser.add_argument('--datasets', nargs='*', default=list(SHEET_URLS), help="処理するデータセット名")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="並列に処理するプロセス数")
+    parser.add_argument('--pack', default=None, help="音声を読むパックファイル（なければダウンロードする）")
+    parser.add_argument('--force', action='store_true', help="処理済みの音声も計算し直す")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.datasets if name not in SHEET_URLS]
+    if unknown:
+        parser.error(f"未知のデータセットです: {', '.join(unknown)}")
+
+    pack = AssetPack(args.pack) if args.pack else None
+    jobs = collect_jobs(args.datasets, pack)
+    writer = FeatureStoreWriter(args.store)
+    pending = {
+        file_id: job for file_id, job in jobs.items()
+        if args.force or not writer.has(file_id)
+    }
+    print(f"処理済み {len(jobs) - len(pending)}件、これから処理 {len(pending)}件", file=sys.stderr)
+
+    failed = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.pack,)) as executor:
+            futures = {
+                executor.submit(_extract, file_id, filename, audio_url): filename
+                for file_id, (filename, audio_url) in pending.items()
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    file_id, filename, frames, hop, duration, stats = future.result()
+                    writer.add(file_id, frames, hop, duration, filename=filename, **stats)
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f"  失敗: {futures[future]}: {e}", file=sys.stderr)
+                if done % 50 == 0 or done == len(futures):
+                    print(f"  {done}/{len(futures)}", file=sys.stderr)
+    finally:
+        writer.close()
+
+    print(f"{args.store} に保存しました（{len(pending) - len(failed)}件、失敗 {len(failed)}件）", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# feature_store.py
+import json
+import os
+import threading
+
+import numpy as np
+
+# フレームごとに保存する特徴量（prosody.frame_features の列の順）
+FEATURE_COLUMNS = ('rms_db', 'f0')
+
+# ディレクトリの構成:
+#   frames.f32   全音声のフレームを続けて書いた float32 の配列（行 = フレーム、列 = FEATURE_COLUMNS）
+#   index.jsonl  1音声1行（ファイルID・ファイル名・frames.f32 での開始行と行数・音声ごとの統計）
+# 音声を1つ書くたびに frames.f32 → index.jsonl の順に追記するので、途中で止まっても
+# index.jsonl にある音声までは読める（同じファイルIDの行が複数あれば後のものが有効）
+# ファイル名はデータセットをまたいで重複するので、音声はDriveのファイルIDで引く
+FRAMES_FILE = 'frames.f32'
+INDEX_FILE = 'index.jsonl'
+ROW_BYTES = 4 * len(FEATURE_COLUMNS)
+
+
+def _read_entries(path):
+    entries = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # 書きかけの最後の行
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _read_index(path):
+    # ファイルIDのない古い行は引けないので読み飛ばす（extract_features.py で作り直される）
+    return {entry['file_id']: entry for entry in _read_entries(path) if entry.get('file_id')}
+
+
+class FeatureStore:
+    """特徴量ストアをメモリマップで読む（index.jsonl が増えていれば読み直す）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index_size = None
+        self._index = {}
+        self._frames = None
+        self._reload()
+
+    def _reload(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        try:
+            size = os.path.getsize(index_path)
+        except OSError:
+            size = None
+        if size == self._index_size:
+            return
+        index = _read_index(index_path)
+        frames_path = os.path.join(self.path, FRAMES_FILE)
+        rows = os.path.getsize(frames_path) // ROW_BYTES if os.path.exists(frames_path) else 0
+        frames = np.memmap(frames_path, dtype='<f4', mode='r', shape=(rows, len(FEATURE_COLUMNS))) if rows else None
+        self._index, self._frames, self._index_size = index, frames, size
+
+    def get(self, file_id):
+        """Driveのファイルの (音声ごとの情報, フレームの配列) を返す（なければNone）"""
+        with self._lock:
+            self._reload()
+            entry = self._index.get(file_id)
+            if entry is None or self._frames is None or entry['start'] + entry['frames'] > len(self._frames):
+                return None
+            return entry, self._frames[entry['start']:entry['start'] + entry['frames']]
+
+    def __contains__(self, file_id):
+        return self.get(file_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clips': len(self._index),
+                'frames': 0 if self._frames is None else len(self._frames),
+            }
+
+
+class FeatureStoreWriter:
+    """特徴量ストアに音声ごとの特徴量を追記する（書き込むのは1プロセスだけにすること）"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._index_path = os.path.join(path, INDEX_FILE)
+        self._frames_path = os.path.join(path, FRAMES_FILE)
+        self.index = _read_index(self._index_path)
+
+        # index.jsonl に載る前に止まった分は捨てる（ファイルIDのない古い行の分も残す）
+        end = max((entry['start'] + entry['frames'] for entry in _read_entries(self._index_path)), default=0)
+        with open(self._frames_path, 'ab') as f:
+            if f.tell() > end * ROW_BYTES:
+                f.truncate(end * ROW_BYTES)
+        self._rows = end
+        self._frames_file = open(self._frames_path, 'ab')
+        self._index_file = open(self._index_path, 'a', encoding='utf-8')
+
+    def has(self, file_id):
+        """同じ音声（ファイルIDが同じ）を処理済みか"""
+        return file_id in self.index
+
+    def add(self, file_id, frames, hop, duration, filename=None, **stats):
+        frames = np.ascontiguousarray(frames, dtype='<f4')
+        if frames.ndim != 2 or frames.shape[1] != len(FEATURE_COLUMNS):
+            raise ValueError(f"特徴量の列数が違います: {frames.shape}")
+        self._frames_file.write(frames.tobytes())
+        self._frames_file.flush()
+        entry = {
+            'file_id': file_id,
+            'filename': filename,
+            'start': self._rows,
+            'frames': len(frames),
+            'hop': hop,
+            'duration': duration,
+            **stats,
+        }
+        self._index_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._index_file.flush()
+        self._rows += len(frames)
+        self.index[file_id] = entry
+
+    def close(self):
+        self._frames_file.close()
+        self._index_file.close()
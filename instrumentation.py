@@ -0,0 +1,153 @@
+# instrumentation.py
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("jvs.metrics")
+
+# 無効のときに返す何もしないコンテキストマネージャ（毎回作らずに使い回す）
+_NULL_SPAN = nullcontext()
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class _Span:
+    __slots__ = ('_metrics', '_stage', '_tags', '_started')
+
+    def __init__(self, metrics, stage, tags):
+        self._metrics = metrics
+        self._stage = stage
+        self._tags = tags
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics.record(self._stage, time.perf_counter() - self._started, self._tags, error=exc_type is not None)
+        return False
+
+
+class Metrics:
+    """処理段階ごとの所要時間を記録し、直近の分布（パーセンタイル）を出す"""
+
+    def __init__(self, enabled=True, log=False, window=1000, recent=200):
+        self.enabled = enabled
+        self.log = log
+        self.window = window
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._counts = {}
+        self._sums = {}
+        self._errors = {}
+        self._recent = deque(maxlen=recent)
+        self._sources = {}
+        self._server = None
+
+    def span(self, stage, **tags):
+        """with文で囲んだ処理の時間を記録する"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, tags)
+
+    def record(self, stage, seconds, tags=None, error=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            durations = self._durations.get(stage)
+            if durations is None:
+                durations = self._durations[stage] = deque(maxlen=self.window)
+            durations.append(seconds)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+            self._sums[stage] = self._sums.get(stage, 0.0) + seconds
+            if error:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+            self._recent.append((time.time(), stage, seconds, tags or {}))
+        if self.log:
+            logger.info(json.dumps(
+                {'stage': stage, 'seconds': round(seconds, 6), 'error': error, **(tags or {})},
+                ensure_ascii=False, default=str
+            ))
+
+    def register_source(self, name, stats_fn):
+        """キャッシュの件数など、その時点の値を返す関数を登録する"""
+        with self._lock:
+            self._sources[name] = stats_fn
+
+    def sources(self):
+        """登録された関数を呼んで、その時点の値を集める（失敗したものは除く）"""
+        with self._lock:
+            sources = dict(self._sources)
+        result = {}
+        for name, stats_fn in sources.items():
+            try:
+                result[name] = stats_fn()
+            except Exception:
+                continue
+        return result
+
+    def summary(self):
+        """段階ごとの件数・平均・パーセンタイル（秒）"""
+        with self._lock:
+            snapshot = {stage: sorted(values) for stage, values in self._durations.items()}
+            counts, sums, errors = dict(self._counts), dict(self._sums), dict(self._errors)
+        result = {}
+        for stage, values in sorted(snapshot.items()):
+            result[stage] = {
+                'count': counts[stage],
+                'errors': errors.get(stage, 0),
+                'mean': sums[stage] / counts[stage],
+                **{f"p{int(q * 100)}": values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES},
+            }
+        return result
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    def prometheus_text(self):
+        """Prometheusのテキスト形式で出力"""
+        lines = [
+            "# HELP jvs_stage_seconds Time spent in each stage of the annotation app.",
+            "# TYPE jvs_stage_seconds summary",
+        ]
+        for stage, stats in self.summary().items():
+            for q in QUANTILES:
+                lines.append(f'jvs_stage_seconds{{stage="{stage}",quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'jvs_stage_seconds_sum{{stage="{stage}"}} {stats["mean"] * stats["count"]:.6f}')
+            lines.append(f'jvs_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for source, stats in sorted(self.sources().items()):
+            for name, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE jvs_{source}_{name} gauge")
+                    lines.append(f"jvs_{source}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host='127.0.0.1'):
+        """/metrics でPrometheus形式のテキストを返すHTTPサーバーを別スレッドで起動（既定ではこのマシンからだけ）"""
+        if self._server is not None:
+            return self._server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        return self._server
@@ -0,0 +1,244 @@
+# manifest_store.py
+import csv
+import hashlib
+import io
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from datasets import SHEETS_EXPORT_URL, sheet_csv_url
+from tokenizer import tokenize
+
+
+def _plain(value):
+    # 空欄（NaN）はNoneとして持つ
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+# 数値として読む書き方（int()・float() は「1_000」や全角数字も読めてしまうので、半角の数字だけにする）
+_INT = re.compile(r'\s*[+-]?[0-9]+\s*')
+_FLOAT = re.compile(r'\s*[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?\s*')
+
+
+def _parse_column(values):
+    """CSVの1列を変換する（空欄はNone、全部が整数・小数として読めればその型、それ以外は文字列）"""
+    present = set(value for value in values if value != '')
+    for pattern, convert in ((_INT, int), (_FLOAT, float)):
+        if not all(pattern.fullmatch(value) for value in present):
+            continue
+        converted = {value: convert(value) for value in present}
+        return [_plain(converted[value]) if value != '' else None for value in values]
+    return [value if value != '' else None for value in values]
+
+
+class ManifestRow:
+    """マニフェストの1行（列のデータを参照するだけで値はコピーしない）"""
+
+    __slots__ = ('_manifest', '_index')
+
+    def __init__(self, manifest, index):
+        self._manifest = manifest
+        self._index = index
+
+    def get(self, key, default=None):
+        column = self._manifest.columns_by_name.get(key)
+        if column is None:
+            return default
+        value = column[self._index]
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        return self._manifest.columns_by_name[key][self._index]
+
+    def keys(self):
+        return self._manifest.column_names
+
+    def to_dict(self):
+        return {name: self[name] for name in self._manifest.column_names}
+
+
+class Manifest:
+    """データセットのマニフェスト（列ごとのタプルで持つ読み取り専用の表）"""
+
+    def __init__(self, columns, content_hash=None):
+        self.column_names = tuple(columns)
+        self.columns_by_name = {name: tuple(values) for name, values in columns.items()}
+        self.content_hash = content_hash
+        self._length = len(next(iter(self.columns_by_name.values()))) if self.columns_by_name else 0
+        self._tokens = {}
+
+    @classmethod
+    def from_rows(cls, rows, content_hash=None):
+        names = []
+        for row in rows:
+            for name in row:
+                if name not in names:
+                    names.append(name)
+        return cls({name: [_plain(row.get(name)) for row in rows] for name in names}, content_hash)
+
+    @classmethod
+    def from_csv(cls, body, content_hash=None):
+        """SheetsのCSVエクスポートから作る（pandasを使わずcsvモジュールで列ごとに読む）"""
+        reader = csv.reader(io.StringIO(body.decode('utf-8-sig'), newline=''))
+        header = next(reader, [])
+        records = [row for row in reader if any(row)]
+        columns = {}
+        for idx, name in enumerate(header):
+            if name in columns:
+                # 同じ名前の列は2つめ以降に番号をつける（pandasと同じ）
+                suffix = 1
+                while f"{name}.{suffix}" in columns:
+                    suffix += 1
+                name = f"{name}.{suffix}"
+            columns[name] = _parse_column([row[idx] if idx < len(row) else '' for row in records])
+        return cls(columns, content_hash)
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ManifestRow(self, i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return ManifestRow(self, index)
+
+    def __iter__(self):
+        return (ManifestRow(self, i) for i in range(self._length))
+
+    def column(self, name):
+        return self.columns_by_name.get(name, (None,) * self._length)
+
+    def tokens(self, granularity):
+        """全アイテムのテキストを指定の単位で分割した結果（マニフェストごとに1回だけ計算）"""
+        result = self._tokens.get(granularity)
+        if result is None:
+            result = tuple(tokenize(text, granularity) for text in self.column('text'))
+            self._tokens[granularity] = result
+        return result
+
+
+class _Entry:
+    __slots__ = ('manifest', 'etag', 'last_modified', 'checked_at', 'future', 'error')
+
+    def __init__(self):
+        self.manifest = None
+        self.etag = None
+        self.last_modified = None
+        self.checked_at = 0.0
+        self.future = None
+        self.error = None
+
+
+class ManifestStore:
+    """全データセットのマニフェストを並列に読み込んで全セッションで共有する"""
+
+    def __init__(self, sheet_urls, pack=None, ttl=600, workers=5, timeout=30, export_url=SHEETS_EXPORT_URL,
+                 granularities=()):
+        self.sheet_urls = dict(sheet_urls)
+        # 読み込み時にトークン分割まで済ませておく単位
+        self.granularities = tuple(granularities)
+        self.export_url = export_url
+        self.pack = pack
+        self.ttl = ttl
+        self.timeout = timeout
+        # requestsはバックグラウンドの読み込みで初めて使うときにimportする
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manifest")
+        self._lock = threading.Lock()
+        self._entries = {name: _Entry() for name in self.sheet_urls}
+        self.fetches = 0
+        self.not_modified = 0
+        self.parses = 0
+
+    def preload(self):
+        """全データセットの読み込みをバックグラウンドで開始"""
+        for name in self.sheet_urls:
+            self._schedule(name)
+        return self
+
+    def _schedule(self, name):
+        with self._lock:
+            entry = self._entries[name]
+            if entry.future is None or entry.future.done():
+                entry.future = self._executor.submit(self._refresh, name)
+            return entry.future
+
+    def get(self, name):
+        """マニフェストを取得（古ければ裏で更新し、今あるものをすぐ返す）"""
+        entry = self._entries[name]
+        if entry.manifest is None:
+            # 初回は読み込みが終わるまで待つ
+            self._schedule(name).result()
+            if entry.manifest is None:
+                raise RuntimeError(entry.error or "マニフェストを読み込めませんでした")
+        elif time.time() - entry.checked_at > self.ttl:
+            self._schedule(name)
+        return entry.manifest
+
+    def _refresh(self, name):
+        entry = self._entries[name]
+        sheet_url = self.sheet_urls[name]
+        if self.pack is not None and entry.manifest is None:
+            rows = self.pack.manifest(sheet_url)
+            if rows is not None:
+                # パックのマニフェストは固定なので再取得しない
+                entry.manifest = self._tokenized(Manifest.from_rows(rows))
+                entry.checked_at = float('inf')
+                return
+
+        csv_url = sheet_csv_url(sheet_url, self.export_url)
+        if csv_url is None:
+            entry.error = f"正しいGoogle SheetsのURLではありません: {sheet_url}"
+            return
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        try:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+            response = self._session.get(csv_url, headers=headers, timeout=self.timeout)
+            self.fetches += 1
+            if response.status_code == 304 and entry.manifest is not None:
+                self.not_modified += 1
+                entry.checked_at = time.time()
+                return
+            response.raise_for_status()
+            body = response.content
+            content_hash = hashlib.sha256(body).hexdigest()
+            # 内容が変わっていなければパースし直さない
+            if entry.manifest is None or entry.manifest.content_hash != content_hash:
+                entry.manifest = self._tokenized(Manifest.from_csv(body, content_hash))
+                self.parses += 1
+            entry.etag = response.headers.get('ETag')
+            entry.last_modified = response.headers.get('Last-Modified')
+            entry.checked_at = time.time()
+            entry.error = None
+        except Exception as e:
+            entry.error = str(e)
+
+    def _tokenized(self, manifest):
+        for granularity in self.granularities:
+            manifest.tokens(granularity)
+        return manifest
+
+    def stats(self):
+        return {
+            'loaded': sum(1 for entry in self._entries.values() if entry.manifest is not None),
+            'datasets': len(self._entries),
+            'fetches': self.fetches,
+            'not_modified': self.not_modified,
+            'parses': self.parses,
+        }
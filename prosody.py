@@ -0,0 +1,242 @@
+# prosody.py
+import numpy as np
+
+from audio_processing import frame_rms_db, read_wav, resample, trim_silence
+from tokenizer import SMALL_KANA, script_of
+
+# 基本周波数（F0）を探す範囲（Hz）
+F0_MIN = 70.0
+F0_MAX = 400.0
+
+# 自己相関のピークがこれより低いフレームは無声とみなす
+VOICING_THRESHOLD = 0.45
+
+# F0はこのサンプリング周波数に落としてから求める（F0_MAXより十分高ければよい）
+F0_SAMPLE_RATE = 8000
+
+
+def _frames(samples, frame_length, hop_length):
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+    return np.lib.stride_tricks.sliding_window_view(samples, frame_length)[::hop_length]
+
+
+def f0_contour(samples, sample_rate, hop_length, frame_length, levels_db, silence_db=-35.0):
+    """フレームごとのF0（Hz、無声はNaN）を全フレームまとめて自己相関で求める"""
+    frames = _frames(samples, frame_length, hop_length).astype(np.float64)
+    frames = (frames - frames.mean(axis=1, keepdims=True)) * np.hanning(frame_length)
+    n_fft = 1 << int(np.ceil(np.log2(2 * frame_length)))
+    spectrum = np.fft.rfft(frames, n=n_fft, axis=1)
+    autocorr = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=n_fft, axis=1)[:, :frame_length]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        autocorr = autocorr / autocorr[:, :1]
+
+    min_lag = max(2, int(sample_rate / F0_MAX))
+    max_lag = min(frame_length - 2, int(sample_rate / F0_MIN))
+    window = autocorr[:, min_lag:max_lag + 1]
+    best = np.nanargmax(np.nan_to_num(window, nan=-1.0), axis=1)
+    rows = np.arange(len(frames))
+    peak = window[rows, best]
+
+    # ピークの前後3点で放物線補間してラグを細かく求める
+    lag = best + min_lag
+    left = autocorr[rows, np.clip(lag - 1, 0, frame_length - 1)]
+    right = autocorr[rows, np.clip(lag + 1, 0, frame_length - 1)]
+    denominator = left - 2 * peak + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(np.abs(denominator) > 1e-12, 0.5 * (left - right) / denominator, 0.0)
+    f0 = sample_rate / (lag + np.clip(shift, -0.5, 0.5))
+
+    levels = levels_db[:len(frames)]
+    voiced = (peak >= VOICING_THRESHOLD) & (levels >= levels.max() + silence_db)
+    return np.where(voiced, f0, np.nan)
+
+
+def analyze(data, trim=False, trim_db=-40.0):
+    """WAVのbytesから波形の包絡・RMSエネルギー（dB）・F0を計算する
+
+    trim=Trueなら再生する音声と同じように前後の無音を除いてから計算する。
+    """
+    samples, sample_rate = read_wav(data)
+    if trim:
+        samples = trim_silence(samples, sample_rate, trim_db)
+    hop_length = max(1, int(sample_rate * 0.010))
+    rms_length = max(1, int(sample_rate * 0.025))
+    levels = frame_rms_db(samples, rms_length, hop_length)
+
+    # F0は低いサンプリング周波数で求める（FFTの長さが短くなる）
+    f0_rate = min(sample_rate, F0_SAMPLE_RATE)
+    f0_samples = resample(samples, sample_rate, f0_rate)
+    f0_hop = max(1, int(f0_rate * 0.010))
+    # 低い声でも2周期入るよう長めの窓にする
+    f0_length = max(1, int(f0_rate * 2 / F0_MIN))
+    f0_levels = frame_rms_db(f0_samples, f0_length, f0_hop)
+    f0 = f0_contour(f0_samples, f0_rate, f0_hop, f0_length, f0_levels)
+    return {
+        'duration': len(samples) / sample_rate,
+        'samples': samples,
+        'hop': hop_length / sample_rate,
+        'rms_db': levels,
+        'f0_hop': f0_hop / f0_rate,
+        # F0の窓は長いので中心をRMSの窓にそろえる
+        'f0_offset': (f0_length / f0_rate - rms_length / sample_rate) / 2,
+        'f0': f0,
+    }
+
+
+def _envelope(samples, columns):
+    """波形を columns 個の区間に分け、区間ごとの最小値・最大値を返す"""
+    if len(samples) == 0:
+        return np.zeros(columns), np.zeros(columns)
+    starts = np.linspace(0, len(samples), columns, endpoint=False).astype(np.int64)
+    return np.minimum.reduceat(samples, starts), np.maximum.reduceat(samples, starts)
+
+
+def _path(xs, ys):
+    """NaNで途切れる折れ線をSVGのpathに変換"""
+    parts = []
+    pen_down = False
+    for x, y in zip(xs, ys):
+        if np.isnan(y):
+            pen_down = False
+            continue
+        parts.append(f"{'L' if pen_down else 'M'}{x:.1f},{y:.1f}")
+        pen_down = True
+    return ' '.join(parts)
+
+
+def prosody_svg(features, width=800, height=120, columns=400):
+    """波形・エネルギー・F0を重ねた横長のSVG（音声プレーヤーと同じ幅に伸びる）
+
+    SVGは横方向に伸縮するので、文字（F0の範囲）はSVGの外に重ねて置く。
+    """
+    duration = max(features['duration'], 1e-6)
+    mid = height / 2
+
+    low, high = _envelope(features['samples'], columns)
+    peak = max(float(np.max(np.abs(high))), float(np.max(np.abs(low))), 1e-6)
+    xs = np.linspace(0, width, columns)
+    wave = ' '.join(f"{x:.1f},{mid - h / peak * mid * 0.9:.1f}" for x, h in zip(xs, high))
+    wave += ' ' + ' '.join(f"{x:.1f},{mid - l / peak * mid * 0.9:.1f}" for x, l in zip(xs[::-1], low[::-1]))
+
+    # エネルギーは最大から-50dBまでを高さいっぱいに
+    levels = features['rms_db']
+    level_xs = np.arange(len(levels)) * features['hop'] / duration * width
+    level_ys = height - np.clip((levels - levels.max() + 50.0) / 50.0, 0.0, 1.0) * (height - 4) - 2
+    level_ys = np.where(level_xs <= width, level_ys, np.nan)
+
+    # F0は対数軸（声の高さの感じ方に近い）
+    f0 = features['f0']
+    f0_xs = (np.arange(len(f0)) * features['f0_hop'] + features['f0_offset']) / duration * width
+    voiced = f0[~np.isnan(f0)]
+    labels = ''
+    f0_ys = np.full(len(f0), np.nan)
+    if len(voiced):
+        f0_low, f0_high = np.log2(voiced.min() * 0.9), np.log2(voiced.max() * 1.1)
+        span = max(f0_high - f0_low, 0.5)
+        f0_ys = height - (np.log2(f0) - f0_low) / span * (height - 8) - 4
+        f0_ys = np.where(f0_xs <= width, f0_ys, np.nan)
+        labels = (
+            f"<span style='position:absolute; left:4px; top:0'>{voiced.max():.0f} Hz</span>"
+            f"<span style='position:absolute; left:4px; bottom:0'>{voiced.min():.0f} Hz</span>"
+        )
+
+    ticks = ''.join(
+        f"<line x1='{t / duration * width:.1f}' y1='{height - 6}' x2='{t / duration * width:.1f}' y2='{height}' />"
+        for t in np.arange(0.5, duration, 0.5)
+    )
+    return (
+        f"<div style='position:relative; font-size:10px; color:#1f77b4'>"
+        f"<svg viewBox='0 0 {width} {height}' preserveAspectRatio='none' width='100%' height='{height}' "
+        f"xmlns='http://www.w3.org/2000/svg' style='display:block'>"
+        f"<polygon points='{wave}' fill='rgba(49,51,63,0.15)' />"
+        f"<path d='{_path(level_xs, level_ys)}' fill='none' stroke='#ff8c00' stroke-width='1.5' vector-effect='non-scaling-stroke' />"
+        f"<path d='{_path(f0_xs, f0_ys)}' fill='none' stroke='#1f77b4' stroke-width='2' vector-effect='non-scaling-stroke' />"
+        f"<g stroke='rgba(49,51,63,0.4)' vector-effect='non-scaling-stroke'>{ticks}</g>"
+        f"</svg>{labels}</div>"
+    )
+
+
+def frame_features(data):
+    """10msごとのRMSエネルギー（dB）とF0（Hz、無声はNaN）を並べた float32 の配列 (フレーム数, 2) と、
+    フレームの間隔（秒）・音声の長さ（秒）を返す"""
+    features = analyze(data)
+    levels, f0 = features['rms_db'], features['f0']
+    # F0をエネルギーと同じ時刻のフレームに並べ直す
+    times = np.arange(len(levels)) * features['hop']
+    f0_index = np.clip(np.round((times - features['f0_offset']) / features['f0_hop']).astype(np.int64), 0, len(f0) - 1)
+    frames = np.column_stack([levels, f0[f0_index]]).astype(np.float32)
+    return frames, features['hop'], features['duration']
+
+
+def speaking_stats(frames, hop, silence_db=-35.0):
+    """発話の長さの目安（有声区間の割合、エネルギーのピーク＝音節の数のおおよその速さ）"""
+    levels, f0 = frames[:, 0], frames[:, 1]
+    active = levels >= levels.max() + silence_db
+    # 前後5フレーム（±50ms）で最大になるフレームをエネルギーのピークとみなす
+    padded = np.pad(levels, 5, constant_values=-np.inf)
+    window = np.lib.stride_tricks.sliding_window_view(padded, 11)
+    peaks = active & (levels >= window.max(axis=1)) & (levels >= levels.max() - 25.0)
+    active_seconds = active.sum() * hop
+    return {
+        'voiced_ratio': float(np.mean(~np.isnan(f0))) if len(f0) else 0.0,
+        'active_seconds': float(active_seconds),
+        'peaks_per_second': float(peaks.sum() / active_seconds) if active_seconds else 0.0,
+    }
+
+
+def _char_weight(char):
+    # 読みの長さ（拍）のおおよその目安（漢字は2拍、小書きのかなと記号は0）
+    script = script_of(char)
+    if script in ('space', 'symbol') or char in SMALL_KANA:
+        return 0.0
+    return 2.0 if script == 'kanji' else 1.0
+
+
+def suggest_emphasis(text, frames, silence_db=-35.0, threshold=1.0, max_ratio=0.3):
+    """エネルギーとF0が発話全体より高い文字を強調の候補として返す（文字の番号の集合）
+
+    音素の境界は分からないので、発話区間を各文字の拍数の目安で按分して文字に割り当てる。
+    """
+    text = str(text or '')
+    if not text or len(frames) == 0:
+        return set()
+    levels, f0 = frames[:, 0].astype(np.float64), frames[:, 1].astype(np.float64)
+    active = np.flatnonzero(levels >= levels.max() + silence_db)
+    if len(active) == 0:
+        return set()
+    first, last = active[0], active[-1] + 1
+    levels, f0 = levels[first:last], f0[first:last]
+
+    weights = np.array([_char_weight(char) for char in text])
+    if weights.sum() == 0:
+        return set()
+    edges = np.concatenate([[0.0], np.cumsum(weights)]) / weights.sum() * len(levels)
+    starts = np.floor(edges[:-1]).astype(np.int64)
+    ends = np.maximum(np.ceil(edges[1:]).astype(np.int64), starts + 1).clip(max=len(levels))
+    starts = np.minimum(starts, ends - 1)
+
+    # 発話全体に対する標準得点（F0は半音の単位で比べる）
+    energy = (levels - levels.mean()) / (levels.std() or 1.0)
+    voiced = ~np.isnan(f0)
+    semitones = np.zeros_like(f0)
+    if voiced.any():
+        semitones[voiced] = 12 * np.log2(f0[voiced] / np.median(f0[voiced]))
+        semitones[voiced] /= semitones[voiced].std() or 1.0
+
+    # 累積和で文字ごとの区間の平均をまとめて求める
+    def segment_sum(values):
+        cumulative = np.concatenate([[0.0], np.cumsum(values)])
+        return cumulative[ends] - cumulative[starts]
+
+    energy_mean = segment_sum(energy) / (ends - starts)
+    voiced_count = segment_sum(voiced.astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pitch_mean = np.where(voiced_count > 0, segment_sum(semitones) / voiced_count, 0.0)
+    score = np.where(weights > 0, energy_mean + pitch_mean, -np.inf)
+
+    candidates = np.flatnonzero(score >= threshold)
+    limit = max(1, int(np.ceil(max_ratio * np.count_nonzero(weights))))
+    if len(candidates) > limit:
+        candidates = candidates[np.argsort(score[candidates])[::-1][:limit]]
+    return set(int(i) for i in candidates)
@@ -0,0 +1,382 @@
+# results_store.py
+import json
+import os
+import struct
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+from sheets_writer import RESULT_COLUMNS
+
+# 値の種類が少ない列は辞書（値の一覧）への番号で持つ
+DICT_COLUMNS = ('annotator', 'gender', 'age', 'dataset', 'filename', 'speaker', 'text')
+
+# text と強調した文字の位置から作り直せる列（作り直した値が元と違うときだけ元の値を別に持つ）
+DERIVED_COLUMNS = ('emphasized_words', 'emphasized_indices', 'annotated_text', 'has_emphasis')
+
+_COLUMN_INDEX = {column: idx for idx, column in enumerate(RESULT_COLUMNS)}
+_EPOCH = datetime(1970, 1, 1)
+# ISO形式に戻せないタイムスタンプ（元の文字列を別に持つ）
+_RAW_TIMESTAMP = -(1 << 63)
+
+
+def emphasis_fields(text, indices):
+    """強調した文字の位置から emphasized_words・emphasized_indices・annotated_text・has_emphasis を作る"""
+    selected = set(indices)
+    ordered = sorted(selected)
+    return {
+        'emphasized_words': ', '.join(text[i] for i in ordered),
+        'emphasized_indices': ', '.join(map(str, ordered)),
+        'annotated_text': ''.join(f"[{char}]" if idx in selected else char for idx, char in enumerate(text)),
+        'has_emphasis': len(ordered) > 0,
+    }
+
+
+def parse_indices(value):
+    """emphasized_indices の文字列を数字の列に変換（読めなければNone）"""
+    value = str(value).strip() if value is not None else ''
+    if not value:
+        return []
+    try:
+        indices = [int(part) for part in value.split(',')]
+    except ValueError:
+        return None
+    return indices if all(i >= 0 for i in indices) else None
+
+
+def _encode_timestamp(value):
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return _RAW_TIMESTAMP
+        if parsed.tzinfo is None and parsed.isoformat() == value:
+            return (parsed - _EPOCH) // timedelta(microseconds=1)
+    return _RAW_TIMESTAMP
+
+
+def _decode_timestamp(micros):
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class ResultsTable:
+    """アノテーション結果を列ごとに持つ表
+
+    メタデータの列は辞書への番号（uint32）、タイムスタンプはマイクロ秒（int64）、
+    強調はテキストの文字ごとの固定幅ビットマスク（1行 width バイト）で持つ。
+    シートの行（RESULT_COLUMNS の順のリスト）との変換は元の値に戻せる。
+    """
+
+    def __init__(self):
+        self.dictionaries = {column: [] for column in DICT_COLUMNS}
+        self._lookup = {column: {} for column in DICT_COLUMNS}
+        self.codes = {column: array('I') for column in DICT_COLUMNS}
+        self.timestamps = array('q')
+        self.width = 0
+        self.masks = bytearray()
+        # (行番号, 列名) → 作り直した値と違う元の値
+        self.overrides = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _encode(self, column, value):
+        lookup = self._lookup[column]
+        key = (type(value), value)
+        code = lookup.get(key)
+        if code is None:
+            code = lookup[key] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return code
+
+    def _widen(self, width):
+        # 既存の行のビットマスクを新しい幅に詰め直す（幅が増えるのは長いテキストが来たときだけ）
+        if width <= self.width:
+            return
+        masks = bytearray(len(self) * width)
+        for row in range(len(self)):
+            masks[row * width:row * width + self.width] = self.masks[row * self.width:(row + 1) * self.width]
+        self.masks, self.width = masks, width
+
+    def _encode_row(self, row):
+        # (ビットマスク, 辞書列の番号, タイムスタンプ, 別に持つ値) を作る（ビットマスクの幅はここで広げる）
+        row = list(row) + [''] * (len(RESULT_COLUMNS) - len(row))
+        text = row[_COLUMN_INDEX['text']]
+        indices = parse_indices(row[_COLUMN_INDEX['emphasized_indices']])
+        valid = indices is not None and isinstance(text, str) and all(i < len(text) for i in indices)
+        if not valid:
+            indices = []
+        self._widen((max(indices, default=-1) + 8) // 8)
+        mask = bytearray(self.width)
+        for i in indices:
+            mask[i >> 3] |= 1 << (i & 7)
+
+        codes = {column: self._encode(column, row[_COLUMN_INDEX[column]]) for column in DICT_COLUMNS}
+        overrides = {}
+        timestamp = row[_COLUMN_INDEX['timestamp']]
+        micros = _encode_timestamp(timestamp)
+        if micros == _RAW_TIMESTAMP:
+            overrides['timestamp'] = timestamp
+
+        derived = emphasis_fields(text, indices) if valid else {}
+        derived['has_emphasis'] = str(derived.get('has_emphasis', ''))
+        for column in DERIVED_COLUMNS:
+            value = row[_COLUMN_INDEX[column]]
+            if not valid or derived[column] != value:
+                overrides[column] = value
+        return mask, codes, micros, overrides
+
+    def append_row(self, row):
+        """シートの1行を追加して行番号を返す"""
+        index = len(self)
+        mask, codes, micros, overrides = self._encode_row(row)
+        self.masks.extend(mask)
+        # 行数は timestamps の長さで数えるので、ビットマスクの後に追加する
+        for column in DICT_COLUMNS:
+            self.codes[column].append(codes[column])
+        self.timestamps.append(micros)
+        for column, value in overrides.items():
+            self.overrides[(index, column)] = value
+        return index
+
+    def replace_row(self, index, row):
+        """index 行目をシートの1行で置き換える（保存し直したとき）"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        mask, codes, micros, overrides = self._encode_row(row)
+        self.masks[index * self.width:(index + 1) * self.width] = mask
+        for column in DICT_COLUMNS:
+            self.codes[column][index] = codes[column]
+        self.timestamps[index] = micros
+        for column in DERIVED_COLUMNS + ('timestamp',):
+            self.overrides.pop((index, column), None)
+        for column, value in overrides.items():
+            self.overrides[(index, column)] = value
+        return index
+
+    def last_index(self, **values):
+        """指定した辞書列の値がすべて一致する最後の行番号（なければNone）"""
+        wanted = []
+        for column, value in values.items():
+            code = self._lookup[column].get((type(value), value))
+            if code is None:
+                return None
+            wanted.append((self.codes[column], code))
+        for index in range(len(self) - 1, -1, -1):
+            if all(codes[index] == code for codes, code in wanted):
+                return index
+        return None
+
+    def append_annotation(self, annotation):
+        """save_bar で作ったアノテーションの辞書を追加"""
+        row = [annotation[column] for column in RESULT_COLUMNS]
+        row[_COLUMN_INDEX['has_emphasis']] = str(annotation['has_emphasis'])
+        return self.append_row(row)
+
+    def indices(self, index):
+        """強調した文字の位置（ビットマスクから読むので文字列はパースしない）"""
+        start = index * self.width
+        result = []
+        for byte_idx, byte in enumerate(self.masks[start:start + self.width]):
+            while byte:
+                low = byte & -byte
+                result.append(byte_idx * 8 + low.bit_length() - 1)
+                byte ^= low
+        return result
+
+    def value(self, index, column):
+        if column in DICT_COLUMNS:
+            return self.dictionaries[column][self.codes[column][index]]
+        return self.row(index)[_COLUMN_INDEX[column]]
+
+    def row(self, index):
+        """シートの1行（RESULT_COLUMNS の順のリスト）に戻す"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        row = [None] * len(RESULT_COLUMNS)
+        for column in DICT_COLUMNS:
+            row[_COLUMN_INDEX[column]] = self.dictionaries[column][self.codes[column][index]]
+        text = row[_COLUMN_INDEX['text']]
+        derived = emphasis_fields(text, self.indices(index)) if isinstance(text, str) else {}
+        for column in DERIVED_COLUMNS:
+            override = self.overrides.get((index, column), self)
+            if override is not self:
+                row[_COLUMN_INDEX[column]] = override
+            elif column == 'has_emphasis':
+                row[_COLUMN_INDEX[column]] = str(derived[column])
+            else:
+                row[_COLUMN_INDEX[column]] = derived[column]
+        micros = self.timestamps[index]
+        row[_COLUMN_INDEX['timestamp']] = (
+            self.overrides[(index, 'timestamp')] if micros == _RAW_TIMESTAMP else _decode_timestamp(micros)
+        )
+        return row
+
+    def rows(self):
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def emphasis_count(self):
+        """強調ありの行数（has_emphasis が 'True' の行）"""
+        count = 0
+        for index in range(len(self)):
+            override = self.overrides.get((index, 'has_emphasis'))
+            if override is not None:
+                count += override == 'True'
+            else:
+                start = index * self.width
+                count += any(self.masks[start:start + self.width])
+        return count
+
+    def nbytes(self):
+        """列の配列が使っているバイト数（辞書の値は含まない）"""
+        return (
+            sum(codes.itemsize * len(codes) for codes in self.codes.values())
+            + self.timestamps.itemsize * len(self.timestamps)
+            + len(self.masks)
+        )
+
+
+# ファイルの構成:
+#   MAGIC | チャンク | チャンク | ...
+# チャンク = ヘッダー(行数, ビットマスクの幅, 辞書の長さ, 別に持つ値の長さ) | 追加された辞書の値(JSON)
+#           | 辞書列の番号(uint32 × 行数 × 列数) | タイムスタンプ(int64 × 行数) | ビットマスク(行数 × 幅)
+#           | 別に持つ値(JSON)
+# 追記するたびにチャンクを1つ足すだけなので、書き込みの途中で止まっても前のチャンクまでは読める
+MAGIC = b"JVSRES01"
+CHUNK_HEADER = struct.Struct("<IIII")
+
+
+class ResultsFile:
+    """ResultsTable をチャンク単位で追記するファイル（開くと全チャンクを読み込む）"""
+
+    # 開いたときにチャンクがこれより多ければ1つにまとめ直す
+    COMPACT_CHUNKS = 256
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.table = ResultsTable()
+        self.chunks = 0
+        end = self._load()
+        with open(path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(MAGIC)
+                end = len(MAGIC)
+            elif f.tell() > end:
+                # 書きかけのチャンクを捨てる
+                f.truncate(end)
+        self._persisted_rows = len(self.table)
+        self._persisted_dictionaries = {column: len(values) for column, values in self.table.dictionaries.items()}
+        if self.chunks > self.COMPACT_CHUNKS:
+            self.compact()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"結果ファイルではありません: {self.path}")
+        table = self.table
+        offset = len(MAGIC)
+        while offset + CHUNK_HEADER.size <= len(data):
+            rows, width, dict_length, overrides_length = CHUNK_HEADER.unpack_from(data, offset)
+            body_length = dict_length + rows * (4 * len(DICT_COLUMNS) + 8 + width) + overrides_length
+            position = offset + CHUNK_HEADER.size
+            if position + body_length > len(data):
+                break
+            dictionaries = json.loads(data[position:position + dict_length])
+            position += dict_length
+            for column in DICT_COLUMNS:
+                for value in dictionaries.get(column, []):
+                    table._encode(column, value)
+                table.codes[column].frombytes(data[position:position + rows * 4])
+                position += rows * 4
+            base = len(table)
+            timestamps = data[position:position + rows * 8]
+            position += rows * 8
+            table._widen(width)
+            for row in range(rows):
+                mask = bytearray(table.width)
+                mask[:width] = data[position + row * width:position + (row + 1) * width]
+                table.masks.extend(mask)
+            position += rows * width
+            table.timestamps.frombytes(timestamps)
+            for row, column, value in json.loads(data[position:position + overrides_length]):
+                table.overrides[(base + row, column)] = value
+            offset = position + overrides_length
+            self.chunks += 1
+        return offset
+
+    def _chunk(self, start, dictionary_starts):
+        table = self.table
+        rows = len(table) - start
+        dictionaries = {column: table.dictionaries[column][dictionary_starts[column]:] for column in DICT_COLUMNS}
+        overrides = [[row - start, column, value] for (row, column), value in table.overrides.items() if row >= start]
+        dict_json = json.dumps(dictionaries, ensure_ascii=False).encode('utf-8')
+        overrides_json = json.dumps(overrides, ensure_ascii=False).encode('utf-8')
+        parts = [CHUNK_HEADER.pack(rows, table.width, len(dict_json), len(overrides_json)), dict_json]
+        parts.extend(table.codes[column][start:].tobytes() for column in DICT_COLUMNS)
+        parts.append(table.timestamps[start:].tobytes())
+        parts.append(bytes(table.masks[start * table.width:]))
+        parts.append(overrides_json)
+        return b''.join(parts)
+
+    def flush(self):
+        """前回から増えた行を1つのチャンクとして追記する"""
+        with self._lock:
+            table = self.table
+            rows = len(table) - self._persisted_rows
+            if rows <= 0:
+                return 0
+            chunk = self._chunk(self._persisted_rows, self._persisted_dictionaries)
+            with open(self.path, 'ab') as f:
+                f.write(chunk)
+            self._persisted_rows = len(table)
+            self._persisted_dictionaries = {column: len(values) for column, values in table.dictionaries.items()}
+            self.chunks += 1
+            return rows
+
+    def compact(self):
+        """全行を1つのチャンクにまとめて書き直す"""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(MAGIC)
+                if len(self.table):
+                    f.write(self._chunk(0, {column: 0 for column in DICT_COLUMNS}))
+            os.replace(tmp_path, self.path)
+            self._persisted_rows = len(self.table)
+            self._persisted_dictionaries = {column: len(values) for column, values in self.table.dictionaries.items()}
+            self.chunks = 1 if len(self.table) else 0
+
+    def append_row(self, row):
+        """1行を追加してすぐファイルに書く"""
+        with self._lock:
+            index = self.table.append_row(row)
+        self.flush()
+        return index
+
+    def last_indices(self, **values):
+        """指定した値の行のうち最後に保存した行の強調の位置（なければNone）"""
+        with self._lock:
+            index = self.table.last_index(**values)
+            return None if index is None else self.table.indices(index)
+
+    def stats(self):
+        return {
+            'rows': len(self.table),
+            'chunks': self.chunks,
+            'width': self.table.width,
+            'column_bytes': self.table.nbytes(),
+            'file_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
@@ -0,0 +1,173 @@
+# scheduler.py
+import bisect
+import heapq
+import itertools
+import threading
+import time
+
+
+class CoverageScheduler:
+    """全データセットのアイテムを、ラベル数が target に届くようアノテーターに割り当てる（プロセスに1つ）
+
+    アイテムは「保存済みのラベル数 + 貸し出し中の数」ごとのバケツに入れておき、
+    少ないバケツから順に貸し出す。同じアノテーターに同じアイテムは二度渡さない。
+    貸し出しは lease_seconds を過ぎると取り消され、また他の人に渡せるようになる。
+
+    バケツに入ったアイテムには通し番号を振り、アノテーターごとに「バケツのどこまで見たか」を覚えておく。
+    その位置より前に残っているのは、そのアノテーターがラベルを付けたか借りているアイテムだけなので
+    （ラベルや貸し出しが変われば別のバケツに新しい番号で入り直す）、次の貸し出しでは読み飛ばさない。
+    """
+
+    def __init__(self, target=3, lease_seconds=3600):
+        self.target = target
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        # アイテム → ラベルを付けたアノテーターの集合 / 貸し出し中のアノテーター → 期限
+        self._labels = {}
+        self._leases = {}
+        self._registered = set()
+        self._datasets = set()
+        # バケツ[n] = ラベル数 + 貸し出し数が n のアイテム → 通し番号
+        # 並び[n] = バケツ[n] に入れた (通し番号, アイテム) の番号順（出ていったアイテムも後で掃除するまで残る）
+        self._buckets = [{} for _ in range(target)]
+        self._orders = [[] for _ in range(target)]
+        self._seq = itertools.count()
+        # アノテーター → バケツごとの、次に見る通し番号
+        self._cursors = {}
+        self._expiry = []
+
+    @staticmethod
+    def _annotator(name):
+        return str(name).strip()
+
+    def _effective(self, item):
+        return len(self._labels.get(item, ())) + len(self._leases.get(item, ()))
+
+    def _move(self, item, before):
+        # ロックを取った状態で呼ぶこと（登録済みのアイテムだけバケツに入れる）
+        if item not in self._registered:
+            return
+        after = self._effective(item)
+        if before == after:
+            return
+        if before < self.target:
+            self._remove(before, item)
+        if after < self.target:
+            self._insert(after, item)
+
+    def _insert(self, count, item):
+        # ロックを取った状態で呼ぶこと
+        seq = next(self._seq)
+        self._buckets[count][item] = seq
+        self._orders[count].append((seq, item))
+
+    def _remove(self, count, item):
+        # ロックを取った状態で呼ぶこと（並びは出ていったアイテムが増えたらまとめて作り直す）
+        bucket = self._buckets[count]
+        bucket.pop(item, None)
+        if len(self._orders[count]) > 2 * len(bucket) + 64:
+            # dictは入れた順 = 通し番号の順
+            self._orders[count] = [(seq, item) for item, seq in bucket.items()]
+
+    def add_items(self, dataset, filenames):
+        """割り当ての対象にするアイテムを登録する（登録済みのものは無視）"""
+        with self._lock:
+            self._datasets.add(str(dataset))
+            for filename in filenames:
+                item = (str(dataset), str(filename))
+                if item in self._registered:
+                    continue
+                self._registered.add(item)
+                count = self._effective(item)
+                if count < self.target:
+                    self._insert(count, item)
+
+    def has_dataset(self, dataset):
+        """このデータセットのアイテムを登録済みか"""
+        with self._lock:
+            return str(dataset) in self._datasets
+
+    def record_label(self, annotator, dataset, filename):
+        """保存されたラベルを反映する（そのアノテーターへの貸し出しはラベルに置き換わる）"""
+        annotator, item = self._annotator(annotator), (str(dataset), str(filename))
+        with self._lock:
+            before = self._effective(item)
+            leases = self._leases.get(item)
+            if leases is not None:
+                leases.pop(annotator, None)
+                if not leases:
+                    del self._leases[item]
+            self._labels.setdefault(item, set()).add(annotator)
+            self._move(item, before)
+
+    def _expire(self, now):
+        # ロックを取った状態で呼ぶこと
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, item, annotator = heapq.heappop(self._expiry)
+            leases = self._leases.get(item)
+            # 期限が延びた・ラベルになった貸し出しは無視する
+            if leases is None or leases.get(annotator) != expires:
+                continue
+            before = self._effective(item)
+            del leases[annotator]
+            if not leases:
+                del self._leases[item]
+            self._move(item, before)
+
+    def next_batch(self, annotator, size, now=None):
+        """ラベル数の少ないアイテムから最大 size 件を貸し出す（[(データセット, ファイル名), ...]）"""
+        annotator = self._annotator(annotator)
+        now = time.time() if now is None else now
+        expires = now + self.lease_seconds
+        batch = []
+        with self._lock:
+            self._expire(now)
+            cursors = self._cursors.setdefault(annotator, [0] * self.target)
+            for count, bucket in enumerate(self._buckets):
+                if len(batch) >= size:
+                    break
+                order = self._orders[count]
+                position = bisect.bisect_left(order, (cursors[count],))
+                while position < len(order) and len(batch) < size:
+                    seq, item = order[position]
+                    position += 1
+                    cursors[count] = seq + 1
+                    if bucket.get(item) != seq:
+                        # もうこのバケツにはいない
+                        continue
+                    if annotator in self._labels.get(item, ()) or annotator in self._leases.get(item, ()):
+                        continue
+                    batch.append(item)
+            for item in batch:
+                before = self._effective(item)
+                self._leases.setdefault(item, {})[annotator] = expires
+                heapq.heappush(self._expiry, (expires, item, annotator))
+                self._move(item, before)
+        return batch
+
+    def release(self, annotator, items):
+        """保存せずに終えたアイテムの貸し出しを取り消す"""
+        annotator = self._annotator(annotator)
+        with self._lock:
+            for dataset, filename in items:
+                item = (str(dataset), str(filename))
+                leases = self._leases.get(item)
+                if leases is None or annotator not in leases:
+                    continue
+                before = self._effective(item)
+                del leases[annotator]
+                if not leases:
+                    del self._leases[item]
+                self._move(item, before)
+
+    def stats(self, now=None):
+        with self._lock:
+            self._expire(time.time() if now is None else now)
+            waiting = {f"items_{count}": len(bucket) for count, bucket in enumerate(self._buckets)}
+            return {
+                'target': self.target,
+                'items': len(self._registered),
+                'complete': sum(1 for item in self._registered if len(self._labels.get(item, ())) >= self.target),
+                'leases': sum(len(leases) for leases in self._leases.values()),
+                **waiting,
+            }
@@ -0,0 +1,517 @@
+# sheets_writer.py
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+
+# '全結果'シートの列（この順番でappendする）
+RESULT_COLUMNS = [
+    'annotator',
+    'gender',
+    'age',
+    'dataset',
+    'filename',
+    'speaker',
+    'text',
+    'emphasized_words',
+    'emphasized_indices',
+    'annotated_text',
+    'has_emphasis',
+    'timestamp',
+]
+
+
+# 行を特定する列（アノテーター・データセット・ファイル名）
+KEY_COLUMNS = tuple(RESULT_COLUMNS.index(column) for column in ('annotator', 'dataset', 'filename'))
+
+
+def row_key(row):
+    """行の (アノテーター, データセット, ファイル名)（名前の前後の空白は無視する）"""
+    annotator, dataset, filename = (row[idx] for idx in KEY_COLUMNS)
+    return (str(annotator).strip(), str(dataset), str(filename))
+
+
+def locate_rows(values, rows):
+    """シートの全ての値から、rows の各行と同じキーを持つ最後の行の行番号を探す（なければNone）"""
+    last = {}
+    for row_number, value in enumerate(values, start=1):
+        if len(value) > max(KEY_COLUMNS):
+            last[row_key(value)] = row_number
+    return [last.get(row_key(row)) for row in rows]
+
+
+def annotation_to_row(annotation):
+    """アノテーション結果をシートの1行分のリストに変換"""
+    row = [annotation[column] for column in RESULT_COLUMNS]
+    row[RESULT_COLUMNS.index('has_emphasis')] = str(annotation['has_emphasis'])
+    return row
+
+
+def row_range(row_number, width=len(RESULT_COLUMNS)):
+    """シートの1行分の範囲（例: A12:L12）"""
+    last_column = ''
+    n = width
+    while n:
+        n, remainder = divmod(n - 1, 26)
+        last_column = chr(ord('A') + remainder) + last_column
+    return f"A{row_number}:{last_column}{row_number}"
+
+
+_UPDATED_RANGE = re.compile(r'![A-Z]+(\d+)')
+
+
+def first_appended_row(response):
+    """append_rows の応答（updates.updatedRange）から追記された最初の行番号を取り出す（分からなければNone）"""
+    try:
+        updated_range = response['updates']['updatedRange']
+    except (KeyError, TypeError):
+        return None
+    match = _UPDATED_RANGE.search(updated_range)
+    return int(match.group(1)) if match else None
+
+
+def open_results_worksheet(service_account_info, sheet_url, worksheet_name):
+    """サービスアカウントで結果シートのワークシートを開く"""
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    credentials = Credentials.from_service_account_info(
+        service_account_info,
+        scopes=['https://www.googleapis.com/auth/spreadsheets']
+    )
+    gc = gspread.authorize(credentials)
+    return gc.open_by_url(sheet_url).worksheet(worksheet_name)
+
+
+# ジャーナルの1件（送信待ちの取得に使う）
+JournalEntry = namedtuple('JournalEntry', ['id', 'row', 'attempts', 'created_at', 'op', 'sheet_row', 'revision'])
+
+
+class AnnotationJournal:
+    """送信前のアノテーション行を保存する追記型のローカルジャーナル（SQLite）"""
+
+    PENDING = 'pending'
+    FLUSHED = 'flushed'
+    FAILED = 'failed'
+
+    # 行の追記と、送信済みの行（sheet_row 行目）の書き換え
+    APPEND = 'append'
+    UPDATE = 'update'
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                row TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+        """)
+        # 以前のジャーナルには書き換え用の列がないので足す
+        # sheet_row: 追記した行はシート上の行番号、書き換えは書き換える行番号
+        # revision: 送信前に置き換えた・書き換えた回数（エクスポートなどの作り直しの判定に使う）
+        columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(journal)")}
+        if 'op' not in columns:
+            self._conn.execute(f"ALTER TABLE journal ADD COLUMN op TEXT NOT NULL DEFAULT '{self.APPEND}'")
+        if 'sheet_row' not in columns:
+            self._conn.execute("ALTER TABLE journal ADD COLUMN sheet_row INTEGER")
+        if 'revision' not in columns:
+            self._conn.execute("ALTER TABLE journal ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS journal_status ON journal (status, next_attempt_at)")
+        self._conn.commit()
+
+    def append(self, row):
+        """行を追記してジャーナルIDを返す"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO journal (row, status, created_at) VALUES (?, ?, ?)",
+                (json.dumps(row, ensure_ascii=False), self.PENDING, time.time())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def replace_pending(self, entry_id, row):
+        """まだ送信していない行を置き換える（送信済みなら何もせずFalse）"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE journal SET row = ?, revision = revision + 1 WHERE id = ? AND status != ?",
+                (json.dumps(row, ensure_ascii=False), entry_id, self.FLUSHED)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def append_update(self, sheet_row, row):
+        """シートの sheet_row 行目の書き換えを記録してジャーナルIDを返す（同じ行の未送信の書き換えがあればまとめる）
+
+        sheet_row が None なら、送信するときにシートを読んで同じキーの行を探してから書き換える。
+        """
+        encoded = json.dumps(row, ensure_ascii=False)
+        with self._lock:
+            if sheet_row is not None:
+                found = self._conn.execute(
+                    "SELECT id FROM journal WHERE op = ? AND sheet_row = ? AND status != ? ORDER BY id DESC LIMIT 1",
+                    (self.UPDATE, sheet_row, self.FLUSHED)
+                ).fetchone()
+            else:
+                key = row_key(row)
+                found = next((
+                    (entry_id,) for entry_id, pending in self._conn.execute(
+                        "SELECT id, row FROM journal WHERE op = ? AND sheet_row IS NULL AND status != ? ORDER BY id DESC",
+                        (self.UPDATE, self.FLUSHED)
+                    ).fetchall()
+                    if row_key(json.loads(pending)) == key
+                ), None)
+            if found is not None:
+                self._conn.execute("UPDATE journal SET row = ?, revision = revision + 1 WHERE id = ?", (encoded, found[0]))
+                self._conn.commit()
+                return found[0]
+            cursor = self._conn.execute(
+                "INSERT INTO journal (row, status, created_at, op, sheet_row, revision) VALUES (?, ?, ?, ?, ?, 1)",
+                (encoded, self.PENDING, time.time(), self.UPDATE, sheet_row)
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def sheet_row(self, entry_id):
+        """送信済みの行のシート上の行番号（分からなければNone）"""
+        with self._lock:
+            found = self._conn.execute("SELECT sheet_row FROM journal WHERE id = ?", (entry_id,)).fetchone()
+        return found[0] if found else None
+
+    def revision(self):
+        """これまでに行を置き換えた・書き換えた回数の合計（増えたら送信済みの結果の中身が変わっている）"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(revision), 0) FROM journal").fetchone()[0]
+
+    def due(self, limit):
+        """送信すべき行（未送信・再試行時刻を過ぎた失敗分）を古い順に返す"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, row, attempts, created_at, op, sheet_row, revision FROM journal"
+                " WHERE status != ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (self.FLUSHED, time.time(), limit)
+            )
+            return [
+                JournalEntry(entry_id, json.loads(row), attempts, created_at, op, sheet_row, revision)
+                for entry_id, row, attempts, created_at, op, sheet_row, revision in cursor.fetchall()
+            ]
+
+    def mark_flushed(self, entries, row_numbers=None):
+        """送信した行を送信済みにする（row_numbers を指定するとそれぞれのシート上の行番号を記録する）
+
+        送信中に置き換えられた行は、送ったのが古い内容なので、送った位置の書き換えとして送信待ちに戻す。
+        位置が分からなければ、書き換えを送るときにシートから探す（追記し直すと行が重複するので追記には戻さない）。
+        """
+        if row_numbers is None:
+            row_numbers = [None] * len(entries)
+        params = [(row_number, entry.id, entry.revision) for row_number, entry in zip(row_numbers, entries)]
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE journal SET status = ?1, last_error = NULL, sheet_row = COALESCE(?2, sheet_row)"
+                " WHERE id = ?3 AND revision = ?4",
+                [(self.FLUSHED, *param) for param in params]
+            )
+            self._conn.executemany(
+                "UPDATE journal SET status = ?1, next_attempt_at = 0, op = ?2,"
+                " sheet_row = COALESCE(?3, sheet_row) WHERE id = ?4 AND revision != ?5",
+                [(self.PENDING, self.UPDATE, *param) for param in params]
+            )
+            self._conn.commit()
+
+    def mark_failed(self, entry_ids, error, retry_at):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE journal SET status = ?, attempts = attempts + 1, last_error = ?, next_attempt_at = ?"
+                " WHERE id = ?",
+                [(self.FAILED, error, retry_at, entry_id) for entry_id in entry_ids]
+            )
+            self._conn.commit()
+
+    def all_rows(self):
+        """ジャーナルに追記として記録された全ての (ジャーナルID, 行) を古い順に返す"""
+        with self._lock:
+            cursor = self._conn.execute("SELECT id, row FROM journal WHERE op = ? ORDER BY id", (self.APPEND,))
+            return [(entry_id, json.loads(row)) for entry_id, row in cursor.fetchall()]
+
+    def unflushed_rows(self):
+        """まだシートに追記されていない行を古い順に返す"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT row FROM journal WHERE status != ? AND op = ? ORDER BY id", (self.FLUSHED, self.APPEND)
+            )
+            return [json.loads(row) for (row,) in cursor.fetchall()]
+
+    def unflushed_updates(self):
+        """まだシートに送信されていない書き換え（行番号 → 行）"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT sheet_row, row FROM journal WHERE status != ? AND op = ? ORDER BY id", (self.FLUSHED, self.UPDATE)
+            )
+            return {sheet_row: json.loads(row) for sheet_row, row in cursor.fetchall()}
+
+    def unflushed_update_rows(self):
+        """まだシートに送信されていない書き換えの行を古い順に返す（書き換える位置が分からないものも含む）"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT row FROM journal WHERE status != ? AND op = ? ORDER BY id", (self.FLUSHED, self.UPDATE)
+            )
+            return [json.loads(row) for (row,) in cursor.fetchall()]
+
+    def counts(self, entry_ids=None):
+        """状態ごとの件数を返す（entry_idsを指定するとその行だけを数える）"""
+        query = "SELECT status, COUNT(*) FROM journal"
+        params = []
+        if entry_ids is not None:
+            entry_ids = list(entry_ids)
+            if not entry_ids:
+                return {self.PENDING: 0, self.FLUSHED: 0, self.FAILED: 0}
+            query += f" WHERE id IN ({', '.join('?' * len(entry_ids))})"
+            params = entry_ids
+        query += " GROUP BY status"
+        with self._lock:
+            result = dict(self._conn.execute(query, params).fetchall())
+        return {status: result.get(status, 0) for status in (self.PENDING, self.FLUSHED, self.FAILED)}
+
+
+class TokenBucket:
+    """1分あたりの書き込み回数を制限するトークンバケット"""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, per_minute // 6)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得し、待った秒数を返す"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class WriterMetrics:
+    """送信バッチの件数・所要時間などの統計"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+        self.batches = 0
+        self.rows_flushed = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+
+    def record_batch(self, size, latency, throttled):
+        with self._lock:
+            self._batch_sizes.append(size)
+            self._latencies.append(latency)
+            self.batches += 1
+            self.rows_flushed += size
+            self.throttled_seconds += throttled
+
+    def record_error(self, throttled):
+        with self._lock:
+            self.errors += 1
+            self.throttled_seconds += throttled
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            sizes = list(self._batch_sizes)
+            return {
+                'batches': self.batches,
+                'rows_flushed': self.rows_flushed,
+                'errors': self.errors,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'avg_batch_size': round(sum(sizes) / len(sizes), 2) if sizes else 0,
+                'flush_latency_p50': _percentile(latencies, 0.5),
+                'flush_latency_p95': _percentile(latencies, 0.95),
+            }
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))], 4)
+
+
+class SheetsWriter:
+    """全セッションのアノテーション行をまとめてGoogle Sheetsに送信する（プロセスに1つ）"""
+
+    def __init__(self, journal, open_worksheet, batch_size=50, flush_interval=2.0,
+                 writes_per_minute=50, retry_base=5.0, retry_max=300.0):
+        self.journal = journal
+        self._open_worksheet = open_worksheet
+        self._worksheet = None
+        self._worksheet_lock = threading.Lock()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # サービスアカウント1つあたりの書き込みクォータを超えないように送信回数を絞る
+        self.bucket = TokenBucket(writes_per_minute)
+        self.metrics = WriterMetrics()
+        self._queued = 0
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+
+    def start(self):
+        # 再起動前に送信できなかった行もジャーナルに残っているので、起動するだけで再送される
+        self._thread.start()
+        return self
+
+    def enqueue(self, row):
+        """行をジャーナルに書いてすぐに戻る（送信はバックグラウンド）"""
+        entry_id = self.journal.append(row)
+        self._queued += 1
+        if self._queued >= self.batch_size:
+            self._wakeup.set()
+        return entry_id
+
+    def correct(self, row, row_number=None, entry_id=None):
+        """保存済みの行を書き換えてジャーナルIDを返す
+
+        元の行がまだ送信されていなければジャーナル上で置き換えるだけで、送信は1回のまま。
+        送信済みなら、その行番号の書き換えを予約する（送信のたびにまとめて1回の書き込みで送る）。
+        シート上の位置が分からない行は、送信するときにシートから同じキーの行を探して書き換える（追記はしない）。
+        """
+        if entry_id is not None:
+            if self.journal.replace_pending(entry_id, row):
+                return entry_id
+            if row_number is None:
+                row_number = self.journal.sheet_row(entry_id)
+        entry_id = self.journal.append_update(row_number, row)
+        self._queued += 1
+        if self._queued >= self.batch_size:
+            self._wakeup.set()
+        return entry_id
+
+    def worksheet(self):
+        """認証済みのワークシートを取得（開くのは最初の1回だけ）"""
+        with self._worksheet_lock:
+            if self._worksheet is None:
+                self._worksheet = self._open_worksheet()
+            return self._worksheet
+
+    def read_all_values(self):
+        """'全結果'シートの全ての値を1回の読み込みで取得"""
+        return self.worksheet().get_all_values()
+
+    def stats(self):
+        """送信待ちの件数とバッチ送信の統計を返す"""
+        counts = self.journal.counts()
+        stats = self.metrics.snapshot()
+        stats['queue_depth'] = counts[AnnotationJournal.PENDING] + counts[AnnotationJournal.FAILED]
+        stats['failed'] = counts[AnnotationJournal.FAILED]
+        return stats
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                # 満杯のバッチを送った場合はまだ残っている可能性があるので続けて送る
+                while self.flush():
+                    pass
+            except Exception:
+                # ワーカーが止まると以降の行が送信されなくなるので握りつぶして続行
+                pass
+
+    def flush(self, force=False):
+        """件数か経過時間の条件を満たしていれば1バッチ送信し、満杯のバッチだったかを返す"""
+        due = self.journal.due(limit=self.batch_size)
+        if not due:
+            return False
+        oldest = min(entry.created_at for entry in due)
+        if len(due) < self.batch_size and not force and time.time() - oldest < self.flush_interval:
+            return False
+
+        # 追記は append_rows、書き換えは batch_update でそれぞれ1回ずつ送る
+        appends = [entry for entry in due if entry.op != AnnotationJournal.UPDATE]
+        updates = [entry for entry in due if entry.op == AnnotationJournal.UPDATE]
+        if appends and not self._send(appends, self._append):
+            return False
+        if updates and not self._send(updates, self._update):
+            return False
+        self._queued = max(0, self._queued - len(due))
+        return len(due) == self.batch_size
+
+    def _append(self, entries):
+        """行を追記して、それぞれのシート上の行番号を返す"""
+        rows = [entry.row for entry in entries]
+        worksheet = self.worksheet()
+        first_row = first_appended_row(worksheet.append_rows(rows))
+        if first_row is not None:
+            return [first_row + offset for offset in range(len(rows))]
+        # 応答から位置が分からなければシートを読んで探す（追記はもう済んでいるので失敗しても送信済みにする）
+        try:
+            return locate_rows(worksheet.get_all_values(), rows)
+        except Exception:
+            return [None] * len(rows)
+
+    def _update(self, entries):
+        """行番号の分かっている書き換えを1回で送り、それぞれの行番号を返す（見つからない行はNone）"""
+        row_numbers = [entry.sheet_row for entry in entries]
+        if None in row_numbers:
+            located = locate_rows(self.worksheet().get_all_values(), [entry.row for entry in entries])
+            row_numbers = [known if known is not None else found for known, found in zip(row_numbers, located)]
+        data = [
+            {'range': row_range(row_number), 'values': [entry.row]}
+            for entry, row_number in zip(entries, row_numbers) if row_number is not None
+        ]
+        if data:
+            self.worksheet().batch_update(data, value_input_option='RAW')
+        return row_numbers
+
+    def _retry_at(self, entries):
+        attempts = max(entry.attempts for entry in entries)
+        return time.time() + min(self.retry_max, self.retry_base * (2 ** attempts))
+
+    def _send(self, entries, send):
+        """1回の書き込みで送り、成功したかを返す（失敗したら再試行を予約する）"""
+        throttled = self.bucket.acquire()
+        started = time.perf_counter()
+        try:
+            row_numbers = send(entries)
+        except Exception as e:
+            # 認証切れなどに備えて次回はワークシートを開き直す
+            self._worksheet = None
+            self.metrics.record_error(throttled)
+            self.journal.mark_failed([entry.id for entry in entries], str(e), self._retry_at(entries))
+            return False
+        self.metrics.record_batch(len(entries), time.perf_counter() - started, throttled)
+        # 書き換える行がシートに見つからなかったものは送らずに、後でもう一度探す
+        missing = [
+            entry for entry, row_number in zip(entries, row_numbers)
+            if row_number is None and entry.op == AnnotationJournal.UPDATE
+        ]
+        sent = [(entry, row_number) for entry, row_number in zip(entries, row_numbers) if entry not in missing]
+        self.journal.mark_flushed([entry for entry, _ in sent], [row_number for _, row_number in sent])
+        if missing:
+            self.journal.mark_failed(
+                [entry.id for entry in missing], "書き換える行がシートに見つかりません", self._retry_at(missing)
+            )
+        return True
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# アプリのモジュールはリポジトリ直下に並んでいるので、どこから実行してもimportできるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,64 @@
+# tests/test_analytics.py
+import math
+
+from analytics import EmphasisStats, decode_indices
+from sheets_writer import RESULT_COLUMNS
+
+
+def make_row(annotator, dataset, filename, text, indices):
+    row = [''] * len(RESULT_COLUMNS)
+    row[RESULT_COLUMNS.index('annotator')] = annotator
+    row[RESULT_COLUMNS.index('dataset')] = dataset
+    row[RESULT_COLUMNS.index('filename')] = filename
+    row[RESULT_COLUMNS.index('text')] = text
+    row[RESULT_COLUMNS.index('emphasized_indices')] = indices
+    return row
+
+
+def test_decode_indices_ignores_out_of_range():
+    assert decode_indices("0, 3, 9, x", 4).tolist() == [True, False, False, True]
+    assert decode_indices("", 2).tolist() == [False, False]
+
+
+def test_same_filename_in_different_datasets_are_separate_items():
+    stats = EmphasisStats()
+    stats.ingest([
+        make_row('a', 'JVS①', 'f1', 'あいう', '0'),
+        make_row('a', 'JVS②', 'f1', 'かきくけ', '3'),
+    ])
+    assert stats.item_keys() == [('JVS①', 'f1'), ('JVS②', 'f1')]
+    assert stats.item_detail(('JVS②', 'f1'))['text'] == 'かきくけ'
+    assert stats.item_detail(('JVS②', 'f1'))['matrix'].tolist() == [[False, False, False, True]]
+
+
+def test_agreement_for_identical_labels():
+    stats = EmphasisStats()
+    stats.ingest([
+        make_row('a', 'd', 'f', 'あいうえ', '0, 1'),
+        make_row('b', 'd', 'f', 'あいうえ', '0, 1'),
+    ])
+    summary = stats.summary()
+    assert summary['items'] == 1
+    assert math.isclose(summary['fleiss_kappa'], 1.0)
+    assert math.isclose(summary['cohen_kappa'][0, 1], 1.0)
+
+
+def test_ingest_only_new_rows_when_prefix_is_unchanged():
+    stats = EmphasisStats()
+    rows = [make_row('a', 'd', 'f', 'あい', '0')]
+    assert stats.ingest(rows) == 1
+    rows = rows + [make_row('b', 'd', 'f', 'あい', '1')]
+    assert stats.ingest(rows) == 1
+    assert stats.ingest(list(rows)) == 0
+
+
+def test_reingest_when_rows_change_in_place_or_reorder():
+    stats = EmphasisStats()
+    stats.ingest([make_row('a', 'd', 'f', 'あい', '0'), make_row('b', 'd', 'f', 'あい', '0')])
+    # a の行が書き換えられた（同じ行数）
+    rows = [make_row('a', 'd', 'f', 'あい', '1'), make_row('b', 'd', 'f', 'あい', '0')]
+    assert stats.ingest(rows) == 2
+    assert stats.item_detail(('d', 'f'))['matrix'].tolist() == [[False, True], [True, False]]
+    # 送信待ちの行がシートの行の間に入った
+    assert stats.ingest([rows[0], make_row('c', 'd', 'f', 'あい', ''), rows[1]]) == 3
+    assert stats.item_detail(('d', 'f'))['annotators'] == ['a', 'b', 'c']
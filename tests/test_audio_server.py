@@ -0,0 +1,146 @@
+# tests/test_audio_server.py
+import http.client
+
+import pytest
+
+from audio_server import AudioServer, parse_range
+from audio_settings import audio_mime
+
+DATA = bytes(range(256)) * 4
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range('bytes=0-9', 100) == (0, 10)
+    assert parse_range('bytes=90-', 100) == (90, 100)
+    assert parse_range('bytes=-10', 100) == (90, 100)
+    assert parse_range('bytes=-500', 100) == (0, 100)
+    assert parse_range('bytes=50-500', 100) == (50, 100)
+    # 複数範囲は全体を返す
+    assert parse_range('bytes=0-1,5-6', 100) is None
+    for header in ('bytes=100-', 'bytes=-0', 'bytes=-', 'bytes=9-3'):
+        with pytest.raises(ValueError):
+            parse_range(header, 100)
+
+
+@pytest.fixture
+def served():
+    sources = {'src': DATA}
+    loads = []
+
+    def load(source):
+        loads.append(source)
+        return sources.get(source)
+
+    server = AudioServer(load, 'http://127.0.0.1:0/', mime='audio/wav', max_bytes=len(DATA))
+    http_server = server.serve(0)
+    port = http_server.server_address[1]
+
+    def request(method, path, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        conn.request(method, path, headers=headers or {})
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return response, body
+
+    yield server, sources, loads, request
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def test_get_and_not_found(served):
+    server, _, loads, request = served
+    link = server.add('src', DATA)
+    path = link[len(server.base_url):]
+    response, body = request('GET', path)
+    assert response.status == 200
+    assert body == DATA
+    assert response.getheader('ETag') == f'"{server.digest(DATA)}"'
+    assert response.getheader('Access-Control-Allow-Origin') is None
+    assert request('GET', '/audio/unknown')[0].status == 404
+    assert request('GET', '/other')[0].status == 404
+    head, body = request('HEAD', path)
+    assert head.status == 200 and body == b''
+    assert head.getheader('Content-Length') == str(len(DATA))
+    # 登録したときのバイト列を配信するので読み込み直さない
+    assert loads == []
+
+
+def test_ranges_and_conditional_requests(served):
+    server, _, loads, request = served
+    path = server.add('src', DATA)[len(server.base_url):]
+    etag = f'"{server.digest(DATA)}"'
+
+    response, body = request('GET', path, {'Range': 'bytes=10-19'})
+    assert response.status == 206
+    assert body == DATA[10:20]
+    assert response.getheader('Content-Range') == f"bytes 10-19/{len(DATA)}"
+
+    response, body = request('GET', path, {'Range': f"bytes={len(DATA)}-"})
+    assert response.status == 416
+    assert response.getheader('Content-Range') == f"bytes */{len(DATA)}"
+
+    response, body = request('GET', path, {'If-None-Match': etag})
+    assert response.status == 304 and body == b''
+
+    response, body = request('GET', path, {'Range': 'bytes=0-3', 'If-Range': etag})
+    assert response.status == 206 and body == DATA[:4]
+    response, body = request('GET', path, {'Range': 'bytes=0-3', 'If-Range': '"other"'})
+    assert response.status == 200 and body == DATA
+    assert loads == []
+    assert server.stats()['partial'] == 2
+
+
+def test_evicted_audio_is_reloaded_and_checked(served):
+    server, sources, loads, request = served
+    path = server.add('src', DATA)[len(server.base_url):]
+    # 上限を超えて追い出される
+    server.add('other', b'x' * len(DATA))
+    sources['other'] = b'x' * len(DATA)
+    assert request('GET', path)[1] == DATA
+    assert request('GET', path, {'Range': 'bytes=0-0'})[1] == DATA[:1]
+    assert loads == ['src']
+    assert server.stats()['reloads'] == 1
+
+    # 元の音声が差し替わっていたら、古いURLでは返さない
+    other_path = server.link('other')[len(server.base_url):]
+    sources['other'] = b'changed'
+    assert request('GET', other_path)[0].status == 404
+
+
+def test_allow_origin_is_opt_in():
+    server = AudioServer(lambda source: None, 'http://127.0.0.1:0')
+    http_server = server.serve(0, allow_origin='http://localhost:8501')
+    try:
+        path = server.add('src', DATA)[len(server.base_url):]
+        conn = http.client.HTTPConnection('127.0.0.1', http_server.server_address[1], timeout=5)
+        conn.request('HEAD', path)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        assert response.getheader('Access-Control-Allow-Origin') == 'http://localhost:8501'
+        assert http_server.server_address[0] == '127.0.0.1'
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+
+def test_content_type_follows_the_audio():
+    server = AudioServer(lambda source: None, 'http://127.0.0.1:0', mime='audio/ogg', detect_mime=audio_mime)
+    http_server = server.serve(0)
+    try:
+        types = []
+        for source, data in (('wav', b'RIFF' + DATA), ('ogg', b'OggS' + DATA)):
+            path = server.add(source, data)[len(server.base_url):]
+            conn = http.client.HTTPConnection('127.0.0.1', http_server.server_address[1], timeout=5)
+            conn.request('HEAD', path)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            types.append(response.getheader('Content-Type'))
+        # 加工できずに元のWAVのまま配信する音声はWAVとして返す
+        assert types == ['audio/wav', 'audio/ogg']
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
@@ -0,0 +1,22 @@
+# tests/test_audio_settings.py
+import pytest
+
+from audio_settings import audio_mime, make_settings
+
+
+def test_audio_mime_follows_the_bytes():
+    assert audio_mime(b'RIFF\x00\x00\x00\x00WAVE') == 'audio/wav'
+    assert audio_mime(b'fLaC\x00') == 'audio/flac'
+    assert audio_mime(memoryview(b'OggS\x00')) == 'audio/ogg'
+    # 加工に失敗して元のWAVを送るときは、設定の形式ではなくWAV
+    assert audio_mime(b'RIFF....', default='audio/ogg') == 'audio/wav'
+    assert audio_mime(b'', default='audio/ogg') == 'audio/ogg'
+    assert audio_mime(b'ID3', default='audio/mpeg') == 'audio/mpeg'
+
+
+def test_make_settings():
+    settings = make_settings('raw')
+    assert not settings.enabled
+    assert settings.mime == 'audio/wav'
+    with pytest.raises(ValueError):
+        make_settings('mp3')
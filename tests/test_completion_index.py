@@ -0,0 +1,118 @@
+# tests/test_completion_index.py
+import pytest
+
+from completion_index import CompletionIndex, IndexSlot, completion_key
+from sheets_writer import RESULT_COLUMNS
+
+
+def make_row(annotator, filename, indices='', dataset='JVS①'):
+    row = [''] * len(RESULT_COLUMNS)
+    row[RESULT_COLUMNS.index('annotator')] = annotator
+    row[RESULT_COLUMNS.index('dataset')] = dataset
+    row[RESULT_COLUMNS.index('filename')] = filename
+    row[RESULT_COLUMNS.index('emphasized_indices')] = indices
+    return row
+
+
+def test_sheet_rows_give_positions_and_selections():
+    index = CompletionIndex()
+    index.load_sheet_rows([
+        list(RESULT_COLUMNS),
+        make_row('a', 'f1', '0, 3'),
+        make_row(' a ', 'f2'),
+        make_row('b', 'f1', '2'),
+        make_row('a', 'f1', '1'),
+    ])
+    assert index.is_done('a', 'JVS①', 'f1')
+    assert index.location('a', 'JVS①', 'f1') == (5, None)
+    assert index.saved_indices('a', 'JVS①', 'f1') == (1,)
+    # 強調なしで保存した行は「空の選択」として分かっている
+    assert index.saved_indices('a', 'JVS①', 'f2') == ()
+    assert index.saved_indices('a', 'JVS①', 'f3') is None
+    assert index.count('a', 'JVS①') == 2
+    assert index.first_unannotated('a', 'JVS①', ['f1', 'f2', 'f3']) == 2
+
+
+def test_unreadable_selection_is_unknown_not_empty():
+    index = CompletionIndex()
+    index.load_sheet_rows([make_row('a', 'f1', 'x, y'), make_row('a', 'f2')[:RESULT_COLUMNS.index('filename') + 1]])
+    assert index.is_done('a', 'JVS①', 'f1')
+    assert index.saved_indices('a', 'JVS①', 'f1') is None
+    assert index.is_done('a', 'JVS①', 'f2')
+    assert index.saved_indices('a', 'JVS①', 'f2') is None
+
+
+def test_journal_rows_and_pending_updates():
+    index = CompletionIndex()
+    index.load_sheet_rows([make_row('a', 'f1', '4')])
+    # 送信済みの追記の行は古いことがあるので、シートの選択を使う
+    index.load_journal_rows([(7, make_row('a', 'f1', '0')), (8, make_row('a', 'f2', '5, 6'))])
+    assert index.location('a', 'JVS①', 'f1') == (1, 7)
+    assert index.saved_indices('a', 'JVS①', 'f1') == (4,)
+    assert index.location('a', 'JVS①', 'f2') == (None, 8)
+    assert index.saved_indices('a', 'JVS①', 'f2') == (5, 6)
+    index.load_journal_updates([make_row('a', 'f1', '9'), make_row('a', 'f1', '8'), make_row('a', 'other', '1')])
+    assert index.saved_indices('a', 'JVS①', 'f1') == (8,)
+    assert not index.is_done('a', 'JVS①', 'other')
+
+
+def test_add_records_the_saved_selection():
+    index = CompletionIndex()
+    index.add('a', 'JVS①', 'f1', entry_id=3, indices={5, 1})
+    assert index.saved_indices('a ', 'JVS①', 'f1') == (1, 5)
+    assert index.location('a', 'JVS①', 'f1') == (None, 3)
+    index.add('a', 'JVS①', 'f1', indices=[])
+    assert index.saved_indices('a', 'JVS①', 'f1') == ()
+    assert index.count('a', 'JVS①') == 1
+    assert index.keys() == [completion_key('a', 'JVS①', 'f1')]
+
+
+class FakeJournal:
+    def __init__(self, rows=(), updates=()):
+        self.rows = list(rows)
+        self.updates = list(updates)
+
+    def all_rows(self):
+        return self.rows
+
+    def unflushed_update_rows(self):
+        return self.updates
+
+
+class FakeWriter:
+    def __init__(self, values, failures=0):
+        self.values = values
+        self.failures = failures
+        self.reads = 0
+        self.journal = FakeJournal([(1, make_row('a', 'f2', '3'))], [make_row('a', 'f1', '7')])
+
+    def read_all_values(self):
+        self.reads += 1
+        if self.reads <= self.failures:
+            raise ConnectionError('429')
+        return self.values
+
+
+def test_from_writer_reads_sheet_and_journal():
+    index = CompletionIndex.from_writer(FakeWriter([list(RESULT_COLUMNS), make_row('a', 'f1', '0')]))
+    assert index.location('a', 'JVS①', 'f1') == (2, None)
+    assert index.saved_indices('a', 'JVS①', 'f1') == (7,)
+    assert index.location('a', 'JVS①', 'f2') == (None, 1)
+
+
+def test_failed_sheet_read_is_not_kept_and_is_retried():
+    writer = FakeWriter([list(RESULT_COLUMNS), make_row('a', 'f1', '0')], failures=2)
+    slot = IndexSlot(lambda: CompletionIndex.from_writer(writer), retry_seconds=10)
+    with pytest.raises(ConnectionError):
+        slot.get(now=0)
+    # 待っている間はシートを読みに行かない
+    with pytest.raises(ConnectionError):
+        slot.get(now=5)
+    assert writer.reads == 1
+    with pytest.raises(ConnectionError):
+        slot.get(now=10)
+    index = slot.get(now=20)
+    assert writer.reads == 3
+    assert index.is_done('a', 'JVS①', 'f1')
+    assert slot.get(now=21) is index
+    assert writer.reads == 3
@@ -0,0 +1,65 @@
+# tests/test_export.py
+import csv
+import os
+
+from export import ExportCache
+from sheets_writer import RESULT_COLUMNS
+
+
+def make_rows(*names):
+    return [[name] + [''] * (len(RESULT_COLUMNS) - 1) for name in names]
+
+
+def read_names(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return [row[0] for row in list(csv.reader(f))[1:]]
+
+
+def test_csv_appends_only_new_rows(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    path = cache.export('all', 'csv', make_rows('a', 'b'))
+    written = os.path.getmtime(path)
+    assert cache.export('all', 'csv', make_rows('a', 'b')) == path
+    assert os.path.getmtime(path) == written
+
+    cache.export('all', 'csv', make_rows('a', 'b', 'c'))
+    assert read_names(path) == ['a', 'b', 'c']
+
+
+def test_csv_is_rewritten_when_rows_shift(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    path = cache.export('all', 'csv', make_rows('sheet1', 'pending'))
+    # 送信待ちだった行がシートに入り、間に別の行が入った
+    cache.export('all', 'csv', make_rows('sheet1', 'other', 'pending'))
+    assert read_names(path) == ['sheet1', 'other', 'pending']
+
+
+def test_csv_is_rewritten_when_a_row_changes_in_place(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    path = cache.export('all', 'csv', make_rows('a', 'b'))
+    assert cache.export('all', 'csv', make_rows('a', 'B')) == path
+    assert read_names(path) == ['a', 'B']
+    cache.export('all', 'csv', make_rows('a', 'B', 'c'), revision=1)
+    assert read_names(path) == ['a', 'B', 'c']
+
+
+def test_fewer_rows_rewrites(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    path = cache.export('all', 'csv', make_rows('a', 'b', 'c'))
+    cache.export('all', 'csv', make_rows('a'))
+    assert read_names(path) == ['a']
+
+
+def test_prune_removes_only_old_session_files(tmp_path):
+    cache = ExportCache(str(tmp_path), session_max_age=60)
+    session_path = cache.export('session-abc', 'csv', make_rows('a'))
+    shared_path = cache.export('all', 'csv', make_rows('a'))
+    old = os.path.getmtime(session_path) - 120
+    for path in (session_path, f"{session_path}.meta.json", shared_path):
+        os.utime(path, (old, old))
+
+    assert cache.prune() == 2
+    assert not os.path.exists(session_path)
+    assert os.path.exists(shared_path)
+    # 消えたセッションのファイルは次のエクスポートで作り直される
+    assert read_names(cache.export('session-abc', 'csv', make_rows('a', 'b'))) == ['a', 'b']
@@ -0,0 +1,75 @@
+# tests/test_feature_store.py
+import json
+
+import numpy as np
+
+import extract_features
+from datasets import SHEET_URLS
+from feature_store import INDEX_FILE, FeatureStore, FeatureStoreWriter
+
+
+def frames(value, count=3):
+    return np.full((count, 2), value, dtype=np.float32)
+
+
+def test_same_filename_in_two_datasets_is_kept_apart(tmp_path):
+    writer = FeatureStoreWriter(str(tmp_path))
+    writer.add('id-a', frames(1), hop=0.01, duration=0.03, filename='VOICEACTRESS100_001')
+    writer.add('id-b', frames(2, 4), hop=0.01, duration=0.04, filename='VOICEACTRESS100_001')
+    writer.close()
+    assert writer.has('id-a') and not writer.has('id-c')
+
+    store = FeatureStore(str(tmp_path))
+    entry, values = store.get('id-a')
+    assert entry['filename'] == 'VOICEACTRESS100_001'
+    assert values.tolist() == frames(1).tolist()
+    assert store.get('id-b')[1].shape == (4, 2)
+    assert store.get('VOICEACTRESS100_001') is None
+    assert len(store) == 2
+
+
+def test_old_rows_without_file_id_are_skipped_and_kept_on_disk(tmp_path):
+    writer = FeatureStoreWriter(str(tmp_path))
+    writer.add('id-a', frames(1), hop=0.01, duration=0.03)
+    writer.close()
+    # ファイル名だけで書いていた頃の行
+    with open(tmp_path / INDEX_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'filename': 'old', 'start': 3, 'frames': 2, 'hop': 0.01, 'duration': 0.02}) + '\n')
+    with open(tmp_path / 'frames.f32', 'ab') as f:
+        f.write(frames(9, 2).tobytes())
+
+    writer = FeatureStoreWriter(str(tmp_path))
+    assert not writer.has('old')
+    writer.add('id-b', frames(2), hop=0.01, duration=0.03)
+    writer.close()
+    store = FeatureStore(str(tmp_path))
+    assert store.get('id-b')[0]['start'] == 5
+    assert store.get('id-b')[1].tolist() == frames(2).tolist()
+
+
+def test_partial_frames_are_dropped(tmp_path):
+    writer = FeatureStoreWriter(str(tmp_path))
+    writer.add('id-a', frames(1), hop=0.01, duration=0.03)
+    writer.close()
+    with open(tmp_path / 'frames.f32', 'ab') as f:
+        f.write(b'\x00' * 8)
+    writer = FeatureStoreWriter(str(tmp_path))
+    writer.add('id-b', frames(2), hop=0.01, duration=0.03)
+    writer.close()
+    assert FeatureStore(str(tmp_path)).get('id-b')[1].tolist() == frames(2).tolist()
+
+
+def test_collect_jobs_keys_by_drive_file_id():
+    first, second = list(SHEET_URLS)[:2]
+
+    class Pack:
+        def manifest(self, url):
+            file_id = 'AAA' if url == SHEET_URLS[first] else 'BBB'
+            return [
+                {'filename': 'VOICEACTRESS100_001', 'audioUrl': f"https://drive.google.com/file/d/{file_id}/view"},
+                {'filename': 'no_audio'},
+            ]
+
+    jobs = extract_features.collect_jobs([first, second], Pack())
+    assert sorted(jobs) == ['AAA', 'BBB']
+    assert jobs['AAA'][0] == jobs['BBB'][0] == 'VOICEACTRESS100_001'
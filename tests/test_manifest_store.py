@@ -0,0 +1,55 @@
+# tests/test_manifest_store.py
+from manifest_store import Manifest
+
+
+def from_csv(text, bom=False):
+    return Manifest.from_csv((('﻿' if bom else '') + text).encode('utf-8'))
+
+
+def test_blank_cells_are_none():
+    manifest = from_csv('filename,text,note\nf1,今日は,\nf2,,メモ\n')
+    assert manifest.column('note') == (None, 'メモ')
+    assert manifest.column('text') == ('今日は', None)
+    row = manifest[1]
+    assert row.get('text', 'N/A') == 'N/A'
+    assert row['text'] is None
+    assert row.to_dict() == {'filename': 'f2', 'text': None, 'note': 'メモ'}
+
+
+def test_numeric_columns():
+    manifest = from_csv('id,score,age,filename,code\n1,0.5,30,001,1_000\n2,1e3,,002,１２\n-3,.25,41,a03,7\n')
+    assert manifest.column('id') == (1, 2, -3)
+    assert manifest.column('score') == (0.5, 1000.0, 0.25)
+    # 空欄があっても整数の列は整数のまま（pandasのように小数にはしない）
+    assert manifest.column('age') == (30, None, 41)
+    assert manifest.column('filename') == ('001', '002', 'a03')
+    # 半角の数字以外は数値にしない
+    assert manifest.column('code') == ('1_000', '１２', '7')
+    assert isinstance(manifest.column('id')[0], int)
+
+
+def test_bom_and_quoted_cells():
+    manifest = from_csv('filename,text\nf1,"今日は、いい天気"\n"f,2","改行\nあり"\n', bom=True)
+    assert manifest.column_names == ('filename', 'text')
+    assert manifest.column('filename') == ('f1', 'f,2')
+    assert manifest.column('text') == ('今日は、いい天気', '改行\nあり')
+
+
+def test_duplicate_headers_are_numbered():
+    manifest = from_csv('text,text,text\na,b,c\n')
+    assert manifest.column_names == ('text', 'text.1', 'text.2')
+    assert manifest[0].to_dict() == {'text': 'a', 'text.1': 'b', 'text.2': 'c'}
+
+
+def test_short_and_blank_rows():
+    manifest = from_csv('filename,speaker,text\nf1,jvs001\n\n,,\nf2,jvs002,こんにちは,extra\n')
+    assert len(manifest) == 2
+    assert manifest.column('text') == (None, 'こんにちは')
+    assert manifest[-1]['speaker'] == 'jvs002'
+
+
+def test_empty_csv_and_missing_column():
+    assert len(Manifest.from_csv(b'')) == 0
+    manifest = from_csv('filename\nf1\n')
+    assert manifest.column('audioUrl') == (None,)
+    assert manifest[0].get('audioUrl') is None
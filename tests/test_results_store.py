@@ -0,0 +1,89 @@
+# tests/test_results_store.py
+import os
+
+import pytest
+
+from results_store import MAGIC, ResultsFile, ResultsTable, emphasis_fields
+from sheets_writer import RESULT_COLUMNS
+
+
+def make_row(filename, text='今日はいい天気', indices=(), annotator='tester', timestamp='2026-01-01T12:00:00.123456'):
+    fields = emphasis_fields(text, indices)
+    row = {
+        'annotator': annotator, 'gender': '女性', 'age': 30, 'dataset': 'JVS①', 'filename': filename,
+        'speaker': 'jvs001', 'text': text, **fields, 'has_emphasis': str(fields['has_emphasis']),
+        'timestamp': timestamp,
+    }
+    return [row[column] for column in RESULT_COLUMNS]
+
+
+def test_rows_round_trip():
+    table = ResultsTable()
+    rows = [make_row('a', indices=[0, 5]), make_row('b'), make_row('c', text='長い' * 20, indices=[39])]
+    for row in rows:
+        table.append_row(row)
+    assert list(table.rows()) == rows
+    assert table.indices(2) == [39]
+    assert table.emphasis_count() == 2
+    # 2行目までのビットマスクも長いテキストの幅に詰め直されている
+    assert table.indices(0) == [0, 5]
+
+
+def test_values_that_cannot_be_rebuilt_are_kept():
+    table = ResultsTable()
+    row = make_row('a', indices=[1])
+    row[RESULT_COLUMNS.index('annotated_text')] = '手で直した'
+    row[RESULT_COLUMNS.index('timestamp')] = '2026/01/01 12:00'
+    odd = make_row('b')
+    odd[RESULT_COLUMNS.index('emphasized_indices')] = 'x, y'
+    table.append_row(row)
+    table.append_row(odd)
+    assert table.row(0) == row
+    assert table.row(-1) == odd
+    assert table.indices(1) == []
+
+
+def test_index_errors():
+    table = ResultsTable()
+    table.append_row(make_row('a'))
+    with pytest.raises(IndexError):
+        table.row(1)
+
+
+def test_file_reopens_and_drops_a_partial_chunk(tmp_path):
+    path = str(tmp_path / 'results.jvsres')
+    results = ResultsFile(path)
+    results.append_row(make_row('a', indices=[0]))
+    results.append_row(make_row('b', text='長い' * 10, indices=[19]))
+    complete = os.path.getsize(path)
+    # 書き込みの途中で止まった
+    with open(path, 'ab') as f:
+        f.write(b'\x05\x00\x00\x00garbage')
+
+    reopened = ResultsFile(path)
+    assert list(reopened.table.rows()) == [make_row('a', indices=[0]), make_row('b', text='長い' * 10, indices=[19])]
+    assert os.path.getsize(path) == complete
+    reopened.append_row(make_row('c'))
+    assert len(ResultsFile(path).table) == 3
+
+
+def test_compact_keeps_rows(tmp_path):
+    path = str(tmp_path / 'results.jvsres')
+    results = ResultsFile(path)
+    rows = [make_row(f"f{i}", indices=[i % 7]) for i in range(5)]
+    for row in rows:
+        results.append_row(row)
+    assert results.chunks == 5
+    results.compact()
+    assert results.chunks == 1
+    reopened = ResultsFile(path)
+    assert list(reopened.table.rows()) == rows
+    with open(path, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC
+
+
+def test_not_a_results_file(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'something else')
+    with pytest.raises(ValueError):
+        ResultsFile(str(path))
@@ -0,0 +1,82 @@
+# tests/test_scheduler.py
+from scheduler import CoverageScheduler
+
+
+def make_scheduler(items=6, target=2, lease_seconds=100):
+    scheduler = CoverageScheduler(target=target, lease_seconds=lease_seconds)
+    scheduler.add_items('ds', (f"f{i}" for i in range(items)))
+    return scheduler
+
+
+def test_least_labeled_items_first():
+    scheduler = make_scheduler(items=4)
+    scheduler.record_label('a', 'ds', 'f0')
+    scheduler.record_label('a', 'ds', 'f1')
+    assert scheduler.next_batch('b', 2, now=0) == [('ds', 'f2'), ('ds', 'f3')]
+    # f2, f3 は b に貸し出し中なので、ラベル1件の f0, f1 と同じ順位
+    assert scheduler.next_batch('c', 3, now=0) == [('ds', 'f0'), ('ds', 'f1'), ('ds', 'f2')]
+
+
+def test_never_the_same_item_twice():
+    scheduler = make_scheduler(items=5, target=3)
+    scheduler.record_label('a', 'ds', 'f0')
+    first = scheduler.next_batch('a', 3, now=0)
+    second = scheduler.next_batch('a', 10, now=0)
+    assert ('ds', 'f0') not in first + second
+    assert len(set(first + second)) == 4
+    assert scheduler.next_batch('a', 10, now=0) == []
+
+
+def test_lease_expires_and_release():
+    scheduler = make_scheduler(items=1, target=1, lease_seconds=10)
+    assert scheduler.next_batch('a', 1, now=0) == [('ds', 'f0')]
+    assert scheduler.next_batch('b', 1, now=5) == []
+    assert scheduler.next_batch('b', 1, now=11) == [('ds', 'f0')]
+    scheduler.release('b', [('ds', 'f0')])
+    # 返したアイテムは本人にもまた渡せる
+    assert scheduler.next_batch('b', 1, now=12) == [('ds', 'f0')]
+
+
+def test_label_replaces_the_lease():
+    scheduler = make_scheduler(items=1, target=2, lease_seconds=10)
+    scheduler.next_batch('a', 1, now=0)
+    scheduler.record_label(' a ', 'ds', 'f0')
+    # 期限が切れてもラベルは残る
+    assert scheduler.stats(now=100)['leases'] == 0
+    assert scheduler.next_batch('a', 1, now=100) == []
+    assert scheduler.next_batch('b', 1, now=100) == [('ds', 'f0')]
+    scheduler.record_label('b', 'ds', 'f0')
+    stats = scheduler.stats(now=100)
+    assert stats['complete'] == 1
+    assert scheduler.next_batch('c', 1, now=100) == []
+
+
+def test_items_come_back_after_moving_between_buckets():
+    scheduler = make_scheduler(items=3, target=2, lease_seconds=10)
+    assert scheduler.next_batch('a', 3, now=0) == [('ds', 'f0'), ('ds', 'f1'), ('ds', 'f2')]
+    scheduler.release('a', [('ds', 'f1')])
+    assert scheduler.next_batch('b', 1, now=1) == [('ds', 'f1')]
+    # f1 は b が借りていてラベル数1のバケツ、f0, f2 は a が借りている
+    assert scheduler.next_batch('a', 3, now=1) == [('ds', 'f1')]
+    assert scheduler.next_batch('c', 3, now=1) == [('ds', 'f0'), ('ds', 'f2')]
+
+
+def test_many_batches_skip_already_seen_items():
+    scheduler = make_scheduler(items=500, target=3)
+    seen = []
+    while True:
+        batch = scheduler.next_batch('a', 20, now=0)
+        if not batch:
+            break
+        seen.extend(batch)
+        for dataset, filename in batch:
+            scheduler.record_label('a', dataset, filename)
+    assert len(seen) == len(set(seen)) == 500
+    # 見終わった位置は覚えているので、並びは出ていったアイテムを掃除した分しか残らない
+    assert len(scheduler._orders[0]) <= 2 * len(scheduler._buckets[0]) + 64
+
+
+def test_registered_datasets():
+    scheduler = make_scheduler(items=0)
+    assert scheduler.has_dataset('ds')
+    assert not scheduler.has_dataset('other')
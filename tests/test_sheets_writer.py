@@ -0,0 +1,235 @@
+# tests/test_sheets_writer.py
+import sqlite3
+
+import pytest
+
+from sheets_writer import (
+    RESULT_COLUMNS,
+    AnnotationJournal,
+    SheetsWriter,
+    first_appended_row,
+    locate_rows,
+    row_range,
+)
+
+
+def make_row(filename, indices='', annotator='tester', dataset='JVS①'):
+    row = [''] * len(RESULT_COLUMNS)
+    row[RESULT_COLUMNS.index('annotator')] = annotator
+    row[RESULT_COLUMNS.index('dataset')] = dataset
+    row[RESULT_COLUMNS.index('filename')] = filename
+    row[RESULT_COLUMNS.index('emphasized_indices')] = indices
+    return row
+
+
+class FakeWorksheet:
+    """gspreadのワークシートの代わり（呼び出しを記録する）"""
+
+    def __init__(self, report_range=True):
+        self.values = [list(RESULT_COLUMNS)]
+        self.calls = []
+        self.report_range = report_range
+
+    def append_rows(self, rows):
+        self.calls.append('append_rows')
+        start = len(self.values) + 1
+        self.values.extend(list(row) for row in rows)
+        if not self.report_range:
+            return {}
+        return {'updates': {'updatedRange': f"'全結果'!A{start}:L{len(self.values)}"}}
+
+    def batch_update(self, data, value_input_option=None):
+        self.calls.append('batch_update')
+        for update in data:
+            row_number = int(update['range'].split(':')[0][1:])
+            self.values[row_number - 1] = list(update['values'][0])
+
+    def get_all_values(self):
+        self.calls.append('get_all_values')
+        return [list(row) for row in self.values]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return AnnotationJournal(str(tmp_path / 'journal.sqlite3'))
+
+
+def make_writer(journal, worksheet):
+    return SheetsWriter(journal, lambda: worksheet, batch_size=10, writes_per_minute=600)
+
+
+def test_row_range():
+    assert row_range(12) == 'A12:L12'
+    assert row_range(3, width=27) == 'A3:AA3'
+
+
+def test_first_appended_row():
+    assert first_appended_row({'updates': {'updatedRange': "'全結果'!A101:L103"}}) == 101
+    assert first_appended_row({'updates': {'updatedRange': "Sheet1!B7"}}) == 7
+    assert first_appended_row({}) is None
+    assert first_appended_row(None) is None
+
+
+def test_locate_rows_uses_last_matching_row():
+    values = [list(RESULT_COLUMNS), make_row('a'), make_row('b'), make_row('a', '1')]
+    assert locate_rows(values, [make_row('a'), make_row('b'), make_row('c')]) == [4, 3, None]
+    # アノテーター名の前後の空白は無視する
+    assert locate_rows(values, [make_row('b', annotator=' tester ')]) == [3]
+
+
+def test_append_records_row_numbers(journal):
+    worksheet = FakeWorksheet()
+    writer = make_writer(journal, worksheet)
+    first = writer.enqueue(make_row('a'))
+    second = writer.enqueue(make_row('b'))
+    writer.flush(force=True)
+    assert journal.sheet_row(first) == 2
+    assert journal.sheet_row(second) == 3
+    assert journal.counts()[AnnotationJournal.FLUSHED] == 2
+
+
+def test_correct_unflushed_row_replaces_it(journal):
+    worksheet = FakeWorksheet()
+    writer = make_writer(journal, worksheet)
+    entry_id = writer.enqueue(make_row('a', '0'))
+    assert writer.correct(make_row('a', '2'), entry_id=entry_id) == entry_id
+    writer.flush(force=True)
+    assert worksheet.calls == ['append_rows']
+    assert [row[8] for row in worksheet.values[1:]] == ['2']
+    assert journal.revision() == 1
+
+
+def test_correct_flushed_row_updates_in_place(journal):
+    worksheet = FakeWorksheet()
+    writer = make_writer(journal, worksheet)
+    first = writer.enqueue(make_row('a', '0'))
+    second = writer.enqueue(make_row('b', '0'))
+    writer.flush(force=True)
+
+    # 同じ行の修正はまとめられ、2行分でも書き込みは1回
+    update_id = writer.correct(make_row('a', '1'), entry_id=first)
+    assert writer.correct(make_row('a', '3'), entry_id=first) == update_id
+    writer.correct(make_row('b', '4'), row_number=3, entry_id=second)
+    assert journal.unflushed_updates() == {2: make_row('a', '3'), 3: make_row('b', '4')}
+    writer.flush(force=True)
+
+    assert worksheet.calls == ['append_rows', 'batch_update']
+    assert [row[8] for row in worksheet.values[1:]] == ['3', '4']
+    assert journal.unflushed_rows() == []
+
+
+def test_correct_unlocated_row_looks_it_up_instead_of_appending(journal):
+    worksheet = FakeWorksheet(report_range=False)
+    writer = make_writer(journal, worksheet)
+    worksheet.values.append(make_row('old', '0'))
+    writer.correct(make_row('old', '5'))
+    # 位置の分からない書き換えも、送信前の行として読める
+    assert journal.unflushed_update_rows() == [make_row('old', '5')]
+    writer.flush(force=True)
+    assert journal.unflushed_update_rows() == []
+    assert len(worksheet.values) == 2
+    assert worksheet.values[1][8] == '5'
+
+
+def test_revision_changed_mid_flush_is_requeued_as_update(journal):
+    worksheet = FakeWorksheet()
+    writer = make_writer(journal, worksheet)
+    entry_id = writer.enqueue(make_row('a', '0'))
+
+    # 送信中（due を読んだ後）に置き換えられた
+    due = journal.due(10)
+    journal.replace_pending(entry_id, make_row('a', '7'))
+    journal.mark_flushed(due, writer._append(due))
+
+    requeued = journal.due(10)
+    assert [(entry.id, entry.op, entry.sheet_row) for entry in requeued] == [(entry_id, AnnotationJournal.UPDATE, 2)]
+    writer.flush(force=True)
+    assert len(worksheet.values) == 2
+    assert worksheet.values[1][8] == '7'
+
+
+def test_revision_changed_mid_flush_without_position_never_appends_twice(journal):
+    worksheet = FakeWorksheet(report_range=False)
+    writer = make_writer(journal, worksheet)
+    entry_id = writer.enqueue(make_row('a', '0'))
+
+    # 追記はできたが、位置が分からないまま送信中に置き換えられた
+    due = journal.due(10)
+    worksheet.append_rows([entry.row for entry in due])
+    journal.replace_pending(entry_id, make_row('a', '7'))
+    journal.mark_flushed(due, None)
+
+    assert [entry.op for entry in journal.due(10)] == [AnnotationJournal.UPDATE]
+    writer.flush(force=True)
+    assert worksheet.calls == ['append_rows', 'get_all_values', 'batch_update']
+    assert len(worksheet.values) == 2
+    assert worksheet.values[1][8] == '7'
+
+
+def test_update_of_missing_row_waits_for_retry(journal):
+    worksheet = FakeWorksheet()
+    writer = make_writer(journal, worksheet)
+    writer.correct(make_row('nowhere', '1'))
+    writer.flush(force=True)
+    assert 'batch_update' not in worksheet.calls
+    assert len(worksheet.values) == 1
+    assert journal.counts()[AnnotationJournal.FAILED] == 1
+
+
+def test_failed_append_is_retried(journal):
+    class Failing(FakeWorksheet):
+        def append_rows(self, rows):
+            raise RuntimeError("quota")
+
+    writer = make_writer(journal, Failing())
+    writer.enqueue(make_row('a'))
+    writer.flush(force=True)
+    assert journal.counts()[AnnotationJournal.FAILED] == 1
+    # 再試行の時刻まではdueに出てこない
+    assert journal.due(10) == []
+
+
+def test_old_journal_gets_new_columns(tmp_path):
+    path = str(tmp_path / 'old.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE journal (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, status TEXT NOT NULL,"
+        " attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, next_attempt_at REAL NOT NULL DEFAULT 0,"
+        " created_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO journal (row, status, created_at) VALUES ('[\"x\"]', 'pending', 0)")
+    conn.commit()
+    conn.close()
+
+    entry, = AnnotationJournal(path).due(10)
+    assert (entry.row, entry.op, entry.sheet_row, entry.revision) == (['x'], AnnotationJournal.APPEND, None, 0)
+
+
+def test_flush_waits_for_a_full_batch_or_the_interval(journal):
+    worksheet = FakeWorksheet()
+    writer = SheetsWriter(journal, lambda: worksheet, batch_size=3, flush_interval=60, writes_per_minute=600)
+    writer.enqueue(make_row('a'))
+    writer.enqueue(make_row('b'))
+    # 件数も経過時間も足りない
+    assert writer.flush() is False
+    assert worksheet.calls == []
+
+    writer.enqueue(make_row('c'))
+    writer.enqueue(make_row('d'))
+    # 満杯のバッチを1回で送り、まだ残っているのでTrue
+    assert writer.flush() is True
+    assert worksheet.calls == ['append_rows']
+    assert len(worksheet.values) == 4
+    assert writer.flush(force=True) is False
+    assert len(worksheet.values) == 5
+    assert writer.stats()['queue_depth'] == 0
+
+
+def test_token_bucket_limits_burst():
+    from sheets_writer import TokenBucket
+
+    bucket = TokenBucket(per_minute=6000, burst=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    # バーストを使い切ったら待つ（100回/秒なので約10ms）
+    assert 0 < bucket.acquire() < 0.5
@@ -0,0 +1,55 @@
+# tests/test_tokenizer.py
+import pytest
+
+from tokenizer import GRANULARITIES, tokenize
+
+TEXT = '今日はいい天気ですね。キャー！'
+
+
+@pytest.mark.parametrize('granularity', GRANULARITIES)
+def test_offsets_cover_the_text(granularity):
+    tokenization = tokenize(TEXT, granularity)
+    position = 0
+    for token, (start, end) in zip(tokenization.tokens, tokenization.offsets):
+        assert start == position and end > start
+        assert TEXT[start:end] == token
+        position = end
+    assert position == len(TEXT)
+
+
+def test_script_and_mora_tokens():
+    assert tokenize('今日はいい天気', 'script').tokens == ('今日', 'はいい', '天気')
+    assert tokenize('キャーです', 'script').tokens == ('キャー', 'です')
+    assert tokenize('キャー', 'mora').tokens == ('キャ', 'ー')
+    assert tokenize('', 'script').tokens == ()
+    with pytest.raises(ValueError):
+        tokenize(TEXT, 'word')
+
+
+@pytest.mark.parametrize('granularity', GRANULARITIES)
+def test_aligned_selection_round_trips(granularity):
+    tokenization = tokenize(TEXT, granularity)
+    tokens = {0, 2}
+    chars = tokenization.to_chars(tokens)
+    assert tokenization.is_aligned(chars)
+    assert tokenization.from_chars(chars) == tokens
+    assert tokenization.merge_chars(chars, tokenization.from_chars(chars)) == chars
+
+
+def test_char_selection_is_kept_in_untouched_tokens():
+    tokenization = tokenize('今日はいい天気', 'script')
+    # 1文字ずつの単位で「天」だけを保存した
+    saved = {5}
+    assert not tokenization.is_aligned(saved)
+    assert tokenization.from_chars(saved) == {2}
+    # 別のトークンを選んでも「天」は「天気」に広がらない
+    assert tokenization.merge_chars(saved, {0, 2}) == {0, 1, 5}
+    # 外したトークンの文字はなくなる
+    assert tokenization.merge_chars(saved, set()) == set()
+    assert tokenization.merge_chars({0, 1, 5}, {2}) == {5}
+
+
+def test_out_of_range_tokens_are_ignored():
+    tokenization = tokenize('あい', 'char')
+    assert tokenization.to_chars({5}) == set()
+    assert tokenization.merge_chars({1}, {1, 9}) == {1}
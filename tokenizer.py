@@ -0,0 +1,123 @@
+# tokenizer.py
+from collections import namedtuple
+
+# 選択の単位（char: 1文字ずつ、script: 漢字・ひらがな・カタカナ・記号などの連続、mora: 拍）
+GRANULARITIES = ('char', 'script', 'mora')
+
+GRANULARITY_LABELS = {
+    'char': '1文字',
+    'script': '文字種のまとまり',
+    'mora': '拍（モーラ）',
+}
+
+# 前の文字と合わせて1拍になる小書きのかな
+SMALL_KANA = set('ゃゅょぁぃぅぇぉゎャュョァィゥェォヮㇰㇱㇲㇳㇴㇵㇶㇷㇸㇹㇺㇻㇼㇽㇾㇿ')
+
+
+class Tokenization(namedtuple('Tokenization', ['tokens', 'offsets'])):
+    """トークンの列と、各トークンが元のテキストのどの文字範囲 [start, end) にあたるか"""
+
+    def to_chars(self, token_indices):
+        """トークンの番号の集合を文字の番号の集合に変換"""
+        chars = set()
+        for idx in token_indices:
+            if 0 <= idx < len(self.offsets):
+                start, end = self.offsets[idx]
+                chars.update(range(start, end))
+        return chars
+
+    def from_chars(self, char_indices):
+        """文字の番号の集合から、1文字でも選択されているトークンの番号の集合を返す"""
+        if not char_indices:
+            return set()
+        return {idx for idx, (start, end) in enumerate(self.offsets) if any(i in char_indices for i in range(start, end))}
+
+    def is_aligned(self, char_indices):
+        """文字の選択がトークンの境目とそろっているか（トークンの一部の文字だけ選ばれていなければTrue）"""
+        char_indices = set(char_indices)
+        return all(
+            len(char_indices.intersection(range(start, end))) in (0, end - start)
+            for start, end in self.offsets
+        )
+
+    def merge_chars(self, char_indices, token_indices):
+        """トークン単位の新しい選択を元の文字の選択に反映する（選択を変えていないトークンの文字はそのまま残す）"""
+        chars = set(char_indices)
+        before = self.from_chars(chars)
+        for idx in before.symmetric_difference(token_indices):
+            if not 0 <= idx < len(self.offsets):
+                continue
+            span = range(*self.offsets[idx])
+            if idx in before:
+                chars.difference_update(span)
+            else:
+                chars.update(span)
+        return chars
+
+
+def script_of(char):
+    """文字種（kanji・hiragana・katakana・latin・space・symbol）"""
+    code = ord(char)
+    if 0x3041 <= code <= 0x309F:
+        return 'hiragana'
+    if 0x30A1 <= code <= 0x30FA or 0x30FD <= code <= 0x30FF or 0x31F0 <= code <= 0x31FF or 0xFF66 <= code <= 0xFF9F:
+        return 'katakana'
+    if code == 0x30FC:
+        # 長音符は前の文字の文字種に合わせる
+        return 'prolonged'
+    if 0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or 0xF900 <= code <= 0xFAFF or char in '々〆ヶ':
+        return 'kanji'
+    if char.isspace():
+        return 'space'
+    if char.isalnum():
+        return 'latin'
+    return 'symbol'
+
+
+def _spans_to_tokenization(text, spans):
+    return Tokenization(tuple(text[start:end] for start, end in spans), tuple(spans))
+
+
+def tokenize_chars(text):
+    return _spans_to_tokenization(text, [(i, i + 1) for i in range(len(text))])
+
+
+def tokenize_script(text):
+    """同じ文字種が続く部分を1トークンにする（記号は1文字ずつ）"""
+    spans = []
+    previous = None
+    for i, char in enumerate(text):
+        script = script_of(char)
+        if script == 'prolonged':
+            script = previous if previous in ('hiragana', 'katakana') else 'katakana'
+        if spans and script == previous and script != 'symbol':
+            spans[-1] = (spans[-1][0], i + 1)
+        else:
+            spans.append((i, i + 1))
+        previous = script
+    return _spans_to_tokenization(text, spans)
+
+
+def tokenize_mora(text):
+    """かなを拍ごとに分ける（拗音の小書きは前の文字とまとめる。漢字は読みが分からないので1文字ずつ）"""
+    spans = []
+    for i, char in enumerate(text):
+        if char in SMALL_KANA and spans and script_of(text[i - 1]) in ('hiragana', 'katakana'):
+            spans[-1] = (spans[-1][0], i + 1)
+        else:
+            spans.append((i, i + 1))
+    return _spans_to_tokenization(text, spans)
+
+
+_TOKENIZERS = {
+    'char': tokenize_chars,
+    'script': tokenize_script,
+    'mora': tokenize_mora,
+}
+
+
+def tokenize(text, granularity='char'):
+    """テキストを指定の単位でトークンに分ける"""
+    if granularity not in _TOKENIZERS:
+        raise ValueError(f"未対応の選択単位です: {granularity}")
+    return _TOKENIZERS[granularity](str(text or ''))